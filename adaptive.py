@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+自适应推理尺寸控制模块
+根据滚动推理延迟在多档 imgsz 和跳帧步长之间切换，
+带滞回区间和冷却窗口，维持目标帧率或延迟预算
+"""
+
+# 可切换的推理尺寸（均为32的倍数）
+IMGSZ_LEVELS = (256, 320, 416, 480, 640)
+
+
+class AdaptiveController:
+    """
+    推理尺寸/跳帧步长控制器
+
+    延迟超出预算上沿时先降 imgsz，已是最小档再增大跳帧步长；
+    延迟低于预算下沿时先减小步长，再在预估延迟仍满足预算时升 imgsz。
+    每次切换后等待一个完整的统计窗口再做下一次判断，避免来回抖动。
+    """
+
+    def __init__(self, imgsz=320, target_fps=None, max_latency_ms=None, levels=IMGSZ_LEVELS,
+                 max_stride=4, adjust_imgsz=True, margin=0.15, window=10):
+        """
+        Args:
+            imgsz: 初始推理尺寸
+            target_fps: 目标帧率
+            max_latency_ms: 单帧延迟上限（毫秒），与 target_fps 同时给出时取更严格者
+            levels: 可切换的推理尺寸
+            max_stride: 最大跳帧步长
+            adjust_imgsz: 是否允许切换 imgsz（导出模型的输入尺寸固定，只能调整步长）
+            margin: 滞回区间，延迟在预算的 (1-margin, 1+margin) 倍之间时保持不变
+            window: 切换后至少等待的推理次数
+        """
+        budgets = []
+        if target_fps:
+            budgets.append(1.0 / target_fps)
+        if max_latency_ms:
+            budgets.append(max_latency_ms / 1000.0)
+        if not budgets:
+            raise ValueError("需要指定 target_fps 或 max_latency_ms")
+        self.budget = min(budgets)
+
+        self.levels = sorted(set(levels) | {imgsz}) if adjust_imgsz else [imgsz]
+        self.level = self.levels.index(imgsz)
+        self.stride = 1
+        self.max_stride = max_stride
+        self.margin = margin
+        self.window = window
+
+        self._since_change = 0
+        self.last_latency = 0.0
+        self.changes = 0
+
+    @property
+    def imgsz(self):
+        """当前推理尺寸"""
+        return self.levels[self.level]
+
+    def describe(self):
+        """当前工作点描述"""
+        return f"imgsz={self.imgsz} stride={self.stride}"
+
+    def update(self, fps_history):
+        """
+        推理一次后调用，按滚动帧率判断是否切换工作点
+
+        Args:
+            fps_history: 最近若干次推理的帧率（1/推理耗时）
+
+        Returns:
+            工作点发生变化时返回True，调用方应清空 fps_history
+        """
+        self._since_change += 1
+        samples = [fps for fps in fps_history if fps > 0]
+        if self._since_change < self.window or not samples:
+            return False
+
+        latency = sum(1.0 / fps for fps in samples) / len(samples)
+        self.last_latency = latency
+        # 跳帧时每帧分摊的推理耗时
+        effective = latency / self.stride
+        upper = self.budget * (1 + self.margin)
+        lower = self.budget * (1 - self.margin)
+
+        if effective > upper:
+            if self.level > 0:
+                self.level -= 1
+            elif self.stride < self.max_stride:
+                self.stride += 1
+            else:
+                return False
+        elif effective < lower:
+            if self.stride > 1 and latency / (self.stride - 1) < lower:
+                self.stride -= 1
+            elif self.stride == 1 and self.level + 1 < len(self.levels):
+                # 推理耗时近似与输入面积成正比，预估升档后仍满足预算才升档
+                scale = (self.levels[self.level + 1] / self.imgsz) ** 2
+                if latency * scale >= lower:
+                    return False
+                self.level += 1
+            else:
+                return False
+        else:
+            return False
+
+        self._since_change = 0
+        self.changes += 1
+        return True
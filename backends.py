@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+推理后端模块
+支持 PyTorch、ONNX Runtime 和 OpenVINO 三种CPU推理后端，
+导出产物缓存在权重文件旁，按模型哈希和推理尺寸区分
+"""
+
+import hashlib
+import os
+
+# 支持的推理后端
+BACKENDS = ('torch', 'onnx', 'openvino')
+# 导出模型的精度变体：fp32 原始精度，half 半精度，int8 训练后静态量化（需要校准数据集）
+VARIANTS = ('fp32', 'half', 'int8')
+
+
+def file_hash(path, length=12):
+    """
+    计算文件内容的SHA-256哈希
+
+    Args:
+        path: 文件路径
+        length: 返回的十六进制字符数
+
+    Returns:
+        哈希字符串前缀
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()[:length]
+
+
+def model_hash(path, length=12):
+    """
+    计算模型的内容哈希，支持权重文件和导出模型目录（如OpenVINO）
+
+    Args:
+        path: 模型文件或目录路径
+        length: 返回的十六进制字符数
+
+    Returns:
+        哈希字符串前缀
+    """
+    if os.path.isfile(path):
+        return file_hash(path, length)
+    sha = hashlib.sha256()
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            sha.update(name.encode('utf-8'))
+            sha.update(file_hash(os.path.join(root, name), 64).encode('ascii'))
+    return sha.hexdigest()[:length]
+
+
+def supports_variant(backend, variant, device='cpu'):
+    """
+    判断后端是否支持某个精度变体
+
+    OpenVINO 在CPU上支持 fp32/half/int8；torch 和 onnx 的半精度只能在GPU上运行，且不支持int8导出。
+
+    Args:
+        backend: 推理后端
+        variant: 精度变体
+        device: 推理设备
+
+    Returns:
+        是否支持
+    """
+    if variant == 'fp32' or backend == 'openvino':
+        return True
+    return variant == 'half' and str(device).lower() not in ('cpu', '')
+
+
+def exported_model_path(weights_path, backend, imgsz, variant='fp32'):
+    """
+    获取导出模型的缓存路径
+
+    Args:
+        weights_path: .pt权重文件路径
+        backend: 推理后端
+        imgsz: 推理尺寸
+        variant: 精度变体，fp32 时路径与旧版本保持一致
+
+    Returns:
+        导出产物路径（ONNX为文件，OpenVINO为目录）
+    """
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    suffix = '' if variant == 'fp32' else f"_{variant}"
+    prefix = os.path.join(os.path.dirname(os.path.abspath(weights_path)),
+                          f"{stem}_{file_hash(weights_path)}_{imgsz}{suffix}")
+    if backend == 'onnx':
+        return prefix + '.onnx'
+    # ultralytics 按目录名中的 _openvino_model 识别OpenVINO模型
+    return prefix + '_openvino_model'
+
+
+def exported_backend(model_path):
+    """
+    判断模型路径是否为已导出的模型
+
+    Args:
+        model_path: 模型文件或目录路径
+
+    Returns:
+        ONNX文件返回 'onnx'，OpenVINO模型目录返回 'openvino'，其余（.pt权重、模型名称）返回None
+    """
+    path = str(model_path).rstrip('/\\')
+    if path.lower().endswith('.onnx'):
+        return 'onnx'
+    if os.path.isdir(path) and (path.endswith('_openvino_model')
+                                or any(name.endswith('.xml') for name in os.listdir(path))):
+        return 'openvino'
+    return None
+
+
+def exported_imgsz(model_path):
+    """
+    读取导出模型固定的输入尺寸（ultralytics导出时写入的元数据）
+
+    Args:
+        model_path: 导出模型路径
+
+    Returns:
+        输入边长，读取不到元数据时返回None
+    """
+    import ast
+
+    backend = exported_backend(model_path)
+    imgsz = None
+    try:
+        if backend == 'openvino':
+            import yaml
+
+            with open(os.path.join(model_path, 'metadata.yaml'), 'r', encoding='utf-8') as f:
+                imgsz = (yaml.safe_load(f) or {}).get('imgsz')
+        elif backend == 'onnx':
+            import onnxruntime
+
+            session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+            value = session.get_modelmeta().custom_metadata_map.get('imgsz')
+            imgsz = ast.literal_eval(value) if value else None
+    except Exception:
+        # 元数据缺失或格式不符时由调用方沿用命令行尺寸
+        return None
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz) if imgsz else None
+    return int(imgsz) if imgsz else None
+
+
+def resolve_model(model_path, backend='torch', imgsz=320):
+    """
+    按模型路径修正推理后端和推理尺寸
+
+    已导出的模型（量化产物、导出缓存）按实际格式确定后端，输入尺寸固定为导出时的尺寸；
+    调用方据此关闭批量推理（导出模型为静态batch=1）和自适应尺寸切换。
+
+    Args:
+        model_path: 模型路径
+        backend: 命令行指定的后端
+        imgsz: 命令行指定的推理尺寸
+
+    Returns:
+        (后端, 推理尺寸)
+    """
+    detected = exported_backend(model_path)
+    if detected is None:
+        return backend, imgsz
+    if backend != detected:
+        print(f"注意: {model_path} 是已导出的 {detected} 模型，使用 {detected} 后端")
+    fixed = exported_imgsz(model_path)
+    if fixed is not None and fixed != imgsz:
+        print(f"注意: 导出模型的输入尺寸固定为 {fixed}，忽略推理尺寸 {imgsz}")
+        imgsz = fixed
+    return detected, imgsz
+
+
+def load_model(model_path, backend='torch', imgsz=320, variant='fp32', data=None):
+    """
+    按指定后端加载模型
+
+    非torch后端首次使用时从.pt导出一次，之后直接复用缓存的导出产物。
+    已导出的模型（.onnx文件、OpenVINO目录）直接加载，不再导出；应先用 resolve_model 修正后端和尺寸。
+    所有后端都通过ultralytics的YOLO接口加载，返回的Results结构一致，
+    可直接交给 utils.Detections.from_boxes 转换为相同的检测数组。
+
+    Args:
+        model_path: .pt权重路径或预训练模型名称
+        backend: 推理后端，torch/onnx/openvino
+        imgsz: 推理尺寸（导出模型的输入尺寸固定为该值）
+        variant: 导出精度变体，fp32/half/int8；torch后端的半精度在推理时通过 half=True 指定
+        data: int8 量化使用的校准数据集yaml
+
+    Returns:
+        YOLO模型实例
+    """
+    from ultralytics import YOLO
+
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}，可选: {', '.join(BACKENDS)}")
+    if variant not in VARIANTS:
+        raise ValueError(f"不支持的精度变体: {variant}，可选: {', '.join(VARIANTS)}")
+    if variant == 'int8' and not data:
+        raise ValueError("int8 量化需要提供校准数据集")
+
+    if exported_backend(model_path) is not None:
+        print(f"使用已导出的模型: {model_path}")
+        return YOLO(model_path, task='detect')
+
+    model = YOLO(model_path)
+    if backend == 'torch':
+        return model
+
+    # 预训练模型名称会被下载到本地，以实际权重路径为准
+    weights_path = getattr(model, 'ckpt_path', None) or model_path
+    target = exported_model_path(weights_path, backend, imgsz, variant)
+
+    if not os.path.exists(target):
+        print(f"首次使用 {backend} 后端（{variant}），正在导出模型（imgsz={imgsz}）...")
+        options = {'half': True} if variant == 'half' else {'int8': True, 'data': data} if variant == 'int8' else {}
+        exported = model.export(format=backend, imgsz=imgsz, **options)
+        os.replace(exported, target)
+        print(f"✓ 导出完成: {target}")
+    else:
+        print(f"使用已缓存的导出模型: {target}")
+
+    return YOLO(target, task='detect')
+
+
+def warmup(model, imgsz=320, runs=1):
+    """
+    用空白图像预热模型，提前完成图构建和内存分配，避免首次检测变慢
+
+    Args:
+        model: YOLO模型实例
+        imgsz: 推理尺寸，应与实际检测使用的尺寸一致
+        runs: 预热推理次数
+    """
+    import numpy as np
+
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(runs):
+        model(dummy, imgsz=imgsz, verbose=False)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+分阶段延迟基准测试
+对固定的图片集（合成或本地）按 imgsz × batch 组合预热后计时，
+输出各阶段 p50/p90/p99 延迟和吞吐，并写出JSON便于版本间对比
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, file_hash, load_model
+from tiling import MERGE_METHODS, detect_tiled
+from utils import COCO_CATEGORY_NAMES, collect_image_paths, draw_detection_result
+
+# 计时的阶段，顺序即输出顺序
+STAGES = ('decode', 'preprocess', 'forward', 'postprocess', 'draw', 'total')
+# 切片推理的计时阶段（每张图片）
+TILE_STAGES = ('decode', 'tile', 'forward', 'merge', 'draw', 'total')
+
+
+def load_encoded_images(source=None, count=32, size=(640, 480), seed=0):
+    """
+    准备测试图片的编码字节，解码阶段每次迭代都从内存重新解码，排除磁盘IO波动
+
+    Args:
+        source: 图片目录、glob通配符或列表文件；为None时生成合成图片
+        count: 图片数量（本地图片取前count张）
+        size: 合成图片尺寸 (宽, 高)
+        seed: 合成图片随机种子
+
+    Returns:
+        JPEG/PNG编码字节列表
+    """
+    if source:
+        encoded = []
+        for path in collect_image_paths(source)[:count]:
+            with open(path, 'rb') as f:
+                encoded.append(f.read())
+        return encoded
+
+    rng = np.random.default_rng(seed)
+    encoded = []
+    for _ in range(count):
+        # 低频噪声+随机色块，比纯白噪声更接近真实图片的编码体积
+        img = cv2.resize(rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8),
+                         size, interpolation=cv2.INTER_LINEAR)
+        for _ in range(5):
+            x, y = rng.integers(0, size[0] - 64), rng.integers(0, size[1] - 64)
+            w, h = rng.integers(32, 160, 2)
+            cv2.rectangle(img, (int(x), int(y)), (int(x + w), int(y + h)),
+                          tuple(int(c) for c in rng.integers(0, 256, 3)), -1)
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        encoded.append(buf.tobytes())
+    return encoded
+
+
+def percentiles(samples_ms):
+    """
+    计算延迟分位数
+
+    Args:
+        samples_ms: 毫秒延迟样本
+
+    Returns:
+        包含 mean/p50/p90/p99 的字典
+    """
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    if arr.size == 0:
+        return {'mean': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0}
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {'mean': round(float(arr.mean()), 3), 'p50': round(float(p50), 3),
+            'p90': round(float(p90), 3), 'p99': round(float(p99), 3)}
+
+
+def run_case(model, encoded, imgsz, batch, conf=0.25, warmup=5, iters=50):
+    """
+    对一个 imgsz × batch 组合执行预热和计时迭代
+
+    decode/draw/total 使用 perf_counter_ns 直接计时；
+    preprocess/forward/postprocess 发生在 model() 调用内部，
+    取自预测器对本批次的分阶段计时（Results.speed）。
+
+    Returns:
+        该组合的结果字典（各阶段为每批次延迟，单位毫秒）
+    """
+    samples = {stage: [] for stage in STAGES}
+    n = len(encoded)
+    timed_images = 0
+    timed_ns = 0
+
+    for it in range(warmup + iters):
+        chunk = [encoded[(it * batch + k) % n] for k in range(batch)]
+
+        t0 = time.perf_counter_ns()
+        imgs = [cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR) for buf in chunk]
+        t1 = time.perf_counter_ns()
+        results = model(imgs, conf=conf, imgsz=imgsz, verbose=False)
+        t2 = time.perf_counter_ns()
+        for img, result in zip(imgs, results):
+            draw_detection_result(img, result.boxes, COCO_CATEGORY_NAMES, conf, copy=False)
+        t3 = time.perf_counter_ns()
+
+        if it < warmup:
+            continue
+
+        # Results.speed 为本批次内每张图片的平均毫秒数
+        speed = results[0].speed
+        samples['decode'].append((t1 - t0) / 1e6)
+        samples['preprocess'].append((speed.get('preprocess') or 0) * batch)
+        samples['forward'].append((speed.get('inference') or 0) * batch)
+        samples['postprocess'].append((speed.get('postprocess') or 0) * batch)
+        samples['draw'].append((t3 - t2) / 1e6)
+        samples['total'].append((t3 - t0) / 1e6)
+        timed_images += batch
+        timed_ns += t3 - t0
+
+    return {
+        'imgsz': imgsz,
+        'batch': batch,
+        'iters': iters,
+        'throughput_ips': round(timed_images / (timed_ns / 1e9), 2) if timed_ns else 0.0,
+        'stages_ms': {stage: percentiles(samples[stage]) for stage in STAGES},
+    }
+
+
+def run_tiled_case(model, encoded, imgsz, tile_size, overlap=0.2, tile_batch=8, merge='nms',
+                   conf=0.25, warmup=2, iters=20):
+    """
+    对一个切片配置执行预热和计时迭代，每次迭代处理一张图片
+
+    tile/forward/merge 取自 detect_tiled 的分阶段计时，forward 包含模型内部的前后处理。
+
+    Returns:
+        该配置的结果字典（各阶段为每张图片延迟，单位毫秒）
+    """
+    samples = {stage: [] for stage in TILE_STAGES}
+    tile_counts = []
+    n = len(encoded)
+    timed_ns = 0
+
+    for it in range(warmup + iters):
+        t0 = time.perf_counter_ns()
+        img = cv2.imdecode(np.frombuffer(encoded[it % n], np.uint8), cv2.IMREAD_COLOR)
+        t1 = time.perf_counter_ns()
+        timings = {}
+        boxes = detect_tiled(model, img, conf, imgsz, tile_size, overlap, tile_batch, merge,
+                             timings=timings)
+        t2 = time.perf_counter_ns()
+        draw_detection_result(img, boxes, COCO_CATEGORY_NAMES, conf, copy=False)
+        t3 = time.perf_counter_ns()
+
+        if it < warmup:
+            continue
+
+        samples['decode'].append((t1 - t0) / 1e6)
+        samples['tile'].append(timings['tile'] * 1000)
+        samples['forward'].append(timings['forward'] * 1000)
+        samples['merge'].append(timings['merge'] * 1000)
+        samples['draw'].append((t3 - t2) / 1e6)
+        samples['total'].append((t3 - t0) / 1e6)
+        tile_counts.append(timings['tiles'])
+        timed_ns += t3 - t0
+
+    return {
+        'imgsz': imgsz,
+        'batch': tile_batch,
+        'tile_size': tile_size,
+        'tile_overlap': overlap,
+        'tile_merge': merge,
+        'tiles_per_image': round(float(np.mean(tile_counts)), 1) if tile_counts else 0.0,
+        'iters': iters,
+        'throughput_ips': round(iters / (timed_ns / 1e9), 2) if timed_ns else 0.0,
+        'stages_ms': {stage: percentiles(samples[stage]) for stage in TILE_STAGES},
+    }
+
+
+def print_case(case):
+    """打印一个组合的结果"""
+    if 'tile_size' in case:
+        print(f"\n切片 imgsz={case['imgsz']} tile={case['tile_size']} overlap={case['tile_overlap']} "
+              f"batch={case['batch']} 每图 {case['tiles_per_image']} 片 "
+              f"吞吐: {case['throughput_ips']:.1f} 张/秒")
+        print(f"{'阶段':<12}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}  (ms/张)")
+    else:
+        print(f"\nimgsz={case['imgsz']} batch={case['batch']} "
+              f"吞吐: {case['throughput_ips']:.1f} 张/秒")
+        print(f"{'阶段':<12}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}  (ms/批)")
+    for stage, stats in case['stages_ms'].items():
+        print(f"{stage:<12}{stats['mean']:>10.2f}{stats['p50']:>10.2f}"
+              f"{stats['p90']:>10.2f}{stats['p99']:>10.2f}")
+
+
+def parse_int_list(value):
+    """解析逗号分隔的整数列表"""
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def parse_size(value):
+    """解析 宽x高 格式的尺寸"""
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='YOLOv8物品检测分阶段延迟基准测试')
+    parser.add_argument('--model', type=str, default='yolov8n.pt',
+                        help='模型路径，默认yolov8n预训练模型')
+    parser.add_argument('--backend', type=str, default='torch', choices=BACKENDS,
+                        help='推理后端，默认torch')
+    parser.add_argument('--source', type=str, default=None,
+                        help='测试图片目录、glob通配符或列表文件，默认使用合成图片')
+    parser.add_argument('--num-images', type=int, default=32,
+                        help='测试图片数量，默认32')
+    parser.add_argument('--imgsz', type=parse_int_list, default=[320, 480, 640],
+                        help='推理尺寸列表，逗号分隔，默认320,480,640')
+    parser.add_argument('--batch', type=parse_int_list, default=[1, 4, 8],
+                        help='批次大小列表，逗号分隔，默认1,4,8')
+    parser.add_argument('--warmup', type=int, default=5,
+                        help='每个组合的预热迭代次数，默认5')
+    parser.add_argument('--iters', type=int, default=50,
+                        help='每个组合的计时迭代次数，默认50')
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help='置信度阈值，默认0.25')
+    parser.add_argument('--image-size', type=parse_size, default=(640, 480),
+                        help='合成图片尺寸 宽x高，默认640x480；测试切片推理时可设为3840x2160')
+    parser.add_argument('--tile-size', type=parse_int_list, default=[],
+                        help='切片边长列表，逗号分隔；指定后额外测试切片推理，默认不测试')
+    parser.add_argument('--tile-overlap', type=float, default=0.2,
+                        help='切片重叠比例，默认0.2')
+    parser.add_argument('--tile-batch', type=int, default=8,
+                        help='切片推理每批切片数，默认8（导出模型固定为1）')
+    parser.add_argument('--tile-merge', type=str, default='nms', choices=MERGE_METHODS,
+                        help='切片结果合并方式，默认nms')
+    parser.add_argument('--output', type=str, default='bench.json',
+                        help='JSON结果输出路径，默认bench.json')
+
+    args = parser.parse_args()
+
+    encoded = load_encoded_images(args.source, args.num_images, args.image_size)
+    if not encoded:
+        print(f"✗ 未找到任何图片: {args.source}")
+        return
+
+    print("========================================")
+    print("        YOLOv8 分阶段延迟基准测试        ")
+    print("========================================")
+    print(f"模型路径: {args.model}")
+    print(f"推理后端: {args.backend}")
+    print(f"测试图片: {args.source or '合成'} × {len(encoded)}")
+    print(f"推理尺寸: {args.imgsz}")
+    print(f"批次大小: {args.batch}")
+    print(f"预热/计时迭代: {args.warmup}/{args.iters}")
+    print("========================================")
+
+    cases = []
+    model = None
+    for imgsz in args.imgsz:
+        # 导出模型的输入尺寸固定，每个imgsz单独加载；torch模型只加载一次
+        if model is None or args.backend != 'torch':
+            model = load_model(args.model, args.backend, imgsz)
+        for batch in args.batch:
+            if args.backend != 'torch' and batch > 1:
+                print(f"跳过 imgsz={imgsz} batch={batch}：导出模型为静态batch=1")
+                continue
+            case = run_case(model, encoded, imgsz, batch, args.conf, args.warmup, args.iters)
+            print_case(case)
+            cases.append(case)
+        for tile_size in args.tile_size:
+            tile_batch = args.tile_batch if args.backend == 'torch' else 1
+            case = run_tiled_case(model, encoded, imgsz, tile_size, args.tile_overlap, tile_batch,
+                                  args.tile_merge, args.conf, args.warmup, args.iters)
+            print_case(case)
+            cases.append(case)
+
+    weights_path = getattr(model, 'ckpt_path', None) or args.model
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'model': args.model,
+            'model_hash': file_hash(weights_path) if os.path.isfile(weights_path) else None,
+            'backend': args.backend,
+            'source': args.source or 'synthetic',
+            'num_images': len(encoded),
+            'warmup': args.warmup,
+            'iters': args.iters,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+        },
+        'results': cases,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ 基准测试完成，结果已写入: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
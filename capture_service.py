@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+共享内存帧采集服务
+每路摄像头只由一个采集进程打开并解码，帧直接解码进 multiprocessing.shared_memory 中的环形缓冲区，
+每个槽位带序号和时间戳；检测器、GUI、录像等消费者进程按序号零拷贝读取，互不影响
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 头部：8个int64，依次为 魔数、最新序号、槽位数、高、宽、通道数、运行标志、采集进程PID
+HEADER_FIELDS = 8
+HEADER_SIZE = HEADER_FIELDS * 8
+MAGIC = 0x59524E47  # 'YRNG'
+_WRITE_SEQ, _SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _RUNNING, _PID = range(1, 8)
+
+
+def ring_name(source):
+    """
+    摄像头对应的共享内存名称，同一摄像头的采集服务和各消费者据此找到同一块缓冲区
+
+    Args:
+        source: 摄像头ID或URL
+
+    Returns:
+        共享内存名称
+    """
+    return "yolov8_capture_" + re.sub(r'[^0-9A-Za-z]+', '_', str(source)).strip('_')
+
+
+def _attach_memory(name):
+    # 消费者只映射不拥有：Python 3.13 以下 resource_tracker 会在消费者退出时误删共享内存，需取消登记
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class FrameRing:
+    """
+    共享内存帧环形缓冲区
+
+    布局：头部 | 各槽位序号(int64) | 各槽位时间戳(float64) | 帧数据(slots×H×W×C uint8)。
+    写入方：只有一个采集进程。写入槽位前先把该槽位序号置为-1，解码完成后写入时间戳和序号，最后更新最新序号。
+    读取方：按序号取槽位视图（不复制），使用完后必须用 valid() 确认期间未被覆盖，
+    需要跨线程、跨队列传递的帧应先复制，复制后同样要确认。
+    """
+
+    def __init__(self, shm, owner=False):
+        self._shm = shm
+        self.owner = owner
+        buf = shm.buf
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+        if self._header[0] != MAGIC:
+            raise ValueError(f"共享内存 {shm.name} 不是帧环形缓冲区")
+        self.slots = int(self._header[_SLOTS])
+        self.shape = tuple(int(v) for v in self._header[_HEIGHT:_CHANNELS + 1])
+        self._seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=buf, offset=HEADER_SIZE)
+        self._stamps = np.ndarray((self.slots,), dtype=np.float64, buffer=buf,
+                                  offset=HEADER_SIZE + 8 * self.slots)
+        self.frames = np.ndarray((self.slots, *self.shape), dtype=np.uint8, buffer=buf,
+                                 offset=HEADER_SIZE + 16 * self.slots)
+
+    @classmethod
+    def create(cls, name, shape, slots=16):
+        """
+        创建缓冲区（采集进程调用）
+
+        Args:
+            name: 共享内存名称
+            shape: 帧形状 (高, 宽, 通道)
+            slots: 槽位数，应大于最慢消费者处理一帧期间到达的帧数
+
+        Returns:
+            FrameRing
+        """
+        shape = tuple(shape) if len(shape) == 3 else (*shape, 1)
+        size = HEADER_SIZE + 16 * slots + slots * int(np.prod(shape))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = (MAGIC, 0, slots, *shape, 1, os.getpid())
+        np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=HEADER_SIZE)[:] = -1
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        连接到已存在的缓冲区（消费者调用）
+
+        Raises:
+            FileNotFoundError: 对应的采集服务未启动
+        """
+        return cls(_attach_memory(name))
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def latest_seq(self):
+        """最新写入完成的帧序号，0表示尚无帧"""
+        return int(self._header[_WRITE_SEQ])
+
+    @property
+    def running(self):
+        """采集服务是否仍在写入"""
+        return bool(self._header[_RUNNING])
+
+    def alive(self):
+        """采集进程是否存活：异常退出的进程来不及清除运行标志，按PID判断"""
+        if not self.running:
+            return False
+        if os.name == 'nt':
+            # Windows 上共享内存随最后一个句柄关闭而释放，不会遗留
+            return True
+        try:
+            os.kill(int(self._header[_PID]), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def begin_write(self):
+        """
+        取得下一帧的槽位（采集进程调用）
+
+        Returns:
+            (序号, 槽位视图)，解码结果直接写入该视图后调用 commit()
+        """
+        seq = self.latest_seq + 1
+        slot = seq % self.slots
+        # 写入期间该槽位对读取方无效
+        self._seqs[slot] = -1
+        return seq, self.frames[slot]
+
+    def commit(self, seq, timestamp):
+        """发布 begin_write() 取得的帧"""
+        slot = seq % self.slots
+        self._stamps[slot] = timestamp
+        self._seqs[slot] = seq
+        self._header[_WRITE_SEQ] = seq
+
+    def write(self, frame, timestamp=None):
+        """
+        复制一帧到缓冲区
+
+        Returns:
+            帧序号
+        """
+        seq, view = self.begin_write()
+        view[...] = frame.reshape(view.shape)
+        self.commit(seq, time.time() if timestamp is None else timestamp)
+        return seq
+
+    def stop(self):
+        """标记采集结束，消费者读到该标志后退出"""
+        self._header[_RUNNING] = 0
+
+    def valid(self, seq):
+        """序号对应的槽位是否仍保存着该帧（未被覆盖）"""
+        return seq > 0 and self._seqs[seq % self.slots] == seq
+
+    def read(self, seq):
+        """
+        按序号读取一帧（零拷贝）
+
+        返回的视图在采集进程绕回该槽位前有效；需要长期保留时应自行复制，
+        或在使用完后用 valid(seq) 确认读取期间未被覆盖。
+
+        Returns:
+            (时间戳, 帧视图)，该帧已被覆盖或尚未写入时返回None
+        """
+        if not self.valid(seq):
+            return None
+        slot = seq % self.slots
+        timestamp = float(self._stamps[slot])
+        frame = self.frames[slot]
+        return (timestamp, frame) if self._seqs[slot] == seq else None
+
+    def wait_next(self, after, timeout=1.0, latest=True, poll=0.002):
+        """
+        等待 after 之后的下一帧
+
+        Args:
+            after: 已处理的最后一帧序号
+            timeout: 最长等待秒数
+            latest: True 时直接跳到最新帧（实时检测、显示）；False 时按顺序返回仍在缓冲区中的最早一帧（录像）
+            poll: 轮询间隔（秒）
+
+        Returns:
+            帧序号，超时或采集已结束返回None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            newest = self.latest_seq
+            if newest > after:
+                if latest:
+                    return newest
+                # 慢消费者落后超过一圈时，跳过已被覆盖的帧
+                return max(after + 1, newest - self.slots + 2)
+            if not self.running or time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        """断开映射；采集进程还会删除共享内存"""
+        self._header = self._seqs = self._stamps = self.frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # 仍有外部引用的帧视图，映射在进程退出时释放
+            pass
+        if self.owner:
+            if os.name != 'nt':
+                # 同一 resource_tracker 下消费者的取消登记会抵消创建时的登记，删除前重新登记保持配对
+                from multiprocessing import resource_tracker
+
+                resource_tracker.register(self._shm._name, 'shared_memory')
+            self._shm.unlink()
+
+
+def parse_source(value):
+    """摄像头ID转为整数，URL或设备路径保持字符串"""
+    value = str(value).strip()
+    return int(value) if value.isdigit() else value
+
+
+def run_capture(source, name=None, width=640, height=480, slots=16, stop_event=None, ready_event=None):
+    """
+    采集循环：打开摄像头，逐帧解码到共享内存环形缓冲区，直到摄像头结束或 stop_event 被设置
+
+    Args:
+        source: 摄像头ID或URL
+        name: 共享内存名称，默认 ring_name(source)
+        width: 请求的采集宽度
+        height: 请求的采集高度
+        slots: 环形缓冲区槽位数
+        stop_event: 可选的停止事件（multiprocessing.Event）
+        ready_event: 可选的就绪事件，缓冲区创建并写入首帧后设置
+    """
+    import cv2
+
+    name = name or ring_name(source)
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"✗ 无法打开摄像头: {source}")
+        return
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    ok, frame = cap.read()
+    if not ok:
+        print(f"✗ 无法读取摄像头帧: {source}")
+        cap.release()
+        return
+
+    try:
+        ring = FrameRing.create(name, frame.shape, slots)
+    except FileExistsError:
+        # 上次异常退出遗留的缓冲区可以回收，正在运行的采集服务不能重复启动
+        stale = FrameRing.attach(name)
+        alive = stale.alive()
+        stale.close()
+        if alive:
+            print(f"✗ 摄像头 {source} 已有采集服务在运行（{name}）")
+            cap.release()
+            return
+        shared_memory.SharedMemory(name=name).unlink()
+        ring = FrameRing.create(name, frame.shape, slots)
+
+    ring.write(frame)
+    if ready_event is not None:
+        ready_event.set()
+    height, width = ring.shape[:2]
+    print(f"✓ 采集服务已启动: {source} → {name}（{width}x{height}，{slots} 槽位）")
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if not cap.grab():
+                print(f"✗ 摄像头 {source} 已断开或读取结束")
+                break
+            # 直接解码到共享内存槽位，每帧只解码一次、不额外复制
+            seq, view = ring.begin_write()
+            ok, decoded = cap.retrieve(view)
+            if not ok:
+                break
+            if decoded.ctypes.data != view.ctypes.data:
+                # 分辨率中途变化时OpenCV会另行分配，缩放到缓冲区尺寸
+                cv2.resize(decoded, (width, height), dst=view)
+            ring.commit(seq, time.time())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        frames = ring.latest_seq
+        ring.stop()
+        ring.close()
+        cap.release()
+        print(f"采集服务已停止: {source}，共 {frames} 帧")
+
+
+class SharedCapture:
+    """
+    从帧环形缓冲区读取的类 cv2.VideoCapture 接口
+
+    copy=True 时 read() 把帧复制到调用方独占的新数组，并确认复制期间槽位未被覆盖（被覆盖则丢弃重取），
+    返回的帧可以放入队列、交给其他线程或原地绘制。
+    copy=False 时 read() 返回共享内存中的帧视图（零拷贝），只适合在同一线程内用完即弃：
+    不能在原图上绘制，用完后须调用 confirm()，返回False说明使用期间帧已被覆盖，结果应丢弃。
+    由本对象启动的采集进程在 release() 时停止，其他消费者随之收到结束标志。
+    """
+
+    # 读取的帧来自共享内存
+    shared = True
+
+    def __init__(self, ring, process=None, stop_event=None, latest=True, timeout=2.0, copy=False):
+        self.ring = ring
+        self.latest = latest
+        self.timeout = timeout
+        self.copy = copy
+        self.seq = ring.latest_seq - 1 if ring is not None else 0
+        self.timestamp = None
+        # 落后于采集而跳过的帧数；读取或使用期间被覆盖而丢弃的帧数
+        self.skipped = 0
+        self.overwritten = 0
+        self._process = process
+        self._stop_event = stop_event
+
+    def isOpened(self):
+        return self.ring is not None
+
+    def set(self, prop, value):
+        # 分辨率等参数由采集服务决定
+        return False
+
+    def read(self):
+        """
+        读取下一帧
+
+        Returns:
+            (成功与否, 帧)，copy=False 时为共享内存视图
+        """
+        while self.ring is not None:
+            seq = self.ring.wait_next(self.seq, self.timeout, self.latest)
+            if seq is None:
+                return False, None
+            item = self.ring.read(seq)
+            if item is not None and self.copy:
+                item = (item[0], item[1].copy())
+                if not self.ring.valid(seq):
+                    # 复制期间采集服务绕回了该槽位，副本可能新旧混杂
+                    item = None
+            if item is None:
+                # 已被覆盖，丢弃并读取后续的帧
+                self.overwritten += 1
+                self.skipped += seq - self.seq - 1
+                self.seq = seq
+                continue
+            self.skipped += seq - self.seq - 1
+            self.seq = seq
+            self.timestamp, frame = item
+            return True, frame
+        return False, None
+
+    def confirm(self):
+        """
+        确认最近一次 read() 返回的帧在使用期间未被覆盖（零拷贝读取时在推理、写出之后调用）
+
+        Returns:
+            未被覆盖返回True；已被覆盖时计入 overwritten 并返回False，基于该帧的结果应丢弃
+        """
+        if self.ring is not None and self.ring.valid(self.seq):
+            return True
+        self.overwritten += 1
+        return False
+
+    def release(self):
+        if self.ring is None:
+            return
+        self.ring.close()
+        self.ring = None
+        if self._process is not None:
+            self._stop_event.set()
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+
+
+def open_capture(source, shared=False, width=640, height=480, slots=16, timeout=10.0, copy=False):
+    """
+    打开摄像头
+
+    shared=True 时连接到该摄像头的采集服务；服务未运行则在子进程中启动一个（本进程退出时随之停止，
+    长期多消费者共享时建议单独运行 python capture_service.py --source <ID>）。
+
+    Args:
+        source: 摄像头ID或URL
+        shared: 是否通过共享内存采集服务读取
+        width: 非共享或新启动采集服务时的采集宽度
+        height: 非共享或新启动采集服务时的采集高度
+        slots: 新启动采集服务的槽位数
+        timeout: 等待采集服务就绪的最长秒数
+        copy: 共享采集时 read() 是否返回独占副本（帧要跨线程或队列传递时必须为True），见 SharedCapture
+
+    Returns:
+        cv2.VideoCapture 或 SharedCapture，打开失败时 isOpened() 为False
+    """
+    if not shared:
+        import cv2
+
+        cap = cv2.VideoCapture(source)
+        if cap.isOpened():
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            # 尽量减小驱动缓冲，避免积压过期帧
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    name = ring_name(source)
+    try:
+        ring = FrameRing.attach(name)
+        if ring.alive():
+            print(f"✓ 已连接采集服务: {name}")
+            return SharedCapture(ring, copy=copy)
+        ring.close()
+    except FileNotFoundError:
+        pass
+
+    # spawn 启动的子进程不继承父进程的模型和线程状态
+    ctx = multiprocessing.get_context('spawn')
+    stop_event = ctx.Event()
+    ready_event = ctx.Event()
+    process = ctx.Process(target=run_capture, name=f"capture-{source}", daemon=True,
+                          args=(source, name, width, height, slots, stop_event, ready_event))
+    process.start()
+    deadline = time.monotonic() + timeout
+    while not ready_event.wait(0.1):
+        if not process.is_alive() or time.monotonic() >= deadline:
+            stop_event.set()
+            process.join(timeout=2)
+            return SharedCapture(None)
+    return SharedCapture(FrameRing.attach(name), process, stop_event, copy=copy)
+
+
+def record(source, output, fps=0.0):
+    """
+    录像消费者：按顺序把采集服务的帧写入视频文件，直到采集结束或 Ctrl+C
+
+    Args:
+        source: 摄像头ID或URL（用于定位采集服务）
+        output: 输出视频路径
+        fps: 输出帧率，0 表示按前两秒的到达间隔估计
+    """
+    import cv2
+
+    try:
+        ring = FrameRing.attach(ring_name(source))
+    except FileNotFoundError:
+        print(f"✗ 摄像头 {source} 的采集服务未运行")
+        return
+    # 编码写出较慢，先复制为独占副本并确认未被覆盖，再交给 VideoWriter
+    cap = SharedCapture(ring, latest=False, copy=True)
+    height, width = ring.shape[:2]
+
+    frames = []
+    if not fps:
+        # 缓冲约两秒的帧估计实际帧率
+        while len(frames) < 2 or frames[-1][0] - frames[0][0] < 2.0:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append((cap.timestamp, frame))
+        span = frames[-1][0] - frames[0][0] if len(frames) > 1 else 0
+        fps = (len(frames) - 1) / span if span > 0 else 30.0
+
+    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    written = 0
+    try:
+        for _, frame in frames:
+            writer.write(frame)
+            written += 1
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            writer.write(frame)
+            written += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.release()
+        skipped = cap.skipped
+        overwritten = cap.overwritten
+        cap.release()
+    print(f"✓ 录像已保存: {output}（{written} 帧，{fps:.1f} FPS，跳过 {skipped} 帧，"
+          f"被覆盖丢弃 {overwritten} 帧）")
+
+
+def view(source):
+    """预览消费者：显示采集服务的最新帧，按 'q' 退出"""
+    import cv2
+
+    cap = open_capture(source, shared=True, copy=True)
+    if not cap.isOpened():
+        print(f"✗ 无法连接摄像头 {source} 的采集服务")
+        return
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        cv2.imshow(f"capture {source}", frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+    cap.release()
+    cv2.destroyAllWindows()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='YOLOv8物品检测共享内存采集服务')
+    parser.add_argument('--mode', type=str, default='serve', choices=['serve', 'record', 'view'],
+                        help='serve(运行采集服务)、record(录像消费者) 或 view(预览消费者)，默认serve')
+    parser.add_argument('--source', type=str, default='0', help='摄像头ID或URL，默认0')
+    parser.add_argument('--width', type=int, default=640, help='采集宽度，默认640')
+    parser.add_argument('--height', type=int, default=480, help='采集高度，默认480')
+    parser.add_argument('--slots', type=int, default=16,
+                        help='环形缓冲区槽位数，应大于最慢消费者处理一帧期间到达的帧数，默认16')
+    parser.add_argument('--output', type=str, default='capture.mp4', help='record模式的输出视频，默认capture.mp4')
+    parser.add_argument('--fps', type=float, default=0.0,
+                        help='record模式的输出帧率，默认0表示按实际到达间隔估计')
+
+    args = parser.parse_args()
+    source = parse_source(args.source)
+
+    if args.mode == 'serve':
+        run_capture(source, width=args.width, height=args.height, slots=args.slots)
+    elif args.mode == 'record':
+        record(source, args.output, args.fps)
+    else:
+        view(source)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+训练数据集预处理缓存模块
+校验数据集配置和标签文件，把图片一次性解码并缩放到训练尺寸，
+存为内存映射的 uint8 数组（附偏移索引），标签打包为连续数组，
+训练时数据加载进程直接从内存映射读取，不再逐轮解码JPEG
+"""
+
+import hashlib
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from utils import collect_image_paths
+
+# 训练时读取缓存的数据集划分
+CACHED_SPLITS = ('train', 'val')
+
+
+def label_path(image_path):
+    """按YOLO约定由图片路径推出标签路径：/images/ 替换为 /labels/，扩展名改为 .txt"""
+    images_dir = f"{os.sep}images{os.sep}"
+    labels_dir = f"{os.sep}labels{os.sep}"
+    path = os.path.normpath(image_path)
+    if images_dir in path:
+        head, tail = path.rsplit(images_dir, 1)
+        path = head + labels_dir + tail
+    return os.path.splitext(path)[0] + '.txt'
+
+
+def read_labels(path, num_classes):
+    """
+    读取并校验一个YOLO标签文件
+
+    Args:
+        path: 标签文件路径
+        num_classes: 类别数
+
+    Returns:
+        (labels, errors, warnings)：labels 为 (N, 5) float32 的 cls, x, y, w, h；
+        errors 为无法训练的问题描述列表，warnings 为已自动修正的问题（如重复标注框）；
+        文件不存在时 labels 为空数组（视为背景图）
+    """
+    if not os.path.isfile(path):
+        return np.zeros((0, 5), dtype=np.float32), [], []
+
+    rows, errors, warnings = [], [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 5:
+                errors.append(f"{path}:{lineno} 应为5列，实际 {len(parts)} 列")
+                continue
+            try:
+                values = [float(v) for v in parts]
+            except ValueError:
+                errors.append(f"{path}:{lineno} 含非数字内容")
+                continue
+            cls = values[0]
+            if cls != int(cls) or not 0 <= cls < num_classes:
+                errors.append(f"{path}:{lineno} 类别 {parts[0]} 超出范围 0~{num_classes - 1}")
+                continue
+            x, y, w, h = values[1:]
+            if not (0 <= x <= 1 and 0 <= y <= 1 and 0 < w <= 1 and 0 < h <= 1):
+                errors.append(f"{path}:{lineno} 坐标未归一化或宽高非正")
+                continue
+            rows.append(values)
+
+    labels = np.array(rows, dtype=np.float32).reshape(-1, 5)
+    # 重复标注框会让损失重复计数，去重后可以继续训练
+    unique = np.unique(labels, axis=0)
+    if len(unique) < len(labels):
+        warnings.append(f"{path} 含 {len(labels) - len(unique)} 个重复标注框，已去重")
+        labels = unique
+    return labels, errors, warnings
+
+
+def resolve_split(cfg, data, split):
+    """
+    把数据集配置中的划分路径解析为图片源（目录、列表文件或通配符）
+
+    Returns:
+        图片源列表：划分可以是单个路径，也可以是多个路径的列表（与ultralytics一致）
+    """
+    root = cfg.get('path', '')
+    base = os.path.dirname(os.path.abspath(data))
+    if root and not os.path.isabs(root) and not os.path.exists(root):
+        root = os.path.join(base, root)
+    value = cfg[split]
+    sources = []
+    for item in (value if isinstance(value, (list, tuple)) else [value]):
+        source = os.path.join(root, str(item)) if root else str(item)
+        sources.append(source if os.path.isabs(source) else os.path.abspath(source))
+    return sources
+
+
+def validate_dataset(data, splits=CACHED_SPLITS):
+    """
+    校验数据集配置和各划分的标签文件
+
+    Args:
+        data: 数据集yaml路径
+        splits: 要校验的划分
+
+    Returns:
+        (cfg, samples, errors, warnings)：samples[split] 为 [(图片路径, 标签数组)]；
+        errors 非空时不应继续训练
+    """
+    import yaml
+
+    errors, warnings = [], []
+    with open(data, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f) or {}
+
+    names = cfg.get('names')
+    if isinstance(names, list):
+        names = dict(enumerate(names))
+    if not names:
+        errors.append(f"{data} 缺少 names 类别定义")
+        return cfg, {}, errors, warnings
+    if sorted(int(k) for k in names) != list(range(len(names))):
+        errors.append(f"{data} 的类别ID应从0开始连续编号")
+    num_classes = len(names)
+
+    samples = {}
+    for split in splits:
+        if split not in cfg:
+            errors.append(f"{data} 缺少 {split} 划分")
+            continue
+        sources = resolve_split(cfg, data, split)
+        paths = [path for source in sources for path in collect_image_paths(source)]
+        if not paths:
+            errors.append(f"{split} 划分未找到任何图片: {', '.join(sources)}")
+            continue
+
+        entries, missing = [], 0
+        for path in paths:
+            lbl_path = label_path(path)
+            if not os.path.isfile(lbl_path):
+                missing += 1
+            labels, label_errors, label_warnings = read_labels(lbl_path, num_classes)
+            errors.extend(label_errors)
+            warnings.extend(label_warnings)
+            entries.append((path, labels))
+        if missing:
+            warnings.append(f"{split} 划分有 {missing} 张图片没有标签文件，将作为背景图训练")
+        samples[split] = entries
+
+    return cfg, samples, errors, warnings
+
+
+def _fingerprint(entries, imgsz):
+    """按图片/标签路径、大小、修改时间和训练尺寸计算指纹，判断缓存是否过期"""
+    sha = hashlib.sha256(f"{imgsz}".encode('ascii'))
+    for path, labels in entries:
+        stat = os.stat(path)
+        sha.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8'))
+        sha.update(labels.tobytes())
+    return sha.hexdigest()
+
+
+def _load_resized(path, imgsz):
+    """解码并按长边缩放到 imgsz（与ultralytics的 load_image 一致）"""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    h0, w0 = img.shape[:2]
+    ratio = imgsz / max(h0, w0)
+    if ratio != 1:
+        size = (min(math.ceil(w0 * ratio), imgsz), min(math.ceil(h0 * ratio), imgsz))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR)
+    return np.ascontiguousarray(img), (h0, w0)
+
+
+def build_store(entries, imgsz, prefix, workers=8):
+    """
+    构建一个划分的缓存：图片顺序写入原始 uint8 文件，索引和打包标签写入 .npz
+
+    缓存指纹未变化时直接复用。索引最后原子写入，中途中断不会留下可用的半成品缓存。
+
+    Args:
+        entries: [(图片路径, 标签数组)]
+        imgsz: 训练尺寸
+        prefix: 缓存文件路径前缀
+        workers: 解码线程数
+
+    Returns:
+        DatasetStore 实例
+    """
+    fingerprint = _fingerprint(entries, imgsz)
+    index_path = prefix + '_index.npz'
+    if os.path.isfile(index_path):
+        with np.load(index_path) as index:
+            if str(index['fingerprint']) == fingerprint:
+                print(f"✓ 复用数据集缓存: {prefix}（{len(index['paths'])} 张）")
+                return DatasetStore(prefix)
+
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    images_path = prefix + '_images.u8'
+    tmp_images = f"{images_path}.{os.getpid()}.tmp"
+
+    paths, offsets, shapes, orig_shapes = [], [0], [], []
+    labels, label_offsets = [], [0]
+    skipped = 0
+    with open(tmp_images, 'wb') as f, ThreadPoolExecutor(max_workers=workers) as pool:
+        # 分块提交，限制同时驻留内存的解码结果
+        chunk = workers * 4
+        for start in range(0, len(entries), chunk):
+            batch = entries[start:start + chunk]
+            for (path, lbl), loaded in zip(batch, pool.map(lambda e: _load_resized(e[0], imgsz), batch)):
+                if loaded is None:
+                    print(f"✗ 无法读取图片，已跳过: {path}")
+                    skipped += 1
+                    continue
+                img, orig = loaded
+                f.write(img.tobytes())
+                paths.append(path)
+                offsets.append(offsets[-1] + img.size)
+                shapes.append(img.shape[:2])
+                orig_shapes.append(orig)
+                labels.append(lbl)
+                label_offsets.append(label_offsets[-1] + len(lbl))
+            print(f"进度: {min(start + chunk, len(entries))}/{len(entries)}")
+    os.replace(tmp_images, images_path)
+
+    tmp_index = f"{prefix}_index.{os.getpid()}.tmp.npz"
+    np.savez(tmp_index,
+             paths=np.array(paths),
+             offsets=np.array(offsets, dtype=np.int64),
+             shapes=np.array(shapes, dtype=np.int32).reshape(-1, 2),
+             orig_shapes=np.array(orig_shapes, dtype=np.int32).reshape(-1, 2),
+             labels=np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32),
+             label_offsets=np.array(label_offsets, dtype=np.int64),
+             imgsz=np.int32(imgsz),
+             fingerprint=np.array(fingerprint))
+    os.replace(tmp_index, index_path)
+
+    size_mb = offsets[-1] / 1e6
+    print(f"✓ 数据集缓存已生成: {prefix}（{len(paths)} 张，跳过 {skipped} 张，{size_mb:.0f}MB）")
+    return DatasetStore(prefix)
+
+
+class DatasetStore:
+    """
+    只读的预处理数据集缓存
+
+    图片数据按需以内存映射打开；序列化（如数据加载子进程）时只传递路径，不复制像素。
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with np.load(prefix + '_index.npz') as index:
+            self.paths = [str(p) for p in index['paths']]
+            self.offsets = index['offsets']
+            self.shapes = index['shapes']
+            self.orig_shapes = index['orig_shapes']
+            self.packed_labels = index['labels']
+            self.label_offsets = index['label_offsets']
+            self.imgsz = int(index['imgsz'])
+        self._images = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    @property
+    def images(self):
+        """扁平的 uint8 内存映射"""
+        if self._images is None:
+            self._images = np.memmap(self.prefix + '_images.u8', dtype=np.uint8, mode='r')
+        return self._images
+
+    def image(self, i):
+        """第 i 张图片（内存映射上的只读视图）"""
+        h, w = self.shapes[i]
+        return self.images[self.offsets[i]:self.offsets[i + 1]].reshape(h, w, 3)
+
+    def labels(self, i):
+        """第 i 张图片的 (N, 5) 标签：cls, x, y, w, h"""
+        return self.packed_labels[self.label_offsets[i]:self.label_offsets[i + 1]]
+
+
+def prepare_dataset(data, imgsz, cache_dir='.cache/dataset', workers=8):
+    """
+    校验数据集并为训练/验证划分生成缓存
+
+    Args:
+        data: 数据集yaml路径
+        imgsz: 训练尺寸
+        cache_dir: 缓存目录
+        workers: 解码线程数
+
+    Returns:
+        {划分: DatasetStore}；校验失败返回None
+    """
+    cfg, samples, errors, warnings = validate_dataset(data)
+    for message in warnings[:20]:
+        print(f"Warning: {message}")
+    if len(warnings) > 20:
+        print(f"... 共 {len(warnings)} 条警告")
+    if errors:
+        for message in errors[:20]:
+            print(f"✗ {message}")
+        if len(errors) > 20:
+            print(f"... 共 {len(errors)} 个问题")
+        return None
+
+    stem = os.path.splitext(os.path.basename(data))[0]
+    stores = {}
+    for split, entries in samples.items():
+        print(f"准备 {split} 划分缓存（{len(entries)} 张，imgsz={imgsz}）...")
+        stores[split] = build_store(entries, imgsz, os.path.join(cache_dir, f"{stem}_{split}_{imgsz}"),
+                                    workers)
+    return stores
+
+
+class CachedYOLODataset(YOLODataset):
+    """从 DatasetStore 读取图片和标签的YOLO数据集，增强流程与原数据集一致"""
+
+    def __init__(self, store, *args, **kwargs):
+        self.store = store
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        paths = self.store.paths
+        if self.fraction < 1:
+            paths = paths[:round(len(paths) * self.fraction)]
+        return list(paths)
+
+    def get_labels(self):
+        labels = []
+        for i in range(len(self.im_files)):
+            lbl = self.store.labels(i)
+            labels.append({
+                'im_file': self.store.paths[i],
+                'shape': tuple(int(v) for v in self.store.orig_shapes[i]),
+                'cls': lbl[:, 0:1].copy(),
+                'bboxes': lbl[:, 1:].copy(),
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh',
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        # 增强会原地修改图像，从只读内存映射复制一份
+        im = np.array(self.store.image(i))
+        h0, w0 = (int(v) for v in self.store.orig_shapes[i])
+        if not rect_mode and im.shape[:2] != (self.imgsz, self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+
+        # 与父类一致地维护马赛克增强使用的缓冲区
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    """
+    使用预处理缓存的检测训练器
+
+    训练前把 prepare_dataset 返回的缓存赋给 CachedDetectionTrainer.stores，
+    再以 model.train(trainer=CachedDetectionTrainer, ...) 启动训练；没有对应缓存的划分按原方式加载。
+    """
+
+    stores = {}
+
+    def build_dataset(self, img_path, mode='train', batch=None):
+        store = self.stores.get('train' if mode == 'train' else 'val')
+        if store is None or store.imgsz != self.args.imgsz:
+            return super().build_dataset(img_path, mode, batch)
+        stride = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        cfg = self.args
+        return CachedYOLODataset(
+            store,
+            img_path=img_path,
+            imgsz=cfg.imgsz,
+            batch_size=batch,
+            augment=mode == 'train',
+            hyp=cfg,
+            rect=cfg.rect or mode == 'val',
+            cache=False,
+            single_cls=cfg.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == 'train' else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=cfg.task,
+            classes=cfg.classes,
+            data=self.data,
+            fraction=cfg.fraction if mode == 'train' else 1.0,
+        )
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+模型评估辅助模块
+验证集图片收集、延迟和吞吐测量、模型体积统计、帕累托前沿报告，供 train.py 和超参数搜索共用
+"""
+
+import glob
+import os
+import time
+
+from utils import IMAGE_EXTENSIONS
+
+
+def dir_size_mb(path):
+    """
+    模型文件或导出模型目录的大小
+
+    Args:
+        path: 文件或目录路径
+
+    Returns:
+        大小（MB）
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1e6
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 1e6
+
+
+def val_image_paths(data, limit=50):
+    """
+    获取数据集配置中验证集划分的前 limit 张图片
+
+    Args:
+        data: 数据集yaml路径
+        limit: 最多返回的图片数
+
+    Returns:
+        排序后的图片路径列表
+    """
+    import yaml
+
+    with open(data, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    root = cfg.get('path', '')
+    if root and not os.path.isabs(root):
+        root = os.path.join(os.path.dirname(os.path.abspath(data)), root)
+    val_dir = os.path.join(root, cfg['val'])
+    paths = sorted(p for p in glob.glob(os.path.join(val_dir, '**', '*'), recursive=True)
+                   if p.lower().endswith(IMAGE_EXTENSIONS))
+    return paths[:limit]
+
+
+def measure_latency(model, images, imgsz, warmup=3, **kwargs):
+    """
+    测量单图端到端平均延迟（batch=1，预热后计时）
+
+    Args:
+        model: YOLO模型实例
+        images: 图片路径列表
+        imgsz: 推理尺寸
+        warmup: 预热次数
+        **kwargs: 透传给 predict 的参数（如 half=True）
+
+    Returns:
+        每张图片的平均延迟（毫秒）
+    """
+    for path in images[:warmup]:
+        model.predict(path, imgsz=imgsz, verbose=False, **kwargs)
+    start = time.perf_counter()
+    for path in images:
+        model.predict(path, imgsz=imgsz, verbose=False, **kwargs)
+    return (time.perf_counter() - start) * 1000 / max(len(images), 1)
+
+
+def measure_throughput(model, images, imgsz, batch=1, **kwargs):
+    """
+    测量吞吐（按批次推理，预热一个批次后计时）
+
+    Args:
+        model: YOLO模型实例
+        images: 图片路径列表
+        imgsz: 推理尺寸
+        batch: 每次推理的图片数，导出模型为静态batch=1时应为1
+        **kwargs: 透传给 predict 的参数
+
+    Returns:
+        每秒处理的图片数
+    """
+    chunks = [images[i:i + batch] for i in range(0, len(images), batch)]
+    if not chunks:
+        return 0.0
+    model.predict(chunks[0], imgsz=imgsz, verbose=False, **kwargs)
+    start = time.perf_counter()
+    for chunk in chunks:
+        model.predict(chunk, imgsz=imgsz, verbose=False, **kwargs)
+    return len(images) / (time.perf_counter() - start)
+
+
+def per_class_ap(metrics):
+    """
+    从验证结果中提取各类别AP
+
+    Args:
+        metrics: model.val() 返回的 DetMetrics
+
+    Returns:
+        {类别名: {'ap50': AP@0.5, 'ap': AP@0.5:0.95}}，只包含验证集中出现的类别
+    """
+    box = metrics.box
+    return {
+        metrics.names[int(c)]: {'ap50': round(float(ap50), 4), 'ap': round(float(ap), 4)}
+        for c, ap50, ap in zip(box.ap_class_index, box.ap50, box.ap)
+    }
+
+
+def pareto_front(records, cost='latency_ms', gain='map'):
+    """
+    计算速度/精度的帕累托前沿：前沿上的配置不被其他配置支配（即没有配置不比它慢且精度不低于它）
+
+    Args:
+        records: 结果字典列表
+        cost: 越小越好的指标
+        gain: 越大越好的指标
+
+    Returns:
+        前沿上的记录，按 cost 升序
+    """
+    candidates = sorted((r for r in records if r.get(cost) is not None),
+                        key=lambda r: (r[cost], -r[gain]))
+    front, best_gain = [], float('-inf')
+    for record in candidates:
+        # 按耗时升序扫描，只有精度严格高于更快配置的才在前沿上
+        if record[gain] > best_gain:
+            front.append(record)
+            best_gain = record[gain]
+    return front
+
+
+def write_val_report(records, out_dir):
+    """
+    写出验证扫描报告：results.json（全部数据）和 report.md（汇总表、帕累托前沿、各类别AP）
+
+    Args:
+        records: 每个配置的结果字典（含 per_class）
+        out_dir: 输出目录
+
+    Returns:
+        (帕累托前沿记录, report.md 路径)
+    """
+    import json
+
+    os.makedirs(out_dir, exist_ok=True)
+    front = pareto_front(records)
+    front_ids = {id(r) for r in front}
+
+    with open(os.path.join(out_dir, 'results.json'), 'w', encoding='utf-8') as f:
+        json.dump({'results': records, 'pareto': [r['config'] for r in front]}, f,
+                  ensure_ascii=False, indent=2)
+
+    lines = ['# 验证扫描报告', '',
+             '| 配置 | mAP50 | mAP50-95 | 延迟 (ms/张) | 吞吐 (张/秒) | 帕累托 |',
+             '|------|-------|----------|--------------|--------------|--------|']
+    for r in records:
+        lines.append(f"| {r['config']} | {r['map50']:.4f} | {r['map']:.4f} | {r['latency_ms']:.1f} | "
+                     f"{r['throughput_ips']:.1f} | {'✓' if id(r) in front_ids else ''} |")
+
+    lines += ['', '## 帕累托前沿（按延迟升序）', '']
+    for r in front:
+        lines.append(f"- {r['config']}: mAP50-95 {r['map']:.4f}，{r['latency_ms']:.1f} ms/张")
+
+    class_names = list(dict.fromkeys(name for r in records for name in r['per_class']))
+    lines += ['', '## 各类别 AP50-95', '',
+              '| 配置 | ' + ' | '.join(class_names) + ' |',
+              '|------|' + '|'.join('---' for _ in class_names) + '|']
+    for r in records:
+        values = [f"{r['per_class'][n]['ap']:.3f}" if n in r['per_class'] else '-' for n in class_names]
+        lines.append(f"| {r['config']} | " + ' | '.join(values) + ' |')
+
+    report_path = os.path.join(out_dir, 'report.md')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    return front, report_path
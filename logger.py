@@ -1,39 +1,139 @@
 # -*- coding: utf-8 -*-
 """
 日志记录模块
+日志在调用线程中只入队，由后台监听线程统一写文件和控制台；文件按日期命名并按大小轮转。
+逐帧调试事件按间隔限速或按比例采样，另按固定周期输出聚合汇总。
 """
 
+import atexit
+import bisect
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
 
-# 确保日志目录存在
-log_dir = os.path.join(os.getcwd(), 'logs')
-os.makedirs(log_dir, exist_ok=True)
-
-# 日志文件名
-log_file = os.path.join(log_dir, f'{datetime.now().strftime("%Y-%m-%d")}.log')
-
-# 配置日志记录器
+# 日志记录器（导入时不创建目录、不打开文件，需由入口调用 setup_logging 初始化）
 logger = logging.getLogger('yolov8_detector')
 logger.setLevel(logging.INFO)
 
-# 创建文件处理器
-file_handler = logging.FileHandler(log_file, encoding='utf-8')
-file_handler.setLevel(logging.INFO)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 当前的后台监听线程，setup_logging 只初始化一次
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class DailyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    按日期命名的日志文件处理器
+    
+    跨过午夜时切换到新日期的文件（YYYY-MM-DD.log），同一天内单个文件超出 max_bytes 时
+    按序号轮转（.log.1、.log.2 ...），并删除超过保留天数的旧日志。
+    """
+    
+    def __init__(self, log_dir, max_bytes=50 * 1024 * 1024, backup_count=5, keep_days=30):
+        self.log_dir = log_dir
+        self.keep_days = keep_days
+        self._date = None
+        self._next_switch = 0.0
+        super().__init__(self._switch_date(time.time()), maxBytes=max_bytes,
+                         backupCount=backup_count, encoding='utf-8', delay=True)
+    
+    def _switch_date(self, now):
+        day = datetime.fromtimestamp(now).date()
+        self._date = day
+        self._next_switch = datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+        return os.path.join(self.log_dir, f'{day.isoformat()}.log')
+    
+    def shouldRollover(self, record):
+        if record.created >= self._next_switch:
+            return True
+        return super().shouldRollover(record)
+    
+    def doRollover(self):
+        if time.time() < self._next_switch:
+            super().doRollover()
+            return
+        # 日期变化：关闭当天文件，后续记录写入新日期的文件
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = os.path.abspath(self._switch_date(time.time()))
+        self._purge()
+    
+    def _purge(self):
+        """删除超过保留天数的日志文件"""
+        if not self.keep_days:
+            return
+        cutoff = time.time() - self.keep_days * 86400
+        for name in os.listdir(self.log_dir):
+            path = os.path.join(self.log_dir, name)
+            if '.log' in name and os.path.getmtime(path) < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
 
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
+def setup_logging(log_dir='logs', level=logging.INFO, console=True, max_bytes=50 * 1024 * 1024,
+                  backup_count=5, keep_days=30):
+    """
+    初始化日志：记录器只挂一个 QueueHandler，文件和控制台输出由后台 QueueListener 线程完成，
+    调用线程不做磁盘I/O。重复调用时直接返回已有的监听线程。
+    
+    Args:
+        log_dir: 日志目录
+        level: 日志级别
+        console: 是否同时输出到控制台
+        max_bytes: 单个日志文件的大小上限，超出后轮转
+        backup_count: 同一天内保留的轮转文件数
+        keep_days: 日志保留天数
+    
+    Returns:
+        QueueListener实例
+    """
+    global _listener
+    
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        
+        os.makedirs(log_dir, exist_ok=True)
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [DailyRotatingFileHandler(log_dir, max_bytes, backup_count, keep_days)]
+        if console:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        log_queue = queue.SimpleQueue()
+        logger.handlers.clear()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.setLevel(level)
+        logger.propagate = False
+        
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        # 退出时排空队列，保证最后的日志落盘
+        atexit.register(shutdown_logging)
+        return _listener
 
-# 定义日志格式
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
 
-# 添加处理器到记录器
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+def shutdown_logging():
+    """停止后台监听线程并写出队列中剩余的日志"""
+    global _listener
+    
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
 
 
 def get_logger():
@@ -44,3 +144,377 @@ def get_logger():
         logger: 日志记录器实例
     """
     return logger
+
+
+class FrameEventLogger:
+    """
+    逐帧事件日志
+    
+    event() 记录逐帧调试事件：DEBUG 未启用时只计数；启用时按 interval 秒限速，
+    或 sample_every > 0 时每N帧采样一条，其余计为被抑制。
+    observe() 累计数值（如延迟、目标数），每 summary_interval 秒以 INFO 输出一次
+    计数/均值/最大值汇总，生产环境可常开而不影响帧率。
+    """
+    
+    def __init__(self, name='frame', interval=1.0, sample_every=0, summary_interval=10.0, log=None):
+        """
+        Args:
+            name: 事件名，作为日志前缀
+            interval: 调试事件的最小输出间隔（秒）
+            sample_every: 大于0时改为每N帧采样输出一条
+            summary_interval: 汇总输出周期（秒），0表示不输出汇总
+            log: 日志记录器，默认为模块记录器
+        """
+        self.name = name
+        self.interval = interval
+        self.sample_every = sample_every
+        self.summary_interval = summary_interval
+        self.log = log or logger
+        
+        self._lock = threading.Lock()
+        self._events = 0
+        self._suppressed = 0
+        self._last_emit = 0.0
+        self._last_summary = time.monotonic()
+        self._stats = {}
+    
+    def event(self, message, *args):
+        """
+        记录一条逐帧调试事件（参数延迟格式化，被抑制的事件不做字符串拼接）
+        
+        Args:
+            message: %-格式的日志消息
+            *args: 格式化参数
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._events += 1
+            if not self.log.isEnabledFor(logging.DEBUG):
+                emit = False
+            elif self.sample_every > 0:
+                emit = self._events % self.sample_every == 0
+            else:
+                emit = now - self._last_emit >= self.interval
+            if emit:
+                self._last_emit = now
+            else:
+                self._suppressed += 1
+        if emit:
+            self.log.debug(f'[{self.name}] {message}', *args)
+        self._maybe_summarize(now)
+    
+    def observe(self, key, value):
+        """
+        累计一个数值样本，用于周期汇总
+        
+        Args:
+            key: 指标名
+            value: 样本值
+        """
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                self._stats[key] = [1, value, value]
+            else:
+                stats[0] += 1
+                stats[1] += value
+                if value > stats[2]:
+                    stats[2] = value
+        self._maybe_summarize(time.monotonic())
+    
+    def _maybe_summarize(self, now):
+        if not self.summary_interval or now - self._last_summary < self.summary_interval:
+            return
+        with self._lock:
+            elapsed = now - self._last_summary
+            if elapsed < self.summary_interval:
+                return
+            events, suppressed, stats = self._events, self._suppressed, self._stats
+            self._events, self._suppressed, self._stats = 0, 0, {}
+            self._last_summary = now
+        parts = [f'{events / elapsed:.1f} 帧/秒']
+        for key, (count, total, peak) in sorted(stats.items()):
+            parts.append(f'{key} 均值 {total / count:.2f} 最大 {peak:.2f}')
+        if suppressed:
+            parts.append(f'抑制调试事件 {suppressed} 条')
+        self.log.info(f'[{self.name}] {elapsed:.0f}秒汇总: ' + '，'.join(parts))
+
+
+# ==================== 指标采集 ====================
+
+# 默认延迟分桶（秒）
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.5)
+
+
+def _format_labels(labels):
+    """把标签元组格式化为Prometheus标签字符串"""
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class Counter:
+    """单调递增计数器（按Prometheus惯例，名称以 _total 结尾）"""
+    
+    type_name = 'counter'
+    
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        """增加计数"""
+        with self._lock:
+            self._value += amount
+    
+    @property
+    def value(self):
+        return self._value
+    
+    def samples(self, name, labels):
+        return [(name, labels, self._value)]
+
+
+class Gauge:
+    """可任意设置的瞬时值"""
+    
+    type_name = 'gauge'
+    
+    def __init__(self):
+        self._value = 0.0
+    
+    def set(self, value):
+        """设置当前值"""
+        self._value = value
+    
+    @property
+    def value(self):
+        return self._value
+    
+    def samples(self, name, labels):
+        return [(name, labels, self._value)]
+
+
+class Histogram:
+    """
+    延迟直方图
+    
+    同时维护累计分桶（用于Prometheus抓取）和最近window个样本的滚动窗口（用于分位数）
+    """
+    
+    type_name = 'histogram'
+    
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS, window=300):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._window = deque(maxlen=window)
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        """记录一个样本"""
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+            self._window.append(value)
+    
+    def percentile(self, q):
+        """
+        滚动窗口内的分位数
+        
+        Args:
+            q: 分位数，0~100
+        
+        Returns:
+            分位数值，窗口为空时返回0
+        """
+        with self._lock:
+            data = sorted(self._window)
+        if not data:
+            return 0.0
+        idx = min(len(data) - 1, max(0, int(round(q / 100 * (len(data) - 1)))))
+        return data[idx]
+    
+    def mean(self):
+        """滚动窗口内的平均值"""
+        with self._lock:
+            return sum(self._window) / len(self._window) if self._window else 0.0
+    
+    def samples(self, name, labels):
+        result = []
+        cumulative = 0
+        with self._lock:
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                result.append((name + '_bucket', labels + (('le', repr(float(bound))),), cumulative))
+            result.append((name + '_bucket', labels + (('le', '+Inf'),), self._count))
+            result.append((name + '_sum', labels, self._sum))
+            result.append((name + '_count', labels, self._count))
+        return result
+
+
+class MetricsRegistry:
+    """指标注册表，按（名称, 标签）获取或创建指标"""
+    
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+    
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = cls(**kwargs)
+                self._metrics[key] = metric
+                self._help.setdefault(name, (help_text, cls.type_name))
+            return metric
+    
+    def counter(self, name, help_text='', labels=None):
+        """获取或创建计数器"""
+        return self._get(Counter, name, help_text, labels)
+    
+    def gauge(self, name, help_text='', labels=None):
+        """获取或创建瞬时值"""
+        return self._get(Gauge, name, help_text, labels)
+    
+    def histogram(self, name, help_text='', labels=None, buckets=DEFAULT_LATENCY_BUCKETS):
+        """获取或创建直方图"""
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+    
+    def render_prometheus(self):
+        """
+        按Prometheus文本格式导出全部指标
+        
+        Returns:
+            Prometheus exposition 格式字符串
+        """
+        with self._lock:
+            items = sorted(self._metrics.items(), key=lambda item: item[0])
+        lines = []
+        rolling = {}
+        last_name = None
+        for (name, labels), metric in items:
+            if name != last_name:
+                help_text, type_name = self._help[name]
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {type_name}')
+                last_name = name
+            for sample_name, sample_labels, value in metric.samples(name, labels):
+                lines.append(f'{sample_name}{_format_labels(sample_labels)} {value}')
+            # 直方图额外导出滚动窗口分位数，便于直接查看近期延迟
+            if isinstance(metric, Histogram):
+                for q in (50, 90, 99):
+                    q_labels = labels + (('quantile', str(q / 100)),)
+                    rolling.setdefault(name + '_rolling', []).append(
+                        f'{name}_rolling{_format_labels(q_labels)} {metric.percentile(q)}')
+        for name, samples in rolling.items():
+            lines.append(f'# HELP {name} 最近样本窗口内的分位数')
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    获取全局指标注册表
+    
+    Returns:
+        metrics: 指标注册表实例
+    """
+    return metrics
+
+
+class DetectorMetrics:
+    """
+    检测循环使用的标准指标集合
+    
+    同一检测源的所有指标带相同的 source 标签，多路检测时按源区分
+    """
+    
+    def __init__(self, source='0', registry=None):
+        self.registry = registry or metrics
+        self.labels = {'source': str(source)}
+        self.frames = self.registry.counter(
+            'detector_frames_total', '已推理的帧数', self.labels)
+        self.fps = self.registry.gauge(
+            'detector_fps', '最近的推理帧率', self.labels)
+        self.latency = self.registry.histogram(
+            'detector_inference_latency_seconds', '单次推理调用延迟（秒）', self.labels)
+        self.skipped = self.registry.counter(
+            'detector_inference_skipped_total', '运动门控等原因跳过推理的帧数', self.labels)
+        self.detections = self.registry.histogram(
+            'detector_detections_per_frame', '每帧检测到的目标数', self.labels,
+            buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+    
+    def observe_inference(self, seconds, detections_per_frame):
+        """
+        记录一次推理调用
+        
+        Args:
+            seconds: 推理耗时（秒），批量推理时为整批耗时
+            detections_per_frame: 每帧目标数列表
+        """
+        self.latency.observe(seconds)
+        self.frames.inc(len(detections_per_frame))
+        for count in detections_per_frame:
+            self.detections.observe(count)
+    
+    def dropped(self, queue_name):
+        """获取队列丢帧计数器"""
+        return self.registry.counter(
+            'detector_frames_dropped_total', '队列中被丢弃的过期帧数',
+            dict(self.labels, queue=queue_name))
+    
+    def queue_depth(self, queue_name):
+        """获取队列深度指标"""
+        return self.registry.gauge(
+            'detector_queue_depth', '阶段间队列当前深度',
+            dict(self.labels, queue=queue_name))
+
+
+def start_metrics_server(port=9108, host='127.0.0.1'):
+    """
+    启动本地指标抓取端点（后台线程），GET /metrics 返回Prometheus文本格式
+    
+    Args:
+        port: 监听端口
+        host: 监听地址，默认只监听本机
+    
+    Returns:
+        server: HTTP服务器实例，调用 shutdown() 停止
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            # 抓取请求不写入日志
+            pass
+    
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f'指标端点已启动: http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+运动门控模块
+对缩小后的灰度帧做帧差，画面静止时跳过推理、沿用上一次的检测结果
+"""
+
+import time
+
+import cv2
+
+
+class MotionGate:
+    """
+    运动门控
+
+    与最近一次推理时的参考帧比较，变化像素比例超过灵敏度阈值时才推理；
+    即使画面静止，每隔 refresh_interval 秒也会强制推理一次。
+    """
+
+    def __init__(self, sensitivity=0.01, refresh_interval=2.0, pixel_threshold=25, width=160):
+        """
+        Args:
+            sensitivity: 触发推理所需的变化像素比例，越小越灵敏
+            refresh_interval: 强制刷新间隔（秒）
+            pixel_threshold: 单个像素灰度变化超过该值才算变化
+            width: 帧差计算时缩放到的宽度
+        """
+        self.sensitivity = sensitivity
+        self.refresh_interval = refresh_interval
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+
+        self._reference = None
+        self._last_infer = 0.0
+        self.last_change = 0.0
+
+        # 统计计数
+        self.inferred = 0
+        self.skipped = 0
+
+    def _prepare(self, frame):
+        """缩小、转灰度并模糊，抑制传感器噪声"""
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def should_infer(self, frame):
+        """
+        判断当前帧是否需要推理
+
+        Args:
+            frame: BGR图像
+
+        Returns:
+            需要推理返回True，画面静止返回False
+        """
+        small = self._prepare(frame)
+        now = time.perf_counter()
+
+        if self._reference is None or self._reference.shape != small.shape:
+            changed = 1.0
+        else:
+            diff = cv2.absdiff(small, self._reference)
+            changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255,
+                                                     cv2.THRESH_BINARY)[1]) / diff.size
+        self.last_change = changed
+
+        if changed >= self.sensitivity or now - self._last_infer >= self.refresh_interval:
+            # 参考帧只在推理时更新，缓慢变化也会逐渐累积到阈值
+            self._reference = small
+            self._last_infer = now
+            self.inferred += 1
+            return True
+
+        self.skipped += 1
+        return False
+
+    @property
+    def skip_ratio(self):
+        """跳过推理的帧占比"""
+        total = self.inferred + self.skipped
+        return self.skipped / total if total else 0.0
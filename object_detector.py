@@ -1,49 +1,97 @@
 import cv2
-from ultralytics import YOLO
 import argparse
+import math
+import os
+import queue
+import threading
 import time
-from utils import COCO_CATEGORY_NAMES, draw_detection_result, calculate_fps
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from backends import BACKENDS, load_model as load_backend_model, model_hash, resolve_model, warmup
+from logger import DetectorMetrics, FrameEventLogger, setup_logging, start_metrics_server
+from pipeline import LatestQueue, StageThread, format_queue_stats
+from motion import MotionGate
+from tracker import TrackedDetector, draw_track_ids
+from tiling import MERGE_METHODS, detect_tiled
+from adaptive import AdaptiveController
+from result_cache import RAW_CONF, DetectionCache
+from sink import add_sink_arguments, sink_from_args
+from sharding import ShardedDetector, autotune
+from capture_service import open_capture, ring_name
+from utils import (COCO_CATEGORY_NAMES, Detections, draw_detection_result, calculate_fps, collect_image_paths,
+                   output_path_mapper, StartupTimer)
 
-def load_model(model_path):
-    """加载YOLOv8模型"""
+# 启动耗时记录（ultralytics在加载模型时才导入，计入"模型加载"）
+startup = StartupTimer()
+
+def report_startup(milestone):
+    """记录首个窗口/首次结果输出，并打印启动各阶段耗时"""
+    if milestone not in startup.marks:
+        startup.mark(milestone)
+        print(f"启动耗时: {startup.summary()}")
+
+def load_model(model_path, backend='torch', imgsz=320):
+    """加载YOLOv8模型并在推理尺寸上预热"""
     try:
-        print(f"正在加载模型: {model_path}")
+        print(f"正在加载模型: {model_path}（{backend} 后端）")
         print("如果是首次运行，模型将自动从Ultralytics服务器下载...")
-        model = YOLO(model_path)
-        print(f"✓ 成功加载模型: {model_path}")
+        model = load_backend_model(model_path, backend, imgsz)
+        startup.mark("模型加载")
+        warmup(model, imgsz)
+        startup.mark("预热完成")
+        print(f"✓ 成功加载模型: {model_path}（{startup.summary()}）")
         return model
     except Exception as e:
         print(f"✗ 加载模型失败: {e}")
         print("请确保网络连接正常，或者手动下载模型文件后重试。")
         exit(1)
 
-def detect_image(model, image_path, conf=0.5, imgsz=320):
-    """图片检测"""
+def detect_image(model, image_path, conf=0.5, imgsz=320, cache=None, tiling=None, sink=None):
+    """图片检测（tiling 为切片参数字典时按重叠切片推理，适合高分辨率图片中的小目标）"""
     print(f"\n=== 图片检测模式 ===")
     print(f"检测图片: {image_path}")
     print(f"置信度阈值: {conf}")
     print(f"推理尺寸: {imgsz}")
+    if tiling is not None:
+        print(f"切片推理: 边长 {tiling['tile_size']}，重叠 {tiling['overlap']:.0%}，"
+              f"每批 {tiling['batch_size']} 片，合并方式 {tiling['merge']}")
     
-    # 读取图片
-    img = cv2.imread(image_path)
-    if img is None:
+    # 读取图片（启用缓存时同时查询缓存）
+    entry = load_image_entry(image_path, cache)
+    if entry is None:
         print(f"✗ 无法读取图片: {image_path}")
         return
+    img, boxes, cache_key = entry
     
     # 记录开始时间
     start_time = time.time()
     
-    # 执行推理
-    results = model(img, conf=conf, imgsz=imgsz)
+    if tiling is not None:
+        timings = {}
+        boxes = detect_tiled(model, img, conf, imgsz, timings=timings, **tiling)
+        print(f"切片数: {timings['tiles']}，切分 {timings['tile'] * 1000:.1f}ms，"
+              f"推理 {timings['forward'] * 1000:.1f}ms，合并 {timings['merge'] * 1000:.1f}ms")
+    elif boxes is None:
+        # 执行推理；启用缓存时以低阈值推理，缓存原始结果
+        results = model(img, conf=RAW_CONF if cache is not None else conf, imgsz=imgsz)
+        boxes = Detections.from_boxes(results[0].boxes)
+        if cache is not None:
+            cache.put(cache_key, boxes)
+    else:
+        print("✓ 命中检测结果缓存，跳过推理")
+    startup.mark("首次检测")
     
     # 计算FPS
     fps, inference_time = calculate_fps(start_time)
     
     # 获取检测结果
-    boxes = results[0].boxes
+    boxes = boxes.filter_conf(conf)
+    if sink is not None:
+        sink.write(image_path, 0, boxes)
     
     # 绘制检测结果
-    annotated_img = draw_detection_result(img, boxes, COCO_CATEGORY_NAMES, conf)
+    annotated_img = draw_detection_result(img, boxes, COCO_CATEGORY_NAMES, conf, copy=False)
     
     # 添加FPS信息
     cv2.putText(annotated_img, f"FPS: {fps:.1f}", (10, 30), 
@@ -52,10 +100,11 @@ def detect_image(model, image_path, conf=0.5, imgsz=320):
     print(f"✓ 检测完成")
     print(f"推理时间: {inference_time:.3f}秒")
     print(f"FPS: {fps:.1f}")
-    print(f"检测到 {len(boxes)} 个目标")
+    print(f"检测到 {len(boxes)} 个目标")
     
     # 显示结果
     cv2.imshow("YOLOv8物品检测结果", annotated_img)
+    report_startup("首个窗口")
     print("\n按 'q' 退出，按任意其他键继续...")
     
     # 等待按键
@@ -66,112 +115,849 @@ def detect_image(model, image_path, conf=0.5, imgsz=320):
     
     cv2.destroyAllWindows()
 
-def detect_camera(model, camera_id=0, conf=0.5, imgsz=320):
-    """摄像头实时检测"""
+def load_image_entry(path, cache=None, decode=True):
+    """
+    读取一张图片；启用缓存时先按内容哈希查询缓存
+    
+    Args:
+        path: 图片路径
+        cache: DetectionCache实例，为None时不使用缓存
+        decode: 缓存命中时是否仍需解码（如需要绘制标注图片）
+    
+    Returns:
+        (图片或None, 缓存的检测数组或None, 缓存键或None)；读取失败返回None
+    """
+    if cache is None:
+        img = cv2.imread(path)
+        return None if img is None else (img, None, None)
+    
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    key = cache.key(data)
+    cached = cache.get(key)
+    
+    # 命中且不需要绘制时跳过解码
+    img = None
+    if cached is None or decode:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+    return img, cached, key
+
+def iter_image_batches(paths, batch_size=16, workers=4, load=cv2.imread):
+    """
+    使用线程池预取解码图片，按批次产出
+    
+    Args:
+        paths: 图片路径列表
+        batch_size: 每批图片数量
+        workers: 解码线程数
+        load: 读取函数，参数为路径，失败时返回None
+    
+    Yields:
+        (路径列表, 读取结果列表)，无法读取的图片会被跳过
+    """
+    # 预取窗口：最多同时解码 2 个批次，避免整个目录驻留内存
+    prefetch = batch_size * 2
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        next_idx = 0
+        batch_paths, batch_items = [], []
+        while pending or next_idx < len(paths):
+            # 补满预取窗口
+            while next_idx < len(paths) and len(pending) < prefetch:
+                path = paths[next_idx]
+                pending.append((path, pool.submit(load, path)))
+                next_idx += 1
+            
+            # 按提交顺序取回解码结果
+            path, future = pending.popleft()
+            item = future.result()
+            if item is None:
+                print(f"✗ 无法读取图片，已跳过: {path}")
+                continue
+            
+            batch_paths.append(path)
+            batch_items.append(item)
+            if len(batch_items) == batch_size:
+                yield batch_paths, batch_items
+                batch_paths, batch_items = [], []
+        
+        if batch_items:
+            yield batch_paths, batch_items
+
+def detect_batch(model, source, conf=0.5, imgsz=320, batch_size=16, workers=4,
+                 output_dir='runs/detect', save_images=False, cache=None, sink=None, sharded=None):
+    """批量图片检测（无界面；sharded 为 ShardedDetector 时在多个进程中分片推理）"""
+    print(f"\n=== 批量检测模式 ===")
+    print(f"检测源: {source}")
+    print(f"置信度阈值: {conf}")
+    print(f"推理尺寸: {imgsz}")
+    print(f"批次大小: {batch_size}")
+    print(f"解码线程: {workers}")
+    print(f"输出目录: {output_dir}")
+    print(f"结果缓存: {cache.cache_dir if cache else '关闭'}")
+    if sharded is not None:
+        print(f"分片推理: {sharded.workers} 进程 × {sharded.threads} 线程")
+    
+    paths = collect_image_paths(source)
+    if not paths:
+        print(f"✗ 未找到任何图片: {source}")
+        return
+    print(f"共 {len(paths)} 张图片")
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # 启用缓存时以低阈值推理并缓存原始结果，再按conf过滤
+    infer_conf = RAW_CONF if cache is not None else conf
+    
+    def load(path):
+        return load_image_entry(path, cache, decode=save_images)
+    
+    total_images = 0
+    total_boxes = 0
+    start_time = time.time()
+    metrics = DetectorMetrics(source)
+    
+    def local_batches():
+        for batch_paths, entries in iter_image_batches(paths, batch_size, workers, load):
+            detections = [cached for _, cached, _ in entries]
+            misses = [i for i, dets in enumerate(detections) if dets is None]
+            
+            if misses:
+                # 只对未命中缓存的图片做一次批量前向推理
+                infer_start = time.perf_counter()
+                results = model([entries[i][0] for i in misses], conf=infer_conf, imgsz=imgsz, verbose=False)
+                metrics.observe_inference(time.perf_counter() - infer_start,
+                                          [len(result.boxes) for result in results])
+                report_startup("首次检测")
+                for i, result in zip(misses, results):
+                    detections[i] = Detections.from_boxes(result.boxes)
+                    if cache is not None:
+                        cache.put(entries[i][2], detections[i])
+            yield batch_paths, [img for img, _, _ in entries], detections
+    
+    def sharded_batches():
+        # 工作进程自行解码图片，主进程只按顺序收集结果
+        chunks = (paths[i:i + batch_size] for i in range(0, len(paths), batch_size))
+        for batch_paths, elapsed, detections in sharded.map_path_batches(chunks):
+            readable = [i for i, dets in enumerate(detections) if dets is not None]
+            for i in set(range(len(batch_paths))) - set(readable):
+                print(f"✗ 无法读取图片，已跳过: {batch_paths[i]}")
+            metrics.observe_inference(elapsed, [len(detections[i]) for i in readable])
+            report_startup("首次检测")
+            yield ([batch_paths[i] for i in readable], [None] * len(readable),
+                   [detections[i] for i in readable])
+    
+    # 标注图片保留相对于所有输入公共目录的子目录结构，避免不同目录下的同名图片相互覆盖
+    output_path = output_path_mapper(paths, output_dir)
+    
+    def save_annotated(index, img, path, dets):
+        if img is None:
+            img = cv2.imread(path)
+        annotated_img = draw_detection_result(img, dets, COCO_CATEGORY_NAMES, conf, copy=False)
+        out_path = output_path(index, path)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        cv2.imwrite(out_path, annotated_img)
+    
+    # 标注图片的绘制和写盘交给线程池，不阻塞推理；
+    # 在途写盘任务数有上限，写盘跟不上时阻塞推理，而不是让解码后的图片在队列中堆积
+    write_slots = threading.BoundedSemaphore(workers * 2)
+    with ThreadPoolExecutor(max_workers=workers) as writer:
+        for batch_paths, images, detections in (sharded_batches() if sharded is not None
+                                                else local_batches()):
+            for path, img, dets in zip(batch_paths, images, detections):
+                dets = dets.filter_conf(conf)
+                if sink is not None:
+                    sink.write(path, total_images, dets)
+                total_images += 1
+                
+                if save_images:
+                    write_slots.acquire()
+                    writer.submit(save_annotated, total_images - 1, img, path, dets) \
+                        .add_done_callback(lambda _: write_slots.release())
+                
+                total_boxes += len(dets)
+            
+            elapsed = max(time.time() - start_time, 1e-6)
+            metrics.fps.set(total_images / elapsed)
+            print(f"已处理 {total_images}/{len(paths)} 张，"
+                  f"{total_images / elapsed:.1f} 张/秒")
+    
+    # 空输入或全部命中缓存时耗时可能为0
+    elapsed = max(time.time() - start_time, 1e-6)
+    print(f"✓ 批量检测完成")
+    print(f"处理图片: {total_images} 张")
+    print(f"检测到 {total_boxes} 个目标")
+    print(f"总耗时: {elapsed:.1f}秒，吞吐: {total_images / elapsed:.1f} 张/秒")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"缓存命中: {stats['hits']}，未命中: {stats['misses']}")
+
+def detect_video(model, source, conf=0.5, imgsz=320, stride=1, max_fps=None,
+                 batch_size=8, output_dir='runs/detect', tracked=None, sink=None, sharded=None):
+    """视频文件流式检测，逐帧写出标注视频和检测结果（sharded 为 ShardedDetector 时在多个进程中分片推理）"""
+    print(f"\n=== 视频检测模式 ===")
+    print(f"视频文件: {source}")
+    print(f"置信度阈值: {conf}")
+    print(f"推理尺寸: {imgsz}")
+    
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"✗ 无法打开视频: {source}")
+        return
+    
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    
+    # --max-fps 换算为跳帧步长，取与 --stride 中较大者
+    stride = max(1, stride)
+    if max_fps:
+        stride = max(stride, math.ceil(src_fps / max_fps))
+    out_fps = src_fps / stride
+    
+    print(f"源视频: {width}x{height} @ {src_fps:.1f}FPS，共 {total_frames} 帧")
+    print(f"跳帧步长: {stride}，输出帧率: {out_fps:.1f}")
+    if tracked is not None:
+        print(f"跟踪模式: 关键帧间隔上限 {tracked.scheduler.max_interval} 帧")
+    if sharded is not None:
+        print(f"分片推理: {sharded.workers} 进程 × {sharded.threads} 线程")
+    
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    video_path = os.path.join(output_dir, f"{stem}_annotated.mp4")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'),
+                             out_fps, (width, height))
+    
+    # 解码线程：跳过的帧只 grab 不解码，队列有界以限制内存
+    frame_queue = queue.Queue(maxsize=batch_size * 2)
+    stop_event = threading.Event()
+    
+    def decode_frames():
+        frame_idx = 0
+        while not stop_event.is_set():
+            if frame_idx % stride:
+                ok = cap.grab()
+                frame = None
+            else:
+                ok, frame = cap.read()
+            if not ok:
+                break
+            if frame is not None:
+                frame_queue.put((frame_idx, frame))
+            frame_idx += 1
+        frame_queue.put(None)
+    
+    decoder = threading.Thread(target=decode_frames, daemon=True)
+    decoder.start()
+    
+    processed = 0
+    total_boxes = 0
+    start_time = time.time()
+    metrics = DetectorMetrics(source)
+    if tracked is not None:
+        tracked.metrics = metrics
+    
+    def read_batches():
+        # 凑满一个批次（或到达视频末尾）
+        while True:
+            batch = []
+            while len(batch) < batch_size:
+                item = frame_queue.get()
+                if item is None:
+                    break
+                batch.append(item)
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                return
+    
+    def local_outputs():
+        for batch in read_batches():
+            if tracked is not None:
+                # 跟踪模式逐帧处理：只在关键帧上检测，其余帧由跟踪器外推
+                outputs = [tracked.process(frame) for _, frame in batch]
+            else:
+                infer_start = time.perf_counter()
+                results = model([frame for _, frame in batch], conf=conf, imgsz=imgsz, verbose=False)
+                metrics.observe_inference(time.perf_counter() - infer_start,
+                                          [len(result.boxes) for result in results])
+                outputs = [Detections.from_boxes(result.boxes) for result in results]
+            yield batch, outputs
+    
+    def sharded_outputs():
+        # 多个批次同时在各工作进程中推理，结果按帧序取回
+        for batch, elapsed, outputs in sharded.map_frame_batches(read_batches()):
+            metrics.observe_inference(elapsed, [len(dets) for dets in outputs])
+            yield batch, outputs
+    
+    try:
+        for batch, outputs in (sharded_outputs() if sharded is not None else local_outputs()):
+            report_startup("首次检测")
+            
+            for (frame_idx, frame), dets in zip(batch, outputs):
+                if sink is not None:
+                    # 时间戳为视频内时间
+                    sink.write(source, frame_idx, dets, frame_idx / src_fps)
+                
+                annotated_frame = draw_detection_result(frame, dets, COCO_CATEGORY_NAMES, conf, copy=False)
+                draw_track_ids(annotated_frame, dets)
+                writer.write(annotated_frame)
+                total_boxes += len(dets)
+            
+            processed += len(batch)
+            metrics.fps.set(processed / max(time.time() - start_time, 1e-6))
+            if processed % (batch_size * 25) < len(batch):
+                elapsed = max(time.time() - start_time, 1e-6)
+                position = batch[-1][0]
+                print(f"进度: {position}/{total_frames} 帧，处理 {processed / elapsed:.1f} 帧/秒，"
+                      f"相当于 {position / src_fps / elapsed:.1f}x 实时")
+    except KeyboardInterrupt:
+        print("\n检测被中断，保存已处理部分")
+    finally:
+        stop_event.set()
+        # 清空队列以便解码线程退出
+        while decoder.is_alive():
+            try:
+                frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        cap.release()
+        writer.release()
+    
+    elapsed = time.time() - start_time
+    print(f"✓ 视频检测完成")
+    print(f"处理帧数: {processed}，检测到 {total_boxes} 个目标")
+    if tracked is not None:
+        print(f"关键帧检测: {tracked.detections_run} 次，唯一目标数: {tracked.tracker.unique_count}")
+    print(f"总耗时: {elapsed:.1f}秒，吞吐: {processed / max(elapsed, 1e-6):.1f} 帧/秒")
+    print(f"标注视频: {video_path}")
+
+def detect_camera(model, camera_id=0, conf=0.5, imgsz=320, motion_gate=None, tracked=None,
+                  controller=None, sink=None, shared_capture=False):
+    """摄像头实时检测（采集 → 推理 → 渲染 三阶段流水线）"""
     print(f"\n=== 摄像头实时检测模式 ===")
     print(f"摄像头ID: {camera_id}")
+    if shared_capture:
+        print(f"共享采集: {ring_name(camera_id)}")
     print(f"置信度阈值: {conf}")
     print(f"推理尺寸: {imgsz}")
+    if motion_gate is not None:
+        print(f"运动门控: 灵敏度 {motion_gate.sensitivity}，强制刷新间隔 {motion_gate.refresh_interval}秒")
+    if tracked is not None:
+        print(f"跟踪模式: 关键帧间隔上限 {tracked.scheduler.max_interval} 帧")
+    if controller is not None:
+        print(f"自适应工作点: 延迟预算 {controller.budget * 1000:.0f}ms，可选尺寸 {controller.levels}")
     print("按 'q' 退出")
     
-    # 打开摄像头
-    cap = cv2.VideoCapture(camera_id)
+    # 打开摄像头（640x480）；共享采集时从采集服务的共享内存环形缓冲区读取，
+    # 帧要经过队列交给推理、渲染和异步跟踪线程，必须复制为独占副本
+    cap = open_capture(camera_id, shared=shared_capture, copy=True)
     if not cap.isOpened():
         print(f"✗ 无法打开摄像头: {camera_id}")
         return
     
-    # 设置摄像头分辨率
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    # 阶段间队列：深度为1，最新帧优先
+    capture_queue = LatestQueue(maxsize=1, name="capture")
+    render_queue = LatestQueue(maxsize=1, name="render")
+    stop_event = threading.Event()
     
     fps_history = []
+    counters = {'captured': 0, 'inferred': 0, 'last_frame': None, 'seen': 0}
+    metrics = DetectorMetrics(camera_id)
+    # 逐帧调试事件限速输出，另每10秒汇总一次
+    frame_log = FrameEventLogger(f"camera {camera_id}")
+    if tracked is not None:
+        tracked.metrics = metrics
+    capture_dropped = metrics.dropped(capture_queue.name)
+    render_dropped = metrics.dropped(render_queue.name)
+    last_boxes = [None]
     
-    while True:
-        # 读取一帧
+    def capture_step():
+        """采集阶段：持续读取摄像头，只保留最新一帧"""
         ret, frame = cap.read()
         if not ret:
             print("✗ 无法读取摄像头帧")
-            break
+            return False
+        counters['captured'] += 1
+        if capture_queue.put((counters['captured'], frame)):
+            capture_dropped.inc()
+    
+    def infer_step():
+        """推理阶段：总是对最新采集到的帧推理"""
+        item = capture_queue.get(timeout=0.1)
+        if item is None:
+            return
+        frame_id, frame = item
+        
+        # 画面静止时跳过推理，沿用上一次的检测结果
+        if motion_gate is not None and last_boxes[0] is not None \
+                and not motion_gate.should_infer(frame):
+            metrics.skipped.inc()
+            frame_log.event("帧 %d 画面静止，跳过推理", frame_id)
+            if render_queue.put((frame_id, frame, last_boxes[0])):
+                render_dropped.inc()
+            return
+        
+        if tracked is not None:
+            # 跟踪模式：检测在后台线程按关键帧执行，本阶段逐帧外推，FPS按处理帧间隔计算
+            boxes = tracked.process(frame)
+            now = time.time()
+            if counters['last_frame'] is not None and now > counters['last_frame']:
+                fps_history.append(1 / (now - counters['last_frame']))
+                if len(fps_history) > 10:
+                    fps_history.pop(0)
+            counters['last_frame'] = now
+            counters['inferred'] = tracked.detections_run
+            if tracked.detections_run:
+                startup.mark("首次检测")
+            last_boxes[0] = boxes
+            frame_log.event("帧 %d 跟踪 %d 个目标，关键帧间隔 %d", frame_id, len(boxes),
+                            tracked.scheduler.interval)
+            frame_log.observe("目标数", len(boxes))
+            if sink is not None:
+                sink.write(camera_id, frame_id, boxes, now)
+            if render_queue.put((frame_id, frame, boxes)):
+                render_dropped.inc()
+            return
+        
+        # 自适应跳帧：每 stride 帧推理一次，其余帧沿用上一次的检测结果
+        counters['seen'] += 1
+        if controller is not None and controller.stride > 1 and last_boxes[0] is not None \
+                and counters['seen'] % controller.stride:
+            metrics.skipped.inc()
+            frame_log.event("帧 %d 按步长 %d 跳过推理", frame_id, controller.stride)
+            if render_queue.put((frame_id, frame, last_boxes[0])):
+                render_dropped.inc()
+            return
         
         # 记录开始时间
         start_time = time.time()
         
         # 执行推理
-        results = model(frame, conf=conf, imgsz=imgsz)
+        infer_imgsz = controller.imgsz if controller is not None else imgsz
+        results = model(frame, conf=conf, imgsz=infer_imgsz, verbose=False)
         
         # 计算推理时间
         inference_time = time.time() - start_time
-        fps = 1 / inference_time
+        fps = 1 / inference_time if inference_time > 0 else 0
         fps_history.append(fps)
+        counters['inferred'] += 1
+        startup.mark("首次检测")
         
         # 保持FPS历史长度为10
         if len(fps_history) > 10:
             fps_history.pop(0)
         
-        # 计算平均FPS
-        avg_fps = sum(fps_history) / len(fps_history)
-        
-        # 复制原始帧用于自定义可视化
-        annotated_frame = frame.copy()
+        # 按滚动延迟切换工作点，旧工作点下的帧率不再参与统计
+        if controller is not None and controller.update(fps_history):
+            fps_history.clear()
+            print(f"自适应切换: {controller.describe()}（最近平均推理 {controller.last_latency * 1000:.0f}ms，"
+                  f"预算 {controller.budget * 1000:.0f}ms）")
         
-        # 获取检测结果
-        boxes = results[0].boxes
-        
-        # 自定义可视化
-        for box in boxes:
-            # 获取边界框坐标
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        boxes = Detections.from_boxes(results[0].boxes)
+        last_boxes[0] = boxes
+        metrics.observe_inference(inference_time, [len(boxes)])
+        frame_log.event("帧 %d 推理 %.1fms，imgsz %d，%d 个目标", frame_id, inference_time * 1000,
+                        infer_imgsz, len(boxes))
+        frame_log.observe("推理ms", inference_time * 1000)
+        frame_log.observe("目标数", len(boxes))
+        # 只记录实际推理的帧，沿用的结果不重复写出
+        if sink is not None:
+            sink.write(camera_id, frame_id, boxes, start_time)
+        if render_queue.put((frame_id, frame, boxes)):
+            render_dropped.inc()
+    
+    capture_thread = StageThread("capture", capture_step, stop_event)
+    infer_thread = StageThread("infer", infer_step, stop_event)
+    capture_thread.start()
+    infer_thread.start()
+    
+    # 渲染阶段在主线程执行（OpenCV窗口需要在主线程中刷新）
+    while not stop_event.is_set():
+        item = render_queue.get(timeout=0.05)
+        if item is not None:
+            frame_id, frame, boxes = item
             
-            # 获取置信度和类别ID
-            conf = box.conf[0].item()
-            cls_id = int(box.cls[0].item())
+            # 计算平均FPS
+            avg_fps = sum(fps_history) / len(fps_history) if fps_history else 0
+            metrics.fps.set(avg_fps)
+            for q in (capture_queue, render_queue):
+                metrics.queue_depth(q.name).set(q.depth)
             
-            # 只显示COCO数据集的80个物品类别
-            if cls_id in CATEGORY_NAMES:
-                # 获取类别名称
-                cls_name = CATEGORY_NAMES[cls_id]
-                
-                # 绘制边界框
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # 绘制类别名称和置信度
-                label = f"{cls_name}: {conf:.2f}"
-                cv2.putText(annotated_frame, label, (x1, y1 - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        
-        # 添加FPS信息
-        cv2.putText(annotated_frame, f"FPS: {avg_fps:.1f}", (10, 30), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        
-        # 显示结果
-        cv2.imshow("YOLOv8物品实时检测", annotated_frame)
+            # 绘制检测结果
+            annotated_frame = draw_detection_result(frame, boxes, COCO_CATEGORY_NAMES, conf, copy=False)
+            draw_track_ids(annotated_frame, boxes)
+            
+            # 添加FPS和队列信息
+            cv2.putText(annotated_frame, f"FPS: {avg_fps:.1f}", (10, 30), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            cv2.putText(annotated_frame, format_queue_stats([capture_queue, render_queue]), 
+                        (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+            if motion_gate is not None:
+                cv2.putText(annotated_frame, f"skipped: {motion_gate.skipped} ({motion_gate.skip_ratio:.0%})", 
+                            (10, 75), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+            if tracked is not None:
+                cv2.putText(annotated_frame, f"keyframe: 1/{tracked.scheduler.interval}  "
+                            f"unique: {tracked.tracker.unique_count}", 
+                            (10, 95), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+            if controller is not None:
+                cv2.putText(annotated_frame, f"auto: {controller.describe()}  "
+                            f"budget: {controller.budget * 1000:.0f}ms", 
+                            (10, 115), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+            
+            # 显示结果
+            cv2.imshow("YOLOv8物品实时检测", annotated_frame)
+            report_startup("首个窗口")
         
         # 按q退出
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
     
-    # 释放资源
+    # 停止流水线并释放资源
+    stop_event.set()
+    capture_queue.close()
+    render_queue.close()
+    capture_thread.join(timeout=2)
+    infer_thread.join(timeout=2)
+    for thread in (capture_thread, infer_thread):
+        if thread.error:
+            print(f"✗ {thread.name} 阶段异常: {thread.error}")
+    if tracked is not None:
+        tracked.close()
     cap.release()
     cv2.destroyAllWindows()
+    
+    print(f"采集帧数: {counters['captured']}，推理帧数: {counters['inferred']}")
+    if shared_capture:
+        metrics.dropped("shared").inc(cap.overwritten)
+        print(f"共享采集跳过的过期帧: {cap.skipped}，被覆盖丢弃: {cap.overwritten}")
+    if tracked is not None:
+        print(f"跟踪外推帧数: {tracked.skipped}，唯一目标数: {tracked.tracker.unique_count}")
+    if controller is not None:
+        print(f"自适应工作点: 切换 {controller.changes} 次，最终 {controller.describe()}")
+    if motion_gate is not None:
+        print(f"运动门控跳过推理: {motion_gate.skipped} 帧（{motion_gate.skip_ratio:.0%}）")
+    for q in (capture_queue, render_queue):
+        stats = q.stats()
+        print(f"队列 {stats['name']}: 入队 {stats['put']}，出队 {stats['get']}，丢弃 {stats['dropped']}")
     print("✓ 摄像头检测已退出")
 
+def parse_camera_source(value):
+    """摄像头ID转为整数，URL或设备路径保持字符串"""
+    value = value.strip()
+    return int(value) if value.isdigit() else value
+
+def detect_multi_camera(model, sources, conf=0.5, imgsz=320, batched=True, sink=None, shared_capture=False):
+    """多路摄像头检测：共享一个模型，各路最新帧合并为一个批次推理"""
+    print(f"\n=== 多路摄像头检测模式 ===")
+    print(f"检测源: {', '.join(str(src) for src in sources)}")
+    print(f"置信度阈值: {conf}")
+    print(f"推理尺寸: {imgsz}")
+    print("按 'q' 退出")
+    
+    # 打开所有摄像头；共享采集时各路分别连接自己的采集服务，帧要跨线程传递，读取为独占副本
+    caps = []
+    for src in sources:
+        cap = open_capture(src, shared=shared_capture, copy=True)
+        if not cap.isOpened():
+            print(f"✗ 无法打开摄像头: {src}")
+            for opened in caps:
+                opened.release()
+            return
+        caps.append(cap)
+    
+    stop_event = threading.Event()
+    streams = []
+    for idx, (src, cap) in enumerate(zip(sources, caps)):
+        metrics = DetectorMetrics(src)
+        render_queue = LatestQueue(maxsize=1, name=f"cam{idx}-render")
+        streams.append({
+            'name': f"cam{idx}",
+            'source': src,
+            'cap': cap,
+            'capture_queue': LatestQueue(maxsize=1, name=f"cam{idx}"),
+            'render_queue': render_queue,
+            'metrics': metrics,
+            'render_dropped': metrics.dropped(render_queue.name),
+            'infer_times': deque(maxlen=30),
+            'lag_ms': 0.0,
+            'captured': 0,
+            'inferred': 0,
+        })
+    
+    def make_capture_step(stream):
+        """每路一个采集线程，只保留最新一帧"""
+        dropped = stream['metrics'].dropped(stream['capture_queue'].name)
+        
+        def capture_step():
+            ret, frame = stream['cap'].read()
+            if not ret:
+                print(f"✗ 无法读取摄像头帧: {stream['source']}")
+                return False
+            stream['captured'] += 1
+            # 单调时钟用于计算延迟，墙上时间作为写出结果的帧时间戳
+            if stream['capture_queue'].put((stream['captured'], time.perf_counter(), time.time(), frame)):
+                dropped.inc()
+        return capture_step
+    
+    frame_log = FrameEventLogger("multi")
+    
+    def infer_step():
+        """收集各路的最新帧，合并为一个批次推理后按路分发结果"""
+        batch = []
+        for stream in streams:
+            item = stream['capture_queue'].get(timeout=0)
+            if item is not None:
+                batch.append((stream, item))
+        if not batch:
+            time.sleep(0.002)
+            return
+        
+        frames = [frame for _, (_, _, _, frame) in batch]
+        start_time = time.perf_counter()
+        if batched:
+            results = model(frames, conf=conf, imgsz=imgsz, verbose=False)
+        else:
+            results = [model(frame, conf=conf, imgsz=imgsz, verbose=False)[0] for frame in frames]
+        done_time = time.perf_counter()
+        startup.mark("首次检测")
+        frame_log.event("批次 %d 路，推理 %.1fms", len(batch), (done_time - start_time) * 1000)
+        frame_log.observe("批大小", len(batch))
+        frame_log.observe("推理ms", (done_time - start_time) * 1000)
+        
+        for (stream, (frame_id, captured_at, captured_wall, frame)), result in zip(batch, results):
+            boxes = Detections.from_boxes(result.boxes)
+            stream['inferred'] += 1
+            stream['infer_times'].append(done_time)
+            stream['lag_ms'] = (done_time - captured_at) * 1000
+            frame_log.observe(f"{stream['name']}延迟ms", stream['lag_ms'])
+            stream['metrics'].observe_inference(done_time - start_time, [len(boxes)])
+            if sink is not None:
+                sink.write(stream['source'], frame_id, boxes, captured_wall)
+            if stream['render_queue'].put((frame_id, frame, boxes)):
+                stream['render_dropped'].inc()
+    
+    threads = [StageThread(f"capture-{stream['name']}", make_capture_step(stream), stop_event)
+               for stream in streams]
+    threads.append(StageThread("infer", infer_step, stop_event))
+    for thread in threads:
+        thread.start()
+    
+    # 主线程渲染：各路最新结果拼接为网格显示
+    tile_size = (480, 360)
+    cols = math.ceil(math.sqrt(len(streams)))
+    rows = math.ceil(len(streams) / cols)
+    tiles = [np.zeros((tile_size[1], tile_size[0], 3), dtype=np.uint8) for _ in range(rows * cols)]
+    
+    while not stop_event.is_set():
+        updated = False
+        for idx, stream in enumerate(streams):
+            item = stream['render_queue'].get(timeout=0)
+            if item is None:
+                continue
+            frame_id, frame, boxes = item
+            annotated_frame = draw_detection_result(frame, boxes, COCO_CATEGORY_NAMES, conf, copy=False)
+            
+            # 每路的FPS和延迟
+            times = stream['infer_times']
+            fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0
+            stream['metrics'].fps.set(fps)
+            tile = cv2.resize(annotated_frame, tile_size, interpolation=cv2.INTER_AREA)
+            cv2.putText(tile, f"{stream['name']} FPS: {fps:.1f} lag: {stream['lag_ms']:.0f}ms", 
+                        (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            tiles[idx] = tile
+            updated = True
+        
+        if updated:
+            grid = np.vstack([np.hstack(tiles[r * cols:(r + 1) * cols]) for r in range(rows)])
+            cv2.imshow("YOLOv8多路实时检测", grid)
+            report_startup("首个窗口")
+        
+        # 按q退出
+        if cv2.waitKey(5) & 0xFF == ord('q'):
+            break
+    
+    # 停止流水线并释放资源
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=2)
+        if thread.error:
+            print(f"✗ {thread.name} 阶段异常: {thread.error}")
+    for cap in caps:
+        cap.release()
+    cv2.destroyAllWindows()
+    
+    for stream in streams:
+        print(f"{stream['name']} ({stream['source']}): 采集 {stream['captured']} 帧，"
+              f"推理 {stream['inferred']} 帧，丢弃 {stream['capture_queue'].drop_count} 帧，"
+              f"渲染丢弃 {stream['render_queue'].drop_count} 帧，最近延迟 {stream['lag_ms']:.0f}ms")
+        if shared_capture:
+            overwritten = stream['cap'].overwritten
+            stream['metrics'].dropped("shared").inc(overwritten)
+            print(f"{stream['name']} 共享采集被覆盖丢弃 {overwritten} 帧")
+    print("✓ 多路摄像头检测已退出")
+
+def sample_images(args, count):
+    """自动调优使用的样本：batch模式取前count张图片，video模式取前count帧"""
+    if args.mode == 'batch':
+        images = [cv2.imread(path) for path in collect_image_paths(args.source)[:count]]
+    else:
+        images = []
+        cap = cv2.VideoCapture(args.source)
+        while len(images) < count:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            images.append(frame)
+        cap.release()
+    return [img for img in images if img is not None]
+
+def create_sharded(args):
+    """按 --shards/--shard-threads 或自动调优的结果创建多进程分片检测器"""
+    # 导出模型为静态batch=1，每个任务只放一张图
+    batch_size = args.batch_size if args.backend == 'torch' else 1
+    if args.autotune:
+        images = sample_images(args, args.autotune_images)
+        if not images:
+            print(f"✗ 无法读取自动调优样本: {args.source}")
+            return None
+        print(f"\n=== 自动调优：{len(images)} 张样本，CPU核数 {os.cpu_count()} ===")
+        (workers, threads), _ = autotune(args.model, images, args.backend, args.imgsz,
+                                         args.conf, batch_size)
+        print(f"✓ 自动调优选择: {workers} 进程 × {threads} 线程")
+    else:
+        workers = args.shards
+        threads = args.shard_threads or max(1, (os.cpu_count() or 1) // workers)
+    return ShardedDetector(args.model, args.backend, args.imgsz, args.conf, workers, threads)
+
+def run_mode(model, args, cache=None, tiling=None, sink=None, sharded=None):
+    """根据模式执行检测"""
+    if args.mode == 'image':
+        detect_image(model, args.source, args.conf, args.imgsz, cache, tiling, sink)
+    elif args.mode == 'batch':
+        detect_batch(model, args.source, args.conf, args.imgsz, args.batch_size,
+                     args.workers, args.output, args.save_images, cache, sink, sharded)
+    elif args.mode == 'video':
+        tracked = None
+        if args.track:
+            # 离线视频使用同步检测，结果与帧严格对应
+            tracked = TrackedDetector(model, args.conf, args.imgsz, args.keyframe_interval,
+                                      asynchronous=False)
+        detect_video(model, args.source, args.conf, args.imgsz, args.stride,
+                     args.max_fps, args.batch_size, args.output, tracked, sink, sharded)
+    elif args.mode == 'multi':
+        sources = [parse_camera_source(src) for src in args.source.split(',') if src.strip()]
+        # 导出模型为静态batch=1，只能逐帧推理
+        detect_multi_camera(model, sources, args.conf, args.imgsz, batched=args.backend == 'torch', sink=sink,
+                            shared_capture=args.shared_capture)
+    else:  # camera模式
+        # 转换摄像头ID为整数（URL保持不变）
+        camera_id = parse_camera_source(args.source)
+        motion_gate = None
+        if args.motion_gate:
+            motion_gate = MotionGate(args.motion_sensitivity, args.motion_refresh)
+        tracked = None
+        if args.track:
+            tracked = TrackedDetector(model, args.conf, args.imgsz, args.keyframe_interval)
+        controller = None
+        if args.target_fps or args.max_latency_ms:
+            if tracked is not None:
+                print("跟踪模式下检测不在逐帧路径上，不启用自适应工作点")
+            else:
+                # 导出模型的输入尺寸固定，只能调整跳帧步长
+                controller = AdaptiveController(args.imgsz, args.target_fps, args.max_latency_ms,
+                                                adjust_imgsz=args.backend == 'torch')
+        detect_camera(model, camera_id, args.conf, args.imgsz, motion_gate, tracked, controller, sink,
+                      args.shared_capture)
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='YOLOv8物品检测智能识别工具')
     parser.add_argument('--model', type=str, default='yolov8n.pt', 
                         help='模型路径，默认使用yolov8n预训练模型')
     parser.add_argument('--mode', type=str, default='camera', 
-                        choices=['image', 'camera'], 
-                        help='运行模式: image(图片检测) 或 camera(摄像头检测)')
+                        choices=['image', 'camera', 'batch', 'video', 'multi'], 
+                        help='运行模式: image(图片检测)、camera(摄像头检测)、batch(批量检测)、video(视频文件检测) 或 multi(多路摄像头检测)')
     parser.add_argument('--source', type=str, default='0', 
-                        help='检测源: 图片路径或摄像头ID')
+                        help='检测源: 图片路径、摄像头ID/URL、视频文件，batch模式下为目录、glob通配符或列表文件，multi模式下为逗号分隔的摄像头ID/URL列表')
     parser.add_argument('--conf', type=float, default=0.5, 
                         help='置信度阈值，默认0.5')
     parser.add_argument('--imgsz', type=int, default=320, 
                         help='推理尺寸，默认320')
+    parser.add_argument('--backend', type=str, default='torch', choices=BACKENDS, 
+                        help='推理后端: torch、onnx 或 openvino，默认torch')
+    parser.add_argument('--log-dir', type=str, default='logs', 
+                        help='日志目录，按日期命名、超出大小后轮转，默认logs')
+    parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING'], 
+                        help='日志级别，DEBUG时输出限速的逐帧事件，默认INFO')
+    parser.add_argument('--metrics-port', type=int, default=0, 
+                        help='本地Prometheus指标端口（仅监听127.0.0.1），默认0表示不启动')
+    parser.add_argument('--shared-capture', action='store_true', 
+                        help='camera/multi模式通过共享内存采集服务读取摄像头，录像、GUI等其他进程可同时使用同一摄像头；'
+                             '服务未运行时自动启动（也可单独运行 capture_service.py）')
+    parser.add_argument('--motion-gate', action='store_true', 
+                        help='camera模式启用运动门控，画面静止时跳过推理')
+    parser.add_argument('--motion-sensitivity', type=float, default=0.01, 
+                        help='运动门控灵敏度：触发推理所需的变化像素比例，默认0.01')
+    parser.add_argument('--motion-refresh', type=float, default=2.0, 
+                        help='运动门控强制刷新间隔（秒），默认2.0')
+    parser.add_argument('--track', action='store_true', 
+                        help='camera/video模式启用跟踪：只在关键帧上检测，帧间由跟踪器外推并分配稳定ID')
+    parser.add_argument('--keyframe-interval', type=int, default=10, 
+                        help='跟踪模式关键帧间隔上限（帧），按场景运动在1到该值之间自适应，默认10')
+    parser.add_argument('--no-cache', action='store_true', 
+                        help='image/batch模式不使用检测结果缓存')
+    parser.add_argument('--cache-dir', type=str, default='.cache/detections', 
+                        help='检测结果缓存目录，默认.cache/detections')
+    parser.add_argument('--cache-size-mb', type=int, default=512, 
+                        help='检测结果缓存容量上限（MB），超出按LRU淘汰，默认512')
+    parser.add_argument('--batch-size', type=int, default=16, 
+                        help='batch/video模式每批图片数量，默认16')
+    parser.add_argument('--workers', type=int, default=4, 
+                        help='batch模式解码/写盘线程数，默认4')
+    parser.add_argument('--output', type=str, default='runs/detect', 
+                        help='batch/video模式输出目录，默认runs/detect')
+    parser.add_argument('--save-images', action='store_true', 
+                        help='batch模式保存标注图片')
+    parser.add_argument('--save-results', action='store_true', 
+                        help='image/camera/multi模式也把检测结果写入--output目录（batch/video模式总是写出）')
+    parser.add_argument('--shards', type=int, default=0, 
+                        help='batch/video模式的推理进程数，每个进程各加载一次模型，默认0表示单进程')
+    parser.add_argument('--shard-threads', type=int, default=0, 
+                        help='每个推理进程的CPU线程数，默认0表示按CPU核数平分')
+    parser.add_argument('--autotune', action='store_true', 
+                        help='batch/video模式自动测量并选择吞吐最高的 进程数×线程数 组合')
+    parser.add_argument('--autotune-images', type=int, default=32, 
+                        help='自动调优使用的样本图片/帧数，默认32')
+    parser.add_argument('--stride', type=int, default=1, 
+                        help='video模式跳帧步长，每N帧检测1帧，默认1')
+    parser.add_argument('--max-fps', type=float, default=None, 
+                        help='video模式最大处理帧率，按源帧率换算为跳帧步长')
+    parser.add_argument('--tile', action='store_true', 
+                        help='image模式启用切片推理：切成重叠切片批量推理后合并，适合高分辨率图片中的小目标')
+    parser.add_argument('--tile-size', type=int, default=None, 
+                        help='切片边长（原图像素），默认与--imgsz相同，切片不经缩小直接推理')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, 
+                        help='相邻切片重叠比例，默认0.2')
+    parser.add_argument('--tile-batch', type=int, default=8, 
+                        help='每次前向推理的切片数，默认8（导出模型固定为1）')
+    parser.add_argument('--tile-merge', type=str, default='nms', choices=MERGE_METHODS, 
+                        help='切片接缝处重复框的合并方式: nms 或 wbf（加权框融合），默认nms')
+    parser.add_argument('--target-fps', type=float, default=None, 
+                        help='camera模式目标推理帧率，按滚动延迟自动切换imgsz和跳帧步长')
+    parser.add_argument('--max-latency-ms', type=float, default=None, 
+                        help='camera模式单帧推理延迟上限（毫秒），与--target-fps同时给出时取更严格者')
+    add_sink_arguments(parser)
     
     args = parser.parse_args()
+    # 已导出的模型按实际格式选择后端，输入尺寸固定，后续按非torch后端逐张推理、不切换尺寸
+    args.backend, args.imgsz = resolve_model(args.model, args.backend, args.imgsz)
     
     print("========================================")
     print("        YOLOv8物品检测智能识别工具        ")
@@ -181,18 +967,74 @@ def main():
     print(f"检测源: {args.source}")
     print(f"置信度阈值: {args.conf}")
     print(f"推理尺寸: {args.imgsz}")
+    print(f"推理后端: {args.backend}")
     print("========================================")
     
+    # 日志在后台线程写盘，检测循环中只入队
+    setup_logging(args.log_dir, args.log_level)
+    
+    # 启动指标抓取端点
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    
     # 加载模型
-    model = load_model(args.model)
+    model = load_model(args.model, args.backend, args.imgsz)
     
-    # 根据模式执行检测
-    if args.mode == 'image':
-        detect_image(model, args.source, args.conf, args.imgsz)
-    else:  # camera模式
-        # 转换摄像头ID为整数
-        camera_id = int(args.source)
-        detect_camera(model, camera_id, args.conf, args.imgsz)
+    # 检测结果缓存：低于缓存阈值下限的conf无法从缓存过滤，此时不使用缓存
+    # 切片推理的结果与整图推理不同，不使用检测结果缓存
+    tiling = None
+    if args.tile and args.mode == 'image':
+        tile_size = args.tile_size or args.imgsz
+        if tile_size > args.imgsz:
+            print(f"注意: 切片边长 {tile_size} 大于推理尺寸 {args.imgsz}，切片会先缩小 "
+                  f"{tile_size / args.imgsz:.1f} 倍再推理，小目标可能漏检；建议 --tile-size {args.imgsz}")
+        tiling = {
+            'tile_size': tile_size,
+            'overlap': args.tile_overlap,
+            # 导出模型为静态batch=1，只能逐片推理
+            'batch_size': args.tile_batch if args.backend == 'torch' else 1,
+            'merge': args.tile_merge,
+        }
+    
+    # 多进程分片推理：工作进程在主进程完成模型下载/导出之后启动
+    sharded = None
+    if args.mode in ('batch', 'video') and (args.shards or args.autotune):
+        if args.track:
+            print("跟踪模式需要逐帧顺序处理，不启用分片推理")
+        else:
+            try:
+                sharded = create_sharded(args)
+            except RuntimeError as e:
+                print(f"✗ {e}")
+                exit(1)
+    
+    # 分片推理时由工作进程直接解码推理，不使用检测结果缓存
+    cache = None
+    if args.mode in ('image', 'batch') and not args.no_cache and args.conf >= RAW_CONF and tiling is None \
+            and sharded is None:
+        weights_path = getattr(model, 'ckpt_path', None) or args.model
+        cache = DetectionCache(args.cache_dir, model_hash(weights_path), args.imgsz,
+                               args.backend, args.cache_size_mb * 1024 * 1024)
+    
+    # 检测结果输出：batch/video模式总是写出，其余模式按 --save-results
+    sink = None
+    if args.mode in ('batch', 'video') or args.save_results:
+        if args.mode == 'video':
+            name = f"{os.path.splitext(os.path.basename(args.source))[0]}_detections"
+        elif args.mode == 'batch':
+            name = 'detections'
+        else:
+            name = f"{args.mode}_detections"
+        sink = sink_from_args(args, os.path.join(args.output, name), COCO_CATEGORY_NAMES)
+    
+    try:
+        run_mode(model, args, cache, tiling, sink, sharded)
+    finally:
+        if sharded is not None:
+            sharded.close()
+        if sink is not None:
+            sink.close()
+            print(f"检测结果: {', '.join(sink.paths) if sink.paths else '无'}（共 {sink.rows_written} 行）")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
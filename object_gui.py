@@ -1,14 +1,23 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import cv2
 from PIL import Image, ImageTk
+import multiprocessing
+import os
+import queue
 import threading
-from ultralytics import YOLO
-from utils import COCO_CATEGORY_NAMES, draw_detection_result
+import time
+# 只导入轻量模块；ultralytics 在后台加载模型时才导入，cv2 在检测线程中才导入
+from backends import BACKENDS, load_model as load_backend_model, warmup
+from logger import DetectorMetrics, FrameEventLogger, get_logger, setup_logging
+from pipeline import LatestQueue
+from utils import COCO_CATEGORY_NAMES, Detections, draw_detection_result, StartupTimer
+
+logger = get_logger()
 
 class ObjectDetectorGUI:
-    def __init__(self, root):
+    def __init__(self, root, startup=None):
         self.root = root
+        self.startup = startup or StartupTimer()
         self.root.title("YOLOv8物品检测智能识别工具")
         self.root.geometry("800x600")
         self.root.resizable(True, True)
@@ -24,6 +33,33 @@ class ObjectDetectorGUI:
         self.img_size = 320
         self.detection_mode = "camera"
         self.image_path = ""
+        self.backend = "torch"
+        self.use_motion_gate = False
+        # 自适应推理尺寸：按目标帧率自动切换imgsz和跳帧步长
+        self.use_adaptive = False
+        self.target_fps = 15
+        # 检测结果写出到 runs/gui 目录
+        self.save_results = False
+        self.results_dir = "runs/gui"
+        self.sink = None
+        # 通过共享内存采集服务读取摄像头，可与命令行检测、录像等进程同时使用
+        self.use_shared_capture = False
+        # 当前已加载模型对应的 (后端, 推理尺寸)
+        self.loaded_key = None
+        # 模型加载状态：idle/loading/warming/ready/failed，由后台线程更新、主线程轮询
+        self.model_state = "idle"
+        self.model_error = None
+        self.start_after_load = False
+        
+        # 显示相关：检测线程把缩放好的最新帧放入单槽位，主线程通过after()取出显示
+        self.frame_slot = LatestQueue(maxsize=1, name="display")
+        self.ui_tasks = queue.SimpleQueue()
+        self.present_interval_ms = 10
+        self.canvas_size = (0, 0)
+        self._fit_key = None
+        self._fit = None
+        self.photo = None
+        self.image_item = None
         
         # 创建主框架
         self.main_frame = ttk.Frame(self.root, padding="10")
@@ -63,38 +99,127 @@ class ObjectDetectorGUI:
         ttk.Radiobutton(imgsz_frame, text="480x480", variable=self.imgsz_var, value=480).pack(side=tk.LEFT, padx=10)
         ttk.Radiobutton(imgsz_frame, text="640x640", variable=self.imgsz_var, value=640).pack(side=tk.LEFT, padx=10)
         
+        # 自适应推理尺寸：勾选后以所选尺寸为起点，按目标帧率自动切换
+        adaptive_frame = ttk.Frame(self.control_frame)
+        adaptive_frame.grid(row=2, column=2, padx=5, pady=5, sticky=tk.W)
+        self.adaptive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(adaptive_frame, text="自适应，目标FPS", variable=self.adaptive_var).pack(side=tk.LEFT)
+        self.target_fps_var = tk.IntVar(value=self.target_fps)
+        ttk.Spinbox(adaptive_frame, from_=1, to=60, width=4, textvariable=self.target_fps_var).pack(side=tk.LEFT, padx=5)
+        
+        # 推理后端
+        ttk.Label(self.control_frame, text="推理后端:").grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
+        self.backend_var = tk.StringVar(value="torch")
+        backend_frame = ttk.Frame(self.control_frame)
+        backend_frame.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        for backend in BACKENDS:
+            ttk.Radiobutton(backend_frame, text=backend, variable=self.backend_var, value=backend).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # 运动门控：画面静止时跳过推理；保存检测结果；共享采集
+        options_frame = ttk.Frame(self.control_frame)
+        options_frame.grid(row=3, column=2, padx=5, pady=5, sticky=tk.W)
+        self.motion_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="静止画面跳过推理", variable=self.motion_var).pack(side=tk.LEFT)
+        self.save_results_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="保存检测结果", variable=self.save_results_var).pack(side=tk.LEFT, padx=5)
+        self.shared_capture_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="共享采集", variable=self.shared_capture_var).pack(side=tk.LEFT)
+        
         # 开始/停止按钮
         self.start_btn = ttk.Button(self.control_frame, text="开始检测", command=self.start_detection)
-        self.start_btn.grid(row=3, column=0, padx=5, pady=10, sticky=tk.W)
+        self.start_btn.grid(row=4, column=0, padx=5, pady=10, sticky=tk.W)
         self.stop_btn = ttk.Button(self.control_frame, text="停止检测", command=self.stop_detection, state=tk.DISABLED)
-        self.stop_btn.grid(row=3, column=1, padx=5, pady=10, sticky=tk.W)
+        self.stop_btn.grid(row=4, column=1, padx=5, pady=10, sticky=tk.W)
         
         # 状态标签
         self.status_var = tk.StringVar(value="就绪")
         self.status_label = ttk.Label(self.control_frame, textvariable=self.status_var, foreground="green")
-        self.status_label.grid(row=3, column=2, padx=5, pady=10, sticky=tk.W)
+        self.status_label.grid(row=4, column=2, padx=5, pady=10, sticky=tk.W)
         
         # 创建结果显示区域
         self.result_frame = ttk.LabelFrame(self.main_frame, text="检测结果", padding="10")
         self.result_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         
         # 图像显示区域
-        self.canvas = tk.Canvas(self.result_frame, bg="black")
+        self.canvas = tk.Canvas(self.result_frame, bg="black", highlightthickness=0)
         self.canvas.pack(fill=tk.BOTH, expand=True)
+        # 缓存Canvas尺寸，避免每帧查询
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
+        
+        # 启动主线程显示循环
+        self.root.after(self.present_interval_ms, self.present_loop)
         
-        # 加载模型
+        # 窗口显示后再在后台加载模型，避免界面卡顿
+        self.root.after(0, self.on_window_shown)
+    
+    def on_window_shown(self):
+        """窗口首次显示"""
+        self.startup.mark("首个窗口")
+        logger.info(f"启动耗时: {self.startup.summary()}")
         self.load_model()
     
-    def load_model(self):
-        """加载YOLOv8模型"""
+    def load_model(self, start_after=False):
+        """在后台线程按当前选择的后端和推理尺寸加载并预热YOLOv8模型"""
+        if self.model_state in ("loading", "warming"):
+            return
+        backend = self.backend_var.get()
+        img_size = self.imgsz_var.get()
+        # torch后端的输入尺寸可变，切换尺寸时只需在新尺寸上重新预热，不必重新加载
+        rewarm = self.model is not None and self.loaded_key is not None \
+            and self.loaded_key[0] == backend == "torch"
+        self.model_state = "warming" if rewarm else "loading"
+        self.start_after_load = start_after
+        self.start_btn.config(state=tk.DISABLED)
+        self.status_var.set("正在预热模型..." if rewarm else "正在加载模型...")
+        
+        loader = threading.Thread(target=self._load_model_worker,
+                                  args=(backend, img_size, rewarm), daemon=True)
+        loader.start()
+        self.root.after(100, self._poll_model_state)
+    
+    def _load_model_worker(self, backend, img_size, rewarm=False):
+        """后台线程：加载模型（rewarm时沿用已加载的torch模型）并在所选推理尺寸上预热（不访问Tk控件）"""
         try:
+            if rewarm:
+                model = self.model
+            else:
+                model = load_backend_model("yolov8n.pt", backend, img_size)
+                self.startup.mark("模型加载")
+                self.model_state = "warming"
+            warmup(model, img_size)
+            self.startup.mark("预热完成")
+            self.model = model
+            self.loaded_key = (backend, img_size)
+            self.model_state = "ready"
+        except Exception as e:
+            self.model_error = e
+            self.model_state = "failed"
+    
+    def _poll_model_state(self):
+        """主线程轮询模型加载进度并更新界面"""
+        if self.model_state == "loading":
             self.status_var.set("正在加载模型...")
-            self.root.update()
-            self.model = YOLO("yolov8n.pt")
+        elif self.model_state == "warming":
+            self.status_var.set("正在预热模型...")
+        elif self.model_state == "ready":
             self.status_var.set("模型加载成功，就绪")
-        except Exception as e:
-            messagebox.showerror("错误", f"加载模型失败: {e}")
+            self.start_btn.config(state=tk.NORMAL)
+            logger.info(f"启动耗时: {self.startup.summary()}")
+            if self.start_after_load:
+                self.start_detection()
+            return
+        else:
+            self.start_btn.config(state=tk.NORMAL)
             self.status_var.set("模型加载失败")
+            messagebox.showerror("错误", f"加载模型失败: {self.model_error}")
+            return
+        self.root.after(100, self._poll_model_state)
+    
+    def mark_first_detection(self):
+        """记录首次检测完成时间"""
+        if "首次检测" not in self.startup.marks:
+            self.startup.mark("首次检测")
+            logger.info(f"启动耗时: {self.startup.summary()}")
     
     def on_mode_change(self):
         """检测模式改变时的处理"""
@@ -119,6 +244,10 @@ class ObjectDetectorGUI:
     
     def start_detection(self):
         """开始检测"""
+        if self.model_state in ("loading", "warming"):
+            self.status_var.set("模型加载中，请稍候...")
+            return
+        
         if not self.model:
             messagebox.showerror("错误", "模型未加载成功")
             return
@@ -127,16 +256,31 @@ class ObjectDetectorGUI:
             messagebox.showerror("错误", "请先选择图片")
             return
         
+        # 获取参数
+        self.conf_threshold = self.conf_var.get()
+        self.img_size = self.imgsz_var.get()
+        self.backend = self.backend_var.get()
+        self.use_motion_gate = self.motion_var.get()
+        self.use_adaptive = self.adaptive_var.get()
+        self.save_results = self.save_results_var.get()
+        self.use_shared_capture = self.shared_capture_var.get()
+        try:
+            self.target_fps = max(1, self.target_fps_var.get())
+        except tk.TclError:
+            self.target_fps_var.set(self.target_fps)
+        
+        # 导出模型的输入尺寸固定，切换后端或推理尺寸时需重新加载；torch后端切换尺寸时重新预热
+        if self.loaded_key != (self.backend, self.img_size):
+            # 加载（预热）完成后自动开始检测
+            self.load_model(start_after=True)
+            return
+        
         # 更新状态
         self.is_running = True
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.NORMAL)
         self.status_var.set("正在检测...")
         
-        # 获取参数
-        self.conf_threshold = self.conf_var.get()
-        self.img_size = self.imgsz_var.get()
-        
         # 启动检测线程
         self.detection_thread = threading.Thread(target=self.run_detection)
         self.detection_thread.daemon = True
@@ -145,7 +289,8 @@ class ObjectDetectorGUI:
     def stop_detection(self):
         """停止检测"""
         self.is_running = False
-        if self.cap:
+        # 共享采集的读取会在超时内自行返回，由检测线程释放，避免在读取中途断开共享内存
+        if self.cap and not getattr(self.cap, "shared", False):
             self.cap.release()
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
@@ -153,40 +298,109 @@ class ObjectDetectorGUI:
     
     def run_detection(self):
         """运行检测"""
-        if self.detection_mode == "camera":
-            self.run_camera_detection()
-        else:
-            self.run_image_detection()
+        sink = None
+        if self.save_results:
+            from sink import DetectionSink
+            
+            sink = DetectionSink(os.path.join(self.results_dir, f"{self.detection_mode}_detections"),
+                                 category_names=COCO_CATEGORY_NAMES)
+        # 关闭窗口时由 on_closing 确保写出
+        self.sink = sink
+        try:
+            if self.detection_mode == "camera":
+                self.run_camera_detection(sink)
+            else:
+                self.run_image_detection(sink)
+        finally:
+            if sink is not None:
+                sink.close()
+                self.sink = None
+                logger.info(f"检测结果已写入: {', '.join(sink.paths)}（共 {sink.rows_written} 行）")
     
-    def run_camera_detection(self):
+    def run_camera_detection(self, sink=None):
         """摄像头实时检测"""
-        self.cap = cv2.VideoCapture(0)
+        import cv2
+        from adaptive import AdaptiveController
+        from capture_service import open_capture
+        from motion import MotionGate
+        
+        # 打开摄像头（640x480），共享采集时零拷贝连接摄像头0的采集服务，
+        # 推理和绘制都在本线程完成，用完后确认帧未被覆盖
+        self.cap = open_capture(0, shared=self.use_shared_capture)
         if not self.cap.isOpened():
-            messagebox.showerror("错误", "无法打开摄像头")
-            self.stop_detection()
+            self.call_in_ui(self.report_error, "无法打开摄像头")
             return
         
-        # 设置摄像头分辨率
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        metrics = DetectorMetrics("gui")
+        shared_dropped = metrics.dropped("shared")
+        frame_log = FrameEventLogger("gui")
+        
+        motion_gate = MotionGate() if self.use_motion_gate else None
+        controller = None
+        if self.use_adaptive:
+            # 导出模型的输入尺寸固定，只能调整跳帧步长
+            controller = AdaptiveController(self.img_size, self.target_fps,
+                                            adjust_imgsz=self.backend == "torch")
+        fps_history = []
+        frame_count = 0
+        boxes = None
         
         while self.is_running:
             ret, frame = self.cap.read()
             if not ret:
                 break
+            frame_count += 1
             
-            # 执行推理
-            results = self.model(frame, conf=self.conf_threshold, imgsz=self.img_size)
-            
-            # 获取检测结果
-            boxes = results[0].boxes
+            if boxes is not None and motion_gate is not None and not motion_gate.should_infer(frame):
+                # 画面静止，沿用上一次的检测结果
+                metrics.skipped.inc()
+            elif boxes is not None and controller is not None and frame_count % controller.stride:
+                # 自适应跳帧，沿用上一次的检测结果
+                metrics.skipped.inc()
+            else:
+                # 执行推理
+                imgsz = controller.imgsz if controller is not None else self.img_size
+                start_time = time.perf_counter()
+                results = self.model(frame, conf=self.conf_threshold, imgsz=imgsz)
+                inference_time = time.perf_counter() - start_time
+                if self.use_shared_capture and not self.cap.confirm():
+                    # 推理期间槽位被采集服务覆盖，输入可能新旧混杂，丢弃该帧的结果
+                    shared_dropped.inc()
+                    continue
+                
+                # 获取检测结果
+                boxes = Detections.from_boxes(results[0].boxes)
+                metrics.observe_inference(inference_time, [len(boxes)])
+                self.mark_first_detection()
+                frame_log.event("帧 %d 推理 %.1fms，%d 个目标", frame_count, inference_time * 1000, len(boxes))
+                frame_log.observe("推理ms", inference_time * 1000)
+                frame_log.observe("目标数", len(boxes))
+                if sink is not None:
+                    sink.write(0, frame_count, boxes)
+                
+                if controller is not None:
+                    fps_history.append(1 / inference_time if inference_time > 0 else 0)
+                    if len(fps_history) > 10:
+                        fps_history.pop(0)
+                    if controller.update(fps_history):
+                        fps_history.clear()
+                        logger.info(f"自适应切换: {controller.describe()}（最近平均推理 "
+                                    f"{controller.last_latency * 1000:.0f}ms，预算 {controller.budget * 1000:.0f}ms）")
             
-            # 绘制检测结果
-            annotated_frame = draw_detection_result(frame, boxes, COCO_CATEGORY_NAMES, self.conf_threshold)
+            # 绘制检测结果（共享采集的帧位于共享内存，复制后再绘制）
+            annotated_frame = draw_detection_result(frame, boxes, COCO_CATEGORY_NAMES, self.conf_threshold,
+                                                    copy=self.use_shared_capture)
+            if self.use_shared_capture and not self.cap.confirm():
+                # 复制期间槽位被覆盖，不显示该帧
+                shared_dropped.inc()
+                continue
             
             # 显示FPS信息
             cv2.putText(annotated_frame, "YOLOv8物品检测", (10, 30), 
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            if controller is not None:
+                cv2.putText(annotated_frame, f"auto: {controller.describe()}", (10, 55), 
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
             
             # 转换为RGB格式并显示
             rgb_frame = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
@@ -194,72 +408,142 @@ class ObjectDetectorGUI:
         
         self.cap.release()
     
-    def run_image_detection(self):
+    def run_image_detection(self, sink=None):
         """图片检测"""
+        import cv2
+        
         # 读取图片
         img = cv2.imread(self.image_path)
         if img is None:
-            messagebox.showerror("错误", f"无法读取图片: {self.image_path}")
-            self.stop_detection()
+            self.call_in_ui(self.report_error, f"无法读取图片: {self.image_path}")
             return
         
         # 执行推理
         results = self.model(img, conf=self.conf_threshold, imgsz=self.img_size)
         
         # 获取检测结果
-        boxes = results[0].boxes
+        boxes = Detections.from_boxes(results[0].boxes)
+        self.mark_first_detection()
+        if sink is not None:
+            sink.write(self.image_path, 0, boxes)
         
         # 绘制检测结果
-        annotated_img = draw_detection_result(img, boxes, COCO_CATEGORY_NAMES, self.conf_threshold)
+        annotated_img = draw_detection_result(img, boxes, COCO_CATEGORY_NAMES, self.conf_threshold, copy=False)
         
         # 转换为RGB格式并显示
         rgb_img = cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB)
         self.display_image(rgb_img)
         
         # 停止检测
+        self.call_in_ui(self.stop_detection)
+    
+    def call_in_ui(self, func, *args):
+        """从检测线程安排在主线程中执行的界面操作"""
+        self.ui_tasks.put((func, args))
+    
+    def report_error(self, message):
+        """主线程：弹出错误并停止检测"""
+        messagebox.showerror("错误", message)
         self.stop_detection()
     
+    def on_canvas_configure(self, event):
+        """Canvas尺寸变化时更新缓存"""
+        self.canvas_size = (event.width, event.height)
+    
+    def fit_geometry(self, image_width, image_height):
+        """
+        计算保持宽高比缩放到Canvas的尺寸和居中位置
+        
+        只在Canvas尺寸或帧尺寸变化时重新计算
+        
+        Returns:
+            (新宽度, 新高度, x, y)
+        """
+        key = (self.canvas_size, image_width, image_height)
+        if key != self._fit_key:
+            canvas_width, canvas_height = self.canvas_size
+            if canvas_width <= 1 or canvas_height <= 1:
+                # Canvas尚未布局完成，按原尺寸显示
+                canvas_width, canvas_height = image_width, image_height
+            
+            img_ratio = image_width / image_height
+            canvas_ratio = canvas_width / canvas_height
+            if img_ratio > canvas_ratio:
+                # 图像更宽，以宽度为基准缩放
+                new_width = canvas_width
+                new_height = max(1, int(canvas_width / img_ratio))
+            else:
+                # 图像更高，以高度为基准缩放
+                new_height = canvas_height
+                new_width = max(1, int(canvas_height * img_ratio))
+            
+            # 居中显示图像
+            x = (canvas_width - new_width) // 2
+            y = (canvas_height - new_height) // 2
+            self._fit_key = key
+            self._fit = (new_width, new_height, x, y)
+        return self._fit
+    
     def display_image(self, image):
-        """在Canvas上显示图像"""
-        # 获取Canvas尺寸
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
+        """
+        提交一帧待显示的RGB图像（可在检测线程中调用）
         
-        # 调整图像大小以适应Canvas
-        img = Image.fromarray(image)
-        img_ratio = img.width / img.height
-        canvas_ratio = canvas_width / canvas_height
+        缩放在调用线程中完成，结果放入单槽位；主线程来不及显示的旧帧直接被覆盖
+        """
+        import cv2
+        
+        height, width = image.shape[:2]
+        new_width, new_height, x, y = self.fit_geometry(width, height)
+        if (new_width, new_height) != (width, height):
+            interpolation = cv2.INTER_AREA if new_width < width else cv2.INTER_LINEAR
+            image = cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+        self.frame_slot.put((image, x, y))
+    
+    def present_loop(self):
+        """主线程显示循环：执行界面任务并显示最新一帧"""
+        while True:
+            try:
+                func, args = self.ui_tasks.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
         
-        if img_ratio > canvas_ratio:
-            # 图像更宽，以宽度为基准缩放
-            new_width = canvas_width
-            new_height = int(canvas_width / img_ratio)
+        item = self.frame_slot.get(timeout=0)
+        if item is not None:
+            self.present_frame(*item)
+        self.root.after(self.present_interval_ms, self.present_loop)
+    
+    def present_frame(self, image, x, y):
+        """主线程：尺寸不变时原地更新PhotoImage，否则重建"""
+        img = Image.fromarray(image)
+        if self.photo is None or (self.photo.width(), self.photo.height()) != img.size:
+            self.photo = ImageTk.PhotoImage(img)
+            if self.image_item is None:
+                self.image_item = self.canvas.create_image(x, y, anchor=tk.NW, image=self.photo)
+            else:
+                self.canvas.itemconfig(self.image_item, image=self.photo)
         else:
-            # 图像更高，以高度为基准缩放
-            new_height = canvas_height
-            new_width = int(canvas_height * img_ratio)
-        
-        # 缩放图像
-        resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-        
-        # 转换为PhotoImage
-        self.photo = ImageTk.PhotoImage(resized_img)
-        
-        # 清除Canvas并显示新图像
-        self.canvas.delete("all")
-        # 居中显示图像
-        x = (canvas_width - new_width) // 2
-        y = (canvas_height - new_height) // 2
-        self.canvas.create_image(x, y, anchor=tk.NW, image=self.photo)
+            self.photo.paste(img)
+        self.canvas.coords(self.image_item, x, y)
     
     def on_closing(self):
         """关闭窗口时的处理"""
         if self.is_running:
             self.stop_detection()
+        # 检测线程是守护线程，窗口销毁后进程随即退出：先等它结束，再确保缓冲中的检测结果写出
+        if self.detection_thread is not None:
+            self.detection_thread.join(timeout=3)
+        sink = self.sink
+        if sink is not None:
+            sink.close()
         self.root.destroy()
 
 if __name__ == "__main__":
+    # 打包为可执行文件后，共享采集服务的子进程需要由此入口分派
+    multiprocessing.freeze_support()
+    startup = StartupTimer()
+    setup_logging()
     root = tk.Tk()
-    app = ObjectDetectorGUI(root)
+    app = ObjectDetectorGUI(root, startup)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+流水线工具模块
+包含阶段间的有界队列（最新帧优先丢弃策略）和阶段统计
+"""
+
+import threading
+from collections import deque
+
+
+class LatestQueue:
+    """
+    有界队列，队列满时丢弃最旧的元素
+
+    用于连接采集、推理、渲染等阶段，保证下游总是拿到最新的一帧，
+    上游永远不会因为下游慢而阻塞。
+    """
+
+    def __init__(self, maxsize=1, name="queue"):
+        self.name = name
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # 统计计数
+        self.put_count = 0
+        self.get_count = 0
+        self.drop_count = 0
+
+    def put(self, item):
+        """
+        放入元素，队列满时丢弃最旧的元素
+
+        Returns:
+            是否丢弃了旧元素
+        """
+        with self._cond:
+            dropped = len(self._items) >= self.maxsize
+            if dropped:
+                self._items.popleft()
+                self.drop_count += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        """
+        取出元素
+
+        Args:
+            timeout: 等待超时时间（秒），None表示一直等待
+
+        Returns:
+            队列中最旧的元素；超时或队列已关闭且为空时返回None
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            self.get_count += 1
+            return self._items.popleft()
+
+    def close(self):
+        """关闭队列，唤醒所有等待者"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def depth(self):
+        """当前队列深度"""
+        return len(self._items)
+
+    def stats(self):
+        """
+        获取队列统计
+
+        Returns:
+            包含深度、入队、出队、丢弃数量的字典
+        """
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'put': self.put_count,
+            'get': self.get_count,
+            'dropped': self.drop_count,
+        }
+
+
+class StageThread(threading.Thread):
+    """
+    流水线阶段线程
+
+    循环调用 step()，直到 stop_event 被设置或 step() 返回False
+    """
+
+    def __init__(self, name, step, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.step = step
+        self.stop_event = stop_event
+        self.iterations = 0
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                keep_going = self.step()
+                self.iterations += 1
+                if keep_going is False:
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            # 任一阶段退出时通知整条流水线停止
+            self.stop_event.set()
+
+
+def format_queue_stats(queues):
+    """
+    格式化队列统计信息，用于叠加显示和日志
+
+    Args:
+        queues: LatestQueue列表
+
+    Returns:
+        形如 "capture q=1 drop=3 | infer q=0 drop=0" 的字符串
+    """
+    return " | ".join(f"{q.name} q={q.depth} drop={q.drop_count}" for q in queues)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+检测结果缓存模块
+按（图片内容哈希, 模型哈希, 推理尺寸, 推理后端）缓存低阈值下的原始检测数组，
+修改置信度阈值时只重新过滤、不重新推理
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from utils import Detections
+
+# 缓存中保存的原始检测置信度下限；查询阈值不低于该值时都可直接从缓存过滤
+RAW_CONF = 0.05
+
+
+class DetectionCache:
+    """
+    磁盘检测结果缓存
+
+    每个条目是一个 (N, 6) float32 的 .npy 文件：x1, y1, x2, y2, conf, cls。
+    命中时更新文件修改时间，超出容量时按修改时间淘汰最久未使用的条目（LRU）。
+    可由多个解码线程共享：计数、占用统计和淘汰由同一把锁保护。
+    """
+
+    def __init__(self, cache_dir, model_hash, imgsz, backend='torch', max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 模型、推理尺寸、后端共同决定检测结果
+        self._salt = f"{model_hash}|{imgsz}|{backend}|{RAW_CONF}".encode('utf-8')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = self._scan_size()
+
+    def _scan_size(self):
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        return total
+
+    def key(self, image_bytes):
+        """
+        计算缓存键
+
+        Args:
+            image_bytes: 图片文件的原始字节
+
+        Returns:
+            十六进制键
+        """
+        sha = hashlib.sha256(self._salt)
+        sha.update(image_bytes)
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def get(self, key):
+        """
+        读取缓存
+
+        Returns:
+            Detections；未命中返回None
+        """
+        path = self._path(key)
+        try:
+            data = np.load(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        # 更新修改时间作为最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return Detections.from_packed(data)
+
+    def put(self, key, detections):
+        """
+        写入缓存（先写临时文件再原子替换）
+
+        Args:
+            key: 缓存键
+            detections: Detections
+        """
+        data = detections.packed()
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 临时文件名含线程ID，多个线程写入同一键时互不干扰
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+
+        # 替换、计入占用和淘汰在锁内完成，淘汰重新统计的占用不会与并发写入重复或遗漏
+        with self._lock:
+            try:
+                # 覆盖已有条目时先扣除旧文件的大小
+                self._size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+            self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def evict(self):
+        """按最近使用时间淘汰条目，直到占用降到容量的90%"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    # 其他线程正在写入的临时文件
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+    def stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            包含命中、未命中次数和占用字节数的字典
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes': self._size}
+
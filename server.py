@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+本地HTTP推理服务
+模型只加载一次，并发请求在等待窗口内合并为微批次推理（asyncio动态批处理），
+自带负载生成器用于本机压测
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, load_model, resolve_model, warmup
+from logger import get_logger, get_metrics, setup_logging
+from utils import Detections, load_category_names
+
+# 单个请求体上限
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+logger = get_logger()
+metrics = get_metrics()
+
+
+class QueueFullError(Exception):
+    """请求队列已满，需要客户端稍后重试"""
+
+
+class MicroBatcher:
+    """
+    动态微批处理器
+
+    请求进入有界队列；批处理协程取到第一个请求后，在 max_wait_ms 窗口内
+    继续收集，凑满 max_batch 或窗口到期即在推理线程中执行一次批量前向推理。
+    """
+
+    def __init__(self, model, conf=0.5, imgsz=320, max_batch=8, max_wait_ms=10,
+                 max_queue=64, batched=True):
+        self.model = model
+        self.conf = conf
+        self.imgsz = imgsz
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batched = batched
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # 批处理协程异常退出的原因；之后的请求直接失败，不再排队等到超时
+        self.error = None
+        self._batch = []
+        # 推理只在单个线程中串行执行
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='infer')
+
+        self.batch_size = metrics.histogram(
+            'server_batch_size', '每次推理的批次大小', buckets=(1, 2, 4, 8, 16, 32, 64))
+        self.infer_latency = metrics.histogram(
+            'server_inference_latency_seconds', '批量推理调用延迟（秒）')
+        self.queue_wait = metrics.histogram(
+            'server_queue_wait_seconds', '请求在队列中的等待时间（秒）')
+        self.queue_depth = metrics.gauge('server_queue_depth', '等待推理的请求数')
+
+    async def submit(self, image):
+        """
+        提交一张图片并等待检测结果
+
+        Raises:
+            QueueFullError: 队列已满（背压）
+            RuntimeError: 批处理协程已异常退出
+        """
+        if self.error is not None:
+            raise RuntimeError(f'批处理已停止: {self.error}')
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((image, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise QueueFullError()
+        self.queue_depth.set(self.queue.qsize())
+        return await future
+
+    def _infer(self, images):
+        if self.batched:
+            results = self.model(images, conf=self.conf, imgsz=self.imgsz, verbose=False)
+        else:
+            results = [self.model(img, conf=self.conf, imgsz=self.imgsz, verbose=False)[0]
+                       for img in images]
+        return [Detections.from_boxes(result.boxes) for result in results]
+
+    async def run(self):
+        """批处理主循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.queue_depth.set(self.queue.qsize())
+
+            # 已被客户端放弃的请求不再推理
+            batch = [item for item in batch if not item[1].done()]
+            self._batch = batch
+            if not batch:
+                continue
+
+            now = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self.queue_wait.observe(now - enqueued_at)
+            self.batch_size.observe(len(batch))
+
+            try:
+                detections = await loop.run_in_executor(
+                    self.executor, self._infer, [image for image, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.infer_latency.observe(time.perf_counter() - now)
+
+            for (_, future, _), result in zip(batch, detections):
+                if not future.done():
+                    future.set_result((result, len(batch)))
+            self._batch = []
+
+    def on_run_done(self, task):
+        """
+        批处理协程结束回调：异常退出时记录日志，并让在途和排队中的请求立即失败
+
+        Args:
+            task: 运行 run() 的 asyncio.Task
+        """
+        if task.cancelled() or task.exception() is None:
+            return
+        self.error = task.exception()
+        logger.error(f'批处理协程异常退出: {self.error!r}')
+        pending = [future for _, future, _ in self._batch]
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait()[1])
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError(f'批处理已停止: {self.error}'))
+        self._batch = []
+        self.queue_depth.set(0)
+
+
+class InferenceServer:
+    """基于asyncio的最小HTTP/1.1服务"""
+
+    def __init__(self, batcher, category_names, decode_workers=4):
+        self.batcher = batcher
+        self.category_names = category_names
+        self.decode_executor = ThreadPoolExecutor(max_workers=decode_workers,
+                                                  thread_name_prefix='decode')
+        self.request_latency = metrics.histogram(
+            'server_request_latency_seconds', '请求端到端延迟（秒）')
+
+    def _count(self, code):
+        metrics.counter('server_requests_total', '按状态码统计的请求数',
+                        {'code': str(code)}).inc()
+
+    async def handle(self, reader, writer):
+        """处理一个连接（支持keep-alive）"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'bad request line'}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+
+                keep_alive = (version == 'HTTP/1.1'
+                              and headers.get('connection', '').lower() != 'close')
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'bad content-length'}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': 'payload too large'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = await self.route(method, target, headers, body)
+                except Exception as e:
+                    logger.error(f'请求处理失败: {e}')
+                    status, payload = 500, {'error': str(e)}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
+        self._count(status)
+
+    async def route(self, method, target, headers, body):
+        """请求路由"""
+        url = urlsplit(target)
+        if url.path == '/metrics' and method == 'GET':
+            return 200, metrics.render_prometheus()
+        if url.path == '/health' and method == 'GET':
+            return 200, {'status': 'ok', 'queue': self.batcher.queue.qsize()}
+        if url.path != '/detect':
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        return await self.detect(url, headers, body)
+
+    async def detect(self, url, headers, body):
+        """POST /detect：请求体为原始图片字节或multipart表单中的图片文件"""
+        start = time.perf_counter()
+        # 支持按请求提高置信度阈值，只过滤不重新推理；参数先校验，非法时不占用推理
+        min_conf = None
+        query = parse_qs(url.query)
+        if 'conf' in query:
+            try:
+                min_conf = float(query['conf'][0])
+            except ValueError:
+                return 400, {'error': 'conf must be a number'}
+            if not 0 <= min_conf <= 1:
+                return 400, {'error': 'conf must be in [0, 1]'}
+
+        data = extract_image_bytes(headers.get('content-type', ''), body)
+        if not data:
+            return 400, {'error': 'empty body'}
+
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(
+            self.decode_executor,
+            lambda: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+        if image is None:
+            return 400, {'error': 'cannot decode image'}
+
+        try:
+            detections, batch_size = await self.batcher.submit(image)
+        except QueueFullError:
+            return 503, {'error': 'server busy, retry later'}
+        except Exception as e:
+            logger.error(f'推理失败: {e}')
+            return 500, {'error': str(e)}
+
+        if min_conf is not None:
+            detections = detections.filter_conf(min_conf)
+
+        # 整列转为float64取整、查表后再转为Python对象，避免逐框调用 float()/round()
+        detections = [
+            {
+                'class_id': k,
+                'class_name': name,
+                'confidence': c,
+                'box': b,
+            }
+            for b, c, k, name in zip(detections.xyxy.astype(np.float64).round(1).tolist(),
+                                     detections.conf.astype(np.float64).round(4).tolist(),
+                                     detections.cls.tolist(), detections.names(self.category_names).tolist())
+        ]
+        latency = time.perf_counter() - start
+        self.request_latency.observe(latency)
+        return 200, {
+            'detections': detections,
+            'image_size': [int(image.shape[1]), int(image.shape[0])],
+            'batch_size': batch_size,
+            'latency_ms': round(latency * 1000, 2),
+        }
+
+
+def extract_image_bytes(content_type, body):
+    """
+    从请求体中取出图片字节
+
+    Args:
+        content_type: Content-Type 请求头
+        body: 请求体
+
+    Returns:
+        图片字节；multipart请求取第一个文件字段
+    """
+    if not content_type.lower().startswith('multipart/form-data'):
+        return body
+    message = BytesParser(policy=default_policy).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    for part in message.iter_parts():
+        payload = part.get_payload(decode=True)
+        if payload:
+            return payload
+    return b''
+
+
+async def serve(args):
+    """加载模型、预热并启动服务"""
+    # 已导出的模型只能逐张推理，输入尺寸固定
+    args.backend, args.imgsz = resolve_model(args.model, args.backend, args.imgsz)
+    model = load_model(args.model, args.backend, args.imgsz)
+    # 预热，首个请求不承担图构建和内存分配开销
+    warmup(model, args.imgsz)
+
+    batcher = MicroBatcher(model, args.conf, args.imgsz, args.max_batch, args.max_wait_ms,
+                           args.max_queue, batched=args.backend == 'torch')
+    app = InferenceServer(batcher, load_category_names(args.names))
+    server = await asyncio.start_server(app.handle, args.host, args.port)
+    batch_task = asyncio.create_task(batcher.run())
+    batch_task.add_done_callback(batcher.on_run_done)
+
+    print(f"✓ 推理服务已启动: http://{args.host}:{args.port}/detect")
+    print(f"指标: http://{args.host}:{args.port}/metrics")
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            batch_task.cancel()
+
+
+def run_loadgen(args):
+    """
+    本机负载生成器：多线程并发POST图片，统计吞吐、延迟分位数和状态码
+    """
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            payload = f.read()
+    else:
+        img = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        payload = cv2.imencode('.jpg', img)[1].tobytes()
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            request = Request(args.url, data=payload, method='POST',
+                              headers={'Content-Type': 'application/octet-stream'})
+            start = time.perf_counter()
+            try:
+                with urlopen(request, timeout=30) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as e:
+                status = e.code
+            except OSError:
+                status = 'error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed * 1000)
+
+    print(f"压测: {args.url} 并发 {args.concurrency}，共 {args.requests} 个请求")
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"总耗时: {elapsed:.2f}秒，吞吐: {len(latencies) / elapsed:.1f} 请求/秒")
+    print(f"状态码: {statuses}")
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"延迟: p50 {p50:.1f}ms，p90 {p90:.1f}ms，p99 {p99:.1f}ms")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='YOLOv8物品检测HTTP推理服务')
+    parser.add_argument('--mode', type=str, default='serve', choices=['serve', 'loadgen'],
+                        help='运行模式: serve(启动服务) 或 loadgen(本机压测)')
+    parser.add_argument('--model', type=str, default='yolov8n.pt',
+                        help='模型路径，默认yolov8n预训练模型')
+    parser.add_argument('--backend', type=str, default='torch', choices=BACKENDS,
+                        help='推理后端，默认torch')
+    parser.add_argument('--names', type=str, default='coco',
+                        help='类别名称：coco 或数据集配置文件路径（如 object.yaml）')
+    parser.add_argument('--conf', type=float, default=0.5,
+                        help='置信度阈值，默认0.5')
+    parser.add_argument('--imgsz', type=int, default=320,
+                        help='推理尺寸，默认320')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='监听端口，默认8000')
+    parser.add_argument('--max-batch', type=int, default=8,
+                        help='微批次最大图片数，默认8')
+    parser.add_argument('--max-wait-ms', type=float, default=10,
+                        help='微批次收集等待窗口（毫秒），默认10')
+    parser.add_argument('--max-queue', type=int, default=64,
+                        help='最大排队请求数，超出返回503，默认64')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8000/detect',
+                        help='loadgen模式的目标地址')
+    parser.add_argument('--image', type=str, default=None,
+                        help='loadgen模式发送的图片，默认使用合成图片')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='loadgen模式并发数，默认16')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='loadgen模式请求总数，默认500')
+
+    args = parser.parse_args()
+
+    if args.mode == 'loadgen':
+        run_loadgen(args)
+        return
+
+    setup_logging()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("✓ 推理服务已停止")
+
+
+if __name__ == '__main__':
+    main()
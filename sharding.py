@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+多进程分片推理模块
+启动K个工作进程，每个进程按固定线程数加载一次模型，批次任务经进程池共享队列分发，
+结果按提交顺序合并；内置自动调优，在当前机器上选出吞吐最高的 进程数×线程数 组合
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+
+# 工作进程内的模型及推理参数，由 init_worker 初始化
+_worker = {}
+
+
+def init_worker(model_path, backend, imgsz, conf, threads, barrier=None):
+    """
+    进程池初始化：限制本进程的CPU线程数，加载并预热模型
+
+    初始化失败时不抛出异常（进程池会无限重启抛出异常的工作进程），
+    而是记录错误，由 check_worker 报告给主进程。
+
+    Args:
+        model_path: 权重路径（非torch后端应已在主进程导出过，避免多个进程同时导出）
+        backend: 推理后端
+        imgsz: 推理尺寸
+        conf: 置信度阈值
+        threads: 本进程的CPU线程数
+        barrier: 所有工作进程共享的栅栏，供 check_worker 让每个进程各领一个任务
+    """
+    _worker.update(barrier=barrier, error=None)
+    try:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        os.environ['MKL_NUM_THREADS'] = str(threads)
+        import cv2
+        import torch
+
+        from backends import load_model, warmup
+
+        torch.set_num_threads(threads)
+        cv2.setNumThreads(1)
+
+        model = load_model(model_path, backend, imgsz)
+        warmup(model, imgsz)
+        _worker.update(model=model, imgsz=imgsz, conf=conf, batched=backend == 'torch')
+    except Exception as e:
+        _worker['error'] = f"{type(e).__name__}: {e}"
+
+
+def check_worker(frames=None, timeout=60.0):
+    """
+    工作进程任务：报告初始化结果，可选地在样本上预热一次
+
+    先在栅栏处等待，直到每个工作进程都领到一个该任务，保证检查和预热覆盖所有进程。
+
+    Returns:
+        (进程号, 错误描述)，初始化成功时错误描述为None
+    """
+    barrier = _worker.get('barrier')
+    if barrier is not None:
+        try:
+            barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            return os.getpid(), "等待其他工作进程就绪超时"
+    if _worker.get('error'):
+        return os.getpid(), _worker['error']
+    if frames:
+        try:
+            _infer(frames)
+        except Exception as e:
+            return os.getpid(), f"预热失败: {type(e).__name__}: {e}"
+    return os.getpid(), None
+
+
+def _infer(images):
+    from utils import Detections
+
+    model = _worker['model']
+    kwargs = dict(conf=_worker['conf'], imgsz=_worker['imgsz'], verbose=False)
+    if _worker['batched']:
+        results = model(images, **kwargs)
+    else:
+        # 导出模型为静态batch=1，逐张推理
+        results = [model(img, **kwargs)[0] for img in images]
+    return [Detections.from_boxes(result.boxes) for result in results]
+
+
+def infer_frames(frames):
+    """
+    工作进程任务：对一批已解码的图像推理
+
+    Returns:
+        (推理耗时秒数, Detections列表)
+    """
+    start = time.perf_counter()
+    detections = _infer(frames)
+    return time.perf_counter() - start, detections
+
+
+def infer_paths(paths):
+    """
+    工作进程任务：读取并推理一批图片，解码也在工作进程中完成
+
+    Returns:
+        (推理耗时秒数, 与paths对应的Detections列表，无法读取的图片为None)
+    """
+    import cv2
+
+    images = [cv2.imread(path) for path in paths]
+    readable = [i for i, img in enumerate(images) if img is not None]
+    start = time.perf_counter()
+    detections = _infer([images[i] for i in readable]) if readable else []
+    elapsed = time.perf_counter() - start
+    merged = [None] * len(paths)
+    for i, dets in zip(readable, detections):
+        merged[i] = dets
+    return elapsed, merged
+
+
+class ShardedDetector:
+    """
+    多进程分片检测器
+
+    批次任务按顺序提交到进程池，同时在途的批次数限制为 进程数×prefetch，
+    主进程按提交顺序取回结果，输出顺序与输入一致，内存占用有界。
+    创建时等待所有工作进程加载完模型，任一进程初始化失败或超时则抛出 RuntimeError。
+    """
+
+    def __init__(self, model_path, backend='torch', imgsz=320, conf=0.5, workers=2, threads=1,
+                 prefetch=2, startup_timeout=300.0):
+        """
+        Args:
+            model_path: 权重路径
+            backend: 推理后端
+            imgsz: 推理尺寸
+            conf: 置信度阈值
+            workers: 工作进程数
+            threads: 每个进程的CPU线程数
+            prefetch: 每个进程的在途批次数
+            startup_timeout: 等待工作进程加载模型的最长秒数
+
+        Raises:
+            RuntimeError: 工作进程初始化失败或超时
+        """
+        self.workers = workers
+        self.threads = threads
+        self.max_in_flight = workers * prefetch
+        self.startup_timeout = startup_timeout
+        # spawn 启动的子进程不继承父进程的torch线程池状态，各自按线程预算初始化
+        ctx = multiprocessing.get_context('spawn')
+        self._pool = ctx.Pool(workers, initializer=init_worker,
+                              initargs=(model_path, backend, imgsz, conf, threads, ctx.Barrier(workers)))
+        self.check()
+
+    def check(self, frames=None):
+        """
+        确认每个工作进程都已加载模型，可选地让每个进程在样本上各预热一次
+
+        Args:
+            frames: 预热用的图像列表，None 表示只检查
+
+        Raises:
+            RuntimeError: 工作进程初始化失败或在 startup_timeout 内未就绪，此时进程池已终止
+        """
+        jobs = [self._pool.apply_async(check_worker, (frames, self.startup_timeout))
+                for _ in range(self.workers)]
+        deadline = time.monotonic() + self.startup_timeout
+        errors = []
+        try:
+            for job in jobs:
+                pid, error = job.get(max(deadline - time.monotonic(), 0))
+                if error:
+                    errors.append(f"进程 {pid}: {error}")
+        except multiprocessing.TimeoutError:
+            errors.append(f"{self.startup_timeout:.0f}秒内未全部就绪（工作进程可能在加载模型时崩溃）")
+        if errors:
+            self.terminate()
+            raise RuntimeError("分片推理工作进程启动失败: " + "；".join(errors))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _ordered(self, batches, task, payload):
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, self._pool.apply_async(task, (payload(batch),))))
+            if len(pending) >= self.max_in_flight:
+                batch, job = pending.popleft()
+                yield (batch, *job.get())
+        while pending:
+            batch, job = pending.popleft()
+            yield (batch, *job.get())
+
+    def map_frame_batches(self, batches):
+        """
+        对已解码的帧批次推理
+
+        Args:
+            batches: 可迭代对象，每项为 [(帧号, 图像), ...]
+
+        Yields:
+            (批次, 推理耗时秒数, Detections列表)，顺序与输入一致
+        """
+        return self._ordered(batches, infer_frames, lambda batch: [frame for _, frame in batch])
+
+    def map_path_batches(self, batches):
+        """
+        对图片路径批次推理（解码在工作进程中完成）
+
+        Args:
+            batches: 可迭代对象，每项为图片路径列表
+
+        Yields:
+            (路径列表, 推理耗时秒数, Detections列表)，无法读取的图片对应None
+        """
+        return self._ordered(batches, infer_paths, list)
+
+    def close(self):
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        """立即终止进程池，不等待在途任务"""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+def tune_candidates(cores=None):
+    """
+    自动调优的候选组合：进程数取1、2、4…，线程数为CPU核数平分
+
+    Args:
+        cores: 可用CPU核数，默认 os.cpu_count()
+
+    Returns:
+        [(进程数, 每进程线程数), ...]
+    """
+    cores = cores or os.cpu_count() or 1
+    candidates = []
+    workers = 1
+    while workers <= cores:
+        candidates.append((workers, cores // workers))
+        workers *= 2
+    if candidates[-1][0] != cores:
+        candidates.append((cores, 1))
+    return candidates
+
+
+def autotune(model_path, images, backend='torch', imgsz=320, conf=0.5, batch_size=8,
+             candidates=None, rounds=2):
+    """
+    在样本图像上逐个测量候选的 进程数×线程数 组合，返回吞吐最高者
+
+    Args:
+        model_path: 权重路径
+        images: 已解码的样本图像列表
+        backend: 推理后端
+        imgsz: 推理尺寸
+        conf: 置信度阈值
+        batch_size: 每个任务的图像数（导出模型为1）
+        candidates: 候选组合，默认 tune_candidates()
+        rounds: 计时轮数（样本重复推理的次数）
+
+    Returns:
+        ((进程数, 线程数), [{'workers', 'threads', 'ips'}, ...])
+    """
+    candidates = candidates or tune_candidates()
+    batches = [list(enumerate(images[i:i + batch_size])) for i in range(0, len(images), batch_size)]
+    records = []
+    for workers, threads in candidates:
+        # 样本不足以让每个进程都分到任务时，多开进程没有意义
+        if workers > len(batches) * rounds:
+            continue
+        with ShardedDetector(model_path, backend, imgsz, conf, workers, threads) as detector:
+            # 预热：每个进程各处理一个批次，计时不含冷启动
+            detector.check([frame for _, frame in batches[0]])
+            start = time.perf_counter()
+            for _ in detector.map_frame_batches(batches * rounds):
+                pass
+            elapsed = time.perf_counter() - start
+        ips = len(images) * rounds / elapsed
+        records.append({'workers': workers, 'threads': threads, 'ips': ips})
+        print(f"  {workers:>3} 进程 × {threads:>3} 线程: {ips:.1f} 张/秒")
+    best = max(records, key=lambda r: r['ips'])
+    return (best['workers'], best['threads']), records
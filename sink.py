@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+检测结果输出模块
+按列在内存中缓冲检测结果（帧号、时间戳、来源、类别、置信度、坐标），
+按行数或定时批量写出到 JSONL / CSV / Parquet 文件，并按行数轮转文件
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from utils import Detections
+
+SINK_FORMATS = ('jsonl', 'csv', 'parquet')
+
+# 输出列（每个检测框一行）
+COLUMNS = ('frame_id', 'timestamp', 'source', 'cls', 'name', 'conf', 'x1', 'y1', 'x2', 'y2', 'track_id')
+
+# 无检测帧的标记行：cls 为 -1、name 为空、坐标和置信度为0，用于区分"已处理但没有目标"和"未处理"
+EMPTY_CLS = -1
+
+
+class DetectionSink:
+    """
+    列式缓冲的检测结果写出器
+
+    write() 只把本帧的数组追加到缓冲区；缓冲行数达到 flush_rows 或距上次写出超过
+    flush_interval 秒时，一次性拼接成列并批量写盘。后台定时线程保证低帧率时结果也能及时落盘。
+    单个文件写满 rotate_rows 行后切换到下一个编号的文件。
+    文件名带本次运行的时间戳，重复运行或GUI多次开始/停止不会覆盖、混入之前的结果。
+    没有检测结果的帧写一行 cls 为 EMPTY_CLS 的标记行（mark_empty=False 时不写）。
+    """
+
+    def __init__(self, prefix, fmt='jsonl', category_names=None, flush_rows=5000,
+                 flush_interval=2.0, rotate_rows=1_000_000, mark_empty=True):
+        """
+        Args:
+            prefix: 输出文件前缀，实际文件为 <prefix>_<运行ID>_0000.<fmt>、<prefix>_<运行ID>_0001.<fmt> ...，
+                运行ID为创建时间（年月日-时分秒），同一秒内重复创建时追加 -1、-2 ...
+            fmt: 输出格式，jsonl / csv / parquet
+            category_names: 类别ID到名称的映射
+            flush_rows: 缓冲达到该行数时写出
+            flush_interval: 定时写出间隔（秒），0 表示不启用定时线程
+            rotate_rows: 单个文件的最大行数，0 表示不轮转
+            mark_empty: 无检测的帧是否写出标记行
+        """
+        if fmt not in SINK_FORMATS:
+            raise ValueError(f"不支持的输出格式: {fmt}，可选 {', '.join(SINK_FORMATS)}")
+        if fmt == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError("Parquet 输出需要安装 pyarrow: pip install pyarrow")
+
+        self.prefix = prefix
+        self.fmt = fmt
+        self.category_names = category_names or {}
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rotate_rows = rotate_rows
+        self.mark_empty = mark_empty
+
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.run_id = self._new_run_id()
+
+        # 缓冲区：每次 write 追加一个块，写出时统一拼接
+        self._chunks = []
+        self._buffered = 0
+        self._buffer_lock = threading.Lock()
+        # 文件写入串行化，写盘期间不阻塞 write()
+        self._write_lock = threading.Lock()
+
+        self._file = None
+        self._writer = None
+        self._file_index = -1
+        self._file_rows = 0
+        self.paths = []
+        self.rows_written = 0
+        self.flushes = 0
+        self._last_flush = time.monotonic()
+
+        self._stop_event = threading.Event()
+        self._timer = None
+        if flush_interval and flush_interval > 0:
+            self._timer = threading.Thread(target=self._flush_loop, name="sink-flush", daemon=True)
+            self._timer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, source, frame_id, detections, timestamp=None):
+        """
+        追加一帧（或一张图片）的检测结果
+
+        Args:
+            source: 来源（图片路径、视频路径或摄像头ID）
+            frame_id: 帧号或图片序号
+            detections: Detections，带跟踪ID时写入 track_id 列；为空时写一行标记行
+            timestamp: 时间戳（秒），默认当前时间
+        """
+        count = len(detections)
+        if count == 0:
+            if not self.mark_empty:
+                return
+            detections = Detections(np.zeros((1, 4), dtype=np.float32), np.zeros(1, dtype=np.float32),
+                                    np.full(1, EMPTY_CLS, dtype=np.int32))
+            count = 1
+        if timestamp is None:
+            timestamp = time.time()
+        chunk = (str(source), int(frame_id), float(timestamp), detections)
+        with self._buffer_lock:
+            self._chunks.append(chunk)
+            self._buffered += count
+            full = self._buffered >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        """把缓冲区中的结果批量写出"""
+        # 先取写入锁再取出缓冲区：定时线程和 write() 触发的写出按取出顺序落盘，保持帧序
+        with self._write_lock:
+            with self._buffer_lock:
+                chunks, self._chunks = self._chunks, []
+                self._buffered = 0
+            self._last_flush = time.monotonic()
+            if not chunks:
+                return
+            self._write_columns(self._to_columns(chunks))
+            self.flushes += 1
+
+    def close(self):
+        """停止定时线程，写出剩余结果并关闭文件"""
+        self._stop_event.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+        with self._write_lock:
+            self._close_file()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(min(self.flush_interval, 0.5)):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def _to_columns(self, chunks):
+        counts = np.array([len(chunk[3]) for chunk in chunks])
+        # 没有跟踪ID的帧用 -1 填充，保证各帧都能拼接出 ids 列
+        merged = Detections.concatenate([
+            chunk[3] if chunk[3].ids is not None
+            else chunk[3].with_ids(np.full(len(chunk[3]), -1, dtype=np.int64))
+            for chunk in chunks
+        ])
+        xyxy = merged.xyxy
+        names = merged.names(self.category_names)
+        names[merged.cls == EMPTY_CLS] = ''
+        return {
+            'frame_id': np.repeat(np.array([chunk[1] for chunk in chunks], dtype=np.int64), counts),
+            'timestamp': np.repeat(np.array([chunk[2] for chunk in chunks], dtype=np.float64), counts),
+            'source': np.repeat(np.array([chunk[0] for chunk in chunks], dtype=object), counts),
+            'cls': merged.cls.astype(np.int32),
+            'name': names,
+            'conf': merged.conf.astype(np.float32),
+            'x1': xyxy[:, 0],
+            'y1': xyxy[:, 1],
+            'x2': xyxy[:, 2],
+            'y2': xyxy[:, 3],
+            'track_id': merged.ids.astype(np.int64),
+        }
+
+    def _write_columns(self, columns):
+        total = len(columns['cls'])
+        start = 0
+        while start < total:
+            if self._file is None and self._writer is None:
+                self._open_file()
+            # 当前文件剩余容量，写满即轮转
+            space = self.rotate_rows - self._file_rows if self.rotate_rows else total - start
+            end = min(total, start + space)
+            part = {key: values[start:end] for key, values in columns.items()}
+            self._write_part(part)
+            self._file_rows += end - start
+            self.rows_written += end - start
+            start = end
+            if self.rotate_rows and self._file_rows >= self.rotate_rows:
+                self._close_file()
+
+    def _new_run_id(self):
+        import glob
+
+        run_id = stamp = time.strftime('%Y%m%d-%H%M%S')
+        suffix = 0
+        while glob.glob(f"{glob.escape(self.prefix)}_{run_id}_*.{self.fmt}"):
+            suffix += 1
+            run_id = f"{stamp}-{suffix}"
+        return run_id
+
+    def _open_file(self):
+        self._file_index += 1
+        self._file_rows = 0
+        path = f"{self.prefix}_{self.run_id}_{self._file_index:04d}.{self.fmt}"
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+
+            if os.path.exists(path):
+                raise FileExistsError(f"检测结果文件已存在: {path}")
+            self._writer = pq.ParquetWriter(path, self._arrow_schema())
+            self.paths.append(path)
+            return
+        # 'x' 模式：即使其他进程同时使用了相同的运行ID也不会覆盖已有文件
+        self._file = open(path, 'x', newline='' if self.fmt == 'csv' else None, encoding='utf-8')
+        self.paths.append(path)
+        if self.fmt == 'csv':
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(COLUMNS)
+
+    def _close_file(self):
+        if self.fmt == 'parquet':
+            if self._writer is not None:
+                self._writer.close()
+        elif self._file is not None:
+            self._file.close()
+        self._file = None
+        self._writer = None
+
+    @staticmethod
+    def _arrow_schema():
+        import pyarrow as pa
+
+        return pa.schema([
+            ('frame_id', pa.int64()), ('timestamp', pa.float64()), ('source', pa.string()),
+            ('cls', pa.int32()), ('name', pa.string()), ('conf', pa.float32()),
+            ('x1', pa.float32()), ('y1', pa.float32()), ('x2', pa.float32()), ('y2', pa.float32()),
+            ('track_id', pa.int64()),
+        ])
+
+    def _write_part(self, part):
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+
+            # 每次写出对应一个 row group
+            table = pa.Table.from_pydict({key: part[key] for key in COLUMNS}, schema=self._writer.schema)
+            self._writer.write_table(table)
+            return
+
+        # 坐标和置信度先整列转为float64取整再转为Python列表，避免逐行格式化
+        def rounded(key, digits):
+            return part[key].astype(np.float64).round(digits).tolist()
+
+        rows = zip(part['frame_id'].tolist(), rounded('timestamp', 3), part['source'].tolist(),
+                   part['cls'].tolist(), part['name'].tolist(), rounded('conf', 4),
+                   rounded('x1', 1), rounded('y1', 1), rounded('x2', 1), rounded('y2', 1),
+                   part['track_id'].tolist())
+        if self.fmt == 'csv':
+            self._writer.writerows(rows)
+        else:
+            self._file.write(''.join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n'
+                                     for row in rows))
+        self._file.flush()
+
+
+def add_sink_arguments(parser):
+    """
+    为命令行添加结果输出相关参数
+
+    Args:
+        parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--sink-format', type=str, default='jsonl', choices=SINK_FORMATS,
+                        help='检测结果输出格式，默认jsonl（parquet 需安装 pyarrow）')
+    parser.add_argument('--sink-flush-rows', type=int, default=5000,
+                        help='缓冲达到该行数时批量写出，默认5000')
+    parser.add_argument('--sink-flush-interval', type=float, default=2.0,
+                        help='定时写出间隔（秒），默认2.0')
+    parser.add_argument('--sink-rotate-rows', type=int, default=1_000_000,
+                        help='单个结果文件的最大行数，超出后轮转，0表示不轮转，默认1000000')
+
+
+def sink_from_args(args, prefix, category_names=None):
+    """
+    按命令行参数创建 DetectionSink
+
+    Args:
+        args: 解析后的参数（需包含 add_sink_arguments 添加的参数）
+        prefix: 输出文件前缀
+        category_names: 类别ID到名称的映射
+
+    Returns:
+        DetectionSink
+    """
+    return DetectionSink(prefix, fmt=args.sink_format, category_names=category_names,
+                         flush_rows=args.sink_flush_rows, flush_interval=args.sink_flush_interval,
+                         rotate_rows=args.sink_rotate_rows)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+并行超参数搜索
+按搜索空间（网格或随机采样）生成试验，在进程池中并行训练，每个进程分配固定的CPU线程数；
+每轮验证后按中位数规则提前终止明显落后的试验，最后测量单图延迟并输出排名表
+"""
+
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import random
+import statistics
+import time
+
+# 排名使用的验证指标（ultralytics 训练器 metrics 中的键）
+FITNESS_KEY = 'metrics/mAP50-95(B)'
+MAP50_KEY = 'metrics/mAP50(B)'
+
+
+def load_space(path):
+    """
+    读取搜索空间
+
+    文件为yaml/json映射，值为候选列表，例如：
+        lr0: [0.001, 0.005, 0.01]
+        imgsz: [320, 480]
+
+    Args:
+        path: 搜索空间文件路径
+
+    Returns:
+        {参数名: 候选值列表}
+    """
+    import yaml
+
+    with open(path, 'r', encoding='utf-8') as f:
+        space = yaml.safe_load(f) or {}
+    if not isinstance(space, dict) or not space:
+        raise ValueError(f"搜索空间应为非空映射: {path}")
+    return {key: values if isinstance(values, list) else [values] for key, values in space.items()}
+
+
+def generate_trials(space, trials=0, seed=0):
+    """
+    生成试验参数
+
+    Args:
+        space: 搜索空间
+        trials: 0 表示完整网格，否则从网格中随机抽取（不重复）的试验数
+        seed: 随机种子
+
+    Returns:
+        参数字典列表
+    """
+    keys = sorted(space)
+    grid = [dict(zip(keys, combo)) for combo in itertools.product(*(space[k] for k in keys))]
+    if trials and trials < len(grid):
+        grid = random.Random(seed).sample(grid, trials)
+    return grid
+
+
+class MedianPruner:
+    """
+    中位数剪枝：预热轮数之后，若本轮指标低于其他试验同一轮指标的中位数则终止
+
+    history 为进程间共享的字典 {(试验ID, 轮次): 指标}
+    """
+
+    def __init__(self, history, trial_id, warmup_epochs=3, min_peers=2):
+        self.history = history
+        self.trial_id = trial_id
+        self.warmup_epochs = warmup_epochs
+        self.min_peers = min_peers
+        self.pruned_at = None
+
+    def on_fit_epoch_end(self, trainer):
+        """ultralytics 回调：每轮训练+验证结束后调用"""
+        epoch = trainer.epoch + 1
+        value = float(trainer.metrics.get(FITNESS_KEY, 0.0))
+        self.history[(self.trial_id, epoch)] = value
+        if epoch < self.warmup_epochs:
+            return
+        peers = [v for (trial, e), v in self.history.items() if e == epoch and trial != self.trial_id]
+        if len(peers) >= self.min_peers and value < statistics.median(peers):
+            self.pruned_at = epoch
+            trainer.stop = True
+            print(f"试验 {self.trial_id} 在第 {epoch} 轮被剪枝："
+                  f"mAP50-95 {value:.4f} < 中位数 {statistics.median(peers):.4f}")
+
+
+def init_worker(threads):
+    """进程池初始化：限制每个进程的CPU线程数，避免多个试验相互争抢"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['MKL_NUM_THREADS'] = str(threads)
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(1)
+
+
+def run_trial(trial_id, params, base, history, warmup_epochs=3, stores=None):
+    """
+    在工作进程中执行一个试验
+
+    Args:
+        trial_id: 试验ID
+        params: 本试验的超参数
+        base: 公共训练参数（model/data/epochs/project 等）
+        history: 共享的剪枝历史
+        warmup_epochs: 剪枝前至少训练的轮数
+        stores: 可选的 {imgsz: {划分: DatasetStore}} 预处理数据集缓存
+
+    Returns:
+        结果字典
+    """
+    from ultralytics import YOLO
+
+    train_args = dict(base)
+    model_path = train_args.pop('model')
+    train_args.update(params)
+    imgsz = train_args.get('imgsz', 640)
+
+    pruner = MedianPruner(history, trial_id, warmup_epochs)
+    model = YOLO(model_path)
+    model.add_callback('on_fit_epoch_end', pruner.on_fit_epoch_end)
+
+    if stores and imgsz in stores:
+        from dataset_cache import CachedDetectionTrainer
+
+        CachedDetectionTrainer.stores = stores[imgsz]
+        train_args['trainer'] = CachedDetectionTrainer
+
+    start = time.time()
+    record = {'trial': trial_id, **params, 'status': 'ok', 'epochs': 0, 'train_min': 0.0,
+              'map50': 0.0, 'map': 0.0, 'latency_ms': None, 'weights': None}
+    try:
+        model.train(name=f"trial{trial_id}", exist_ok=True, plots=False, verbose=False, **train_args)
+    except Exception as e:
+        record['status'] = f"failed: {e}"
+        return record
+
+    trainer = model.trainer
+    record['epochs'] = trainer.epoch + 1
+    record['map50'] = round(float(trainer.metrics.get(MAP50_KEY, 0.0)), 4)
+    record['map'] = round(float(trainer.metrics.get(FITNESS_KEY, 0.0)), 4)
+    record['train_min'] = round((time.time() - start) / 60, 1)
+    if pruner.pruned_at is not None:
+        record['status'] = f"pruned@{pruner.pruned_at}"
+    best = os.path.join(str(trainer.save_dir), 'weights', 'best.pt')
+    record['weights'] = best if os.path.isfile(best) else None
+    return record
+
+
+def write_results(records, path):
+    """
+    按 mAP50-95 排名写出CSV结果表（未完成的试验排在最后）
+
+    Args:
+        records: 试验结果列表
+        path: CSV路径
+
+    Returns:
+        排名后的结果列表
+    """
+    ranked = sorted(records, key=lambda r: (r['status'] == 'ok', r['map']), reverse=True)
+    fields = ['rank', 'trial'] + list(dict.fromkeys(k for r in ranked for k in r if k != 'trial'))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for rank, record in enumerate(ranked, 1):
+            writer.writerow({'rank': rank, **record})
+    return ranked
+
+
+def print_results(ranked, param_keys):
+    """打印排名表"""
+    header = f"{'#':<4}{'trial':<7}" + ''.join(f"{k:<14}" for k in param_keys) \
+        + f"{'mAP50':>8}{'mAP50-95':>10}{'ms/img':>9}  status"
+    print(header)
+    for rank, r in enumerate(ranked, 1):
+        latency = f"{r['latency_ms']:.1f}" if r['latency_ms'] is not None else '-'
+        print(f"{rank:<4}{r['trial']:<7}" + ''.join(f"{str(r[k]):<14}" for k in param_keys)
+              + f"{r['map50']:>8.4f}{r['map']:>10.4f}{latency:>9}  {r['status']}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='YOLOv8物品检测并行超参数搜索')
+    parser.add_argument('--space', type=str, required=True,
+                        help='搜索空间yaml文件，每个参数对应一个候选值列表')
+    parser.add_argument('--model', type=str, default='yolov8n.pt', help='初始模型')
+    parser.add_argument('--data', type=str, default='object.yaml', help='数据集配置文件')
+    parser.add_argument('--epochs', type=int, default=30, help='每个试验的训练轮数，默认30')
+    parser.add_argument('--trials', type=int, default=0,
+                        help='随机抽取的试验数，默认0表示完整网格')
+    parser.add_argument('--workers', type=int, default=2, help='并行试验进程数，默认2')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='每个进程的CPU线程数，默认0表示按CPU核数平分')
+    parser.add_argument('--loader-workers', type=int, default=2,
+                        help='每个试验的数据加载进程数，默认2')
+    parser.add_argument('--warmup-epochs', type=int, default=3,
+                        help='剪枝前至少训练的轮数，默认3')
+    parser.add_argument('--latency-images', type=int, default=30,
+                        help='测量单图延迟使用的验证集图片数，默认30')
+    parser.add_argument('--dataset-cache', type=str, default='.cache/dataset',
+                        help='预处理数据集缓存目录')
+    parser.add_argument('--no-dataset-cache', action='store_true', help='不使用预处理数据集缓存')
+    parser.add_argument('--project', type=str, default='object_sweep', help='输出目录')
+    parser.add_argument('--seed', type=int, default=0, help='随机抽样种子')
+
+    args = parser.parse_args()
+
+    space = load_space(args.space)
+    trials = generate_trials(space, args.trials, args.seed)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    print("========================================")
+    print("        YOLOv8 并行超参数搜索        ")
+    print("========================================")
+    print(f"搜索空间: {space}")
+    print(f"试验数: {len(trials)}，并行进程: {args.workers}，每进程线程: {threads}")
+    print(f"每试验轮数: {args.epochs}，剪枝预热轮数: {args.warmup_epochs}")
+    print("========================================")
+
+    # 预处理缓存按训练尺寸各生成一次，所有试验共享
+    stores = None
+    if not args.no_dataset_cache:
+        from dataset_cache import prepare_dataset
+
+        stores = {}
+        for imgsz in sorted(set(t.get('imgsz', 640) for t in trials)):
+            prepared = prepare_dataset(args.data, imgsz, args.dataset_cache)
+            if prepared is None:
+                print("✗ 数据集校验失败，请修复上述问题或使用 --no-dataset-cache")
+                return
+            stores[imgsz] = prepared
+
+    os.makedirs(args.project, exist_ok=True)
+    base = {
+        'model': args.model,
+        'data': args.data,
+        'epochs': args.epochs,
+        'device': 'cpu',
+        'workers': args.loader_workers,
+        'project': os.path.abspath(args.project),
+    }
+
+    # spawn 启动的子进程不继承父进程的线程状态，各自按线程预算初始化torch
+    ctx = multiprocessing.get_context('spawn')
+    start = time.time()
+    with ctx.Manager() as manager:
+        history = manager.dict()
+        with ctx.Pool(args.workers, initializer=init_worker, initargs=(threads,)) as pool:
+            pending = [pool.apply_async(run_trial, (i, params, base, history, args.warmup_epochs, stores))
+                       for i, params in enumerate(trials)]
+            records = []
+            for job in pending:
+                record = job.get()
+                records.append(record)
+                print(f"试验 {record['trial']} 完成: mAP50-95 {record['map']:.4f}（{record['status']}）")
+
+    # 训练结束后在空闲机器上逐个测量延迟，避免并行训练干扰计时
+    from ultralytics import YOLO
+    from evaluation import measure_latency, val_image_paths
+
+    images = val_image_paths(args.data, args.latency_images)
+    for record in records:
+        if record['status'] == 'ok' and record['weights'] and images:
+            imgsz = record.get('imgsz', 640)
+            record['latency_ms'] = round(measure_latency(YOLO(record['weights']), images, imgsz), 2)
+
+    result_path = os.path.join(args.project, 'sweep_results.csv')
+    ranked = write_results(records, result_path)
+    print(f"\n=== 搜索结果（按 mAP50-95 排名）===")
+    print_results(ranked, sorted(space))
+    print(f"\n✓ 搜索完成，用时 {(time.time() - start) / 60:.1f} 分钟，结果已写入: {result_path}")
+
+
+if __name__ == '__main__':
+    main()
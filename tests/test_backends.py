@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""backends 测试：识别已导出的模型并按导出元数据修正后端和推理尺寸"""
+
+from backends import exported_backend, exported_imgsz, resolve_model
+
+
+def make_openvino_dir(tmp_path, imgsz=(416, 416)):
+    model_dir = tmp_path / 'best_int8_openvino_model'
+    model_dir.mkdir()
+    (model_dir / 'best.xml').write_text('<net/>')
+    (model_dir / 'metadata.yaml').write_text(f"task: detect\nbatch: 1\nimgsz:\n- {imgsz[0]}\n- {imgsz[1]}\n")
+    return str(model_dir)
+
+
+def test_exported_backend(tmp_path):
+    assert exported_backend(make_openvino_dir(tmp_path)) == 'openvino'
+    assert exported_backend(str(tmp_path / 'best.onnx')) == 'onnx'
+    assert exported_backend('yolov8n.pt') is None
+    # 普通目录不是导出模型
+    assert exported_backend(str(tmp_path)) is None
+
+
+def test_exported_imgsz_from_metadata(tmp_path):
+    model_dir = make_openvino_dir(tmp_path, (480, 480))
+    assert exported_imgsz(model_dir) == 480
+    assert exported_imgsz(model_dir + '/') == 480
+
+
+def test_exported_imgsz_missing_metadata(tmp_path):
+    model_dir = tmp_path / 'm_openvino_model'
+    model_dir.mkdir()
+    assert exported_imgsz(str(model_dir)) is None
+
+
+def test_resolve_model(tmp_path):
+    model_dir = make_openvino_dir(tmp_path)
+    assert resolve_model(model_dir, 'torch', 320) == ('openvino', 416)
+    assert resolve_model(model_dir, 'openvino', 416) == ('openvino', 416)
+    assert resolve_model('yolov8n.pt', 'torch', 320) == ('torch', 320)
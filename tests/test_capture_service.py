@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""capture_service 测试：FrameRing 的写入协议、按序号读取与覆盖判断、wait_next，以及 SharedCapture 的复制与确认"""
+
+import os
+import uuid
+
+import numpy as np
+import pytest
+
+from capture_service import FrameRing, SharedCapture
+
+SHAPE = (4, 6, 3)
+SLOTS = 4
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create(f"test_ring_{os.getpid()}_{uuid.uuid4().hex[:8]}", SHAPE, slots=SLOTS)
+    try:
+        yield ring
+    finally:
+        ring.close()
+
+
+def frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+def test_begin_write_hides_slot_until_commit(ring):
+    seq, view = ring.begin_write()
+    assert seq == 1
+    assert ring.read(seq) is None
+    assert not ring.valid(seq)
+    assert ring.latest_seq == 0
+
+    view[...] = 7
+    ring.commit(seq, 123.5)
+    assert ring.latest_seq == 1
+    assert ring.valid(seq)
+    timestamp, data = ring.read(seq)
+    assert timestamp == 123.5
+    assert np.all(data == 7)
+    # 零拷贝：返回的是缓冲区中的槽位
+    assert np.shares_memory(data, ring.frames)
+
+
+def test_rewriting_slot_invalidates_previous_seq(ring):
+    first = ring.write(frame(1))
+    seq, view = ring.begin_write()
+    for _ in range(SLOTS - 1):
+        ring.commit(seq, 0.0)
+        seq, view = ring.begin_write()
+    assert seq % SLOTS == first % SLOTS
+    # 绕回的槽位在写入期间（序号-1）对旧序号已无效
+    assert not ring.valid(first)
+    assert ring.read(first) is None
+
+    view[...] = 9
+    ring.commit(seq, 0.0)
+    assert not ring.valid(first)
+    assert ring.valid(seq)
+    assert np.all(ring.read(seq)[1] == 9)
+
+
+def test_view_detects_overwrite_after_read(ring):
+    seq = ring.write(frame(1))
+    _, data = ring.read(seq)
+    for value in range(2, SLOTS + 2):
+        ring.write(frame(value))
+    # 视图内容已被新帧替换，只能靠 valid() 发现
+    assert not ring.valid(seq)
+    assert not np.all(data == 1)
+
+
+def test_wait_next_latest_jumps_to_newest(ring):
+    for value in range(3):
+        ring.write(frame(value))
+    assert ring.wait_next(0, timeout=0.1, latest=True) == 3
+    assert ring.wait_next(3, timeout=0.05, latest=True) is None
+
+
+def test_wait_next_in_order_skips_overwritten(ring):
+    for value in range(3):
+        ring.write(frame(value))
+    assert ring.wait_next(0, timeout=0.1, latest=False) == 1
+    assert ring.wait_next(1, timeout=0.1, latest=False) == 2
+
+    for value in range(10):
+        ring.write(frame(value))
+    newest = ring.latest_seq
+    seq = ring.wait_next(2, timeout=0.1, latest=False)
+    # 落后超过一圈时从仍在缓冲区中的帧开始，并留出一个可能正在写入的槽位
+    assert seq == newest - SLOTS + 2
+    assert ring.valid(seq)
+
+
+def test_wait_next_returns_none_after_stop(ring):
+    ring.write(frame(1))
+    ring.stop()
+    assert not ring.running
+    assert ring.wait_next(1, timeout=5.0) is None
+    # 停止前已写入的帧仍可读完
+    assert ring.wait_next(0, timeout=5.0) == 1
+
+
+def test_shared_capture_copy_is_private(ring):
+    ring.write(frame(5))
+    cap = SharedCapture(ring, latest=False, timeout=0.1, copy=True)
+    ok, data = cap.read()
+    assert ok and cap.seq == 1
+    assert not np.shares_memory(data, ring.frames)
+    for value in range(SLOTS + 1):
+        ring.write(frame(value))
+    assert np.all(data == 5)
+
+
+def test_shared_capture_drops_frame_overwritten_while_copying(ring, monkeypatch):
+    for value in range(1, 3):
+        ring.write(frame(value))
+    original_read = ring.read
+
+    def racing_read(seq):
+        item = original_read(seq)
+        if seq == 1:
+            # 模拟复制期间采集服务绕回该槽位
+            for value in range(10, 10 + SLOTS):
+                ring.write(frame(value))
+        return item
+
+    monkeypatch.setattr(ring, 'read', racing_read)
+    cap = SharedCapture(ring, latest=False, timeout=0.1, copy=True)
+    cap.seq = 0
+    ok, data = cap.read()
+    assert ok
+    assert cap.overwritten == 1
+    assert cap.seq > 1 and ring.valid(cap.seq)
+    assert np.all(data == data.flat[0])
+
+
+def test_shared_capture_confirm_counts_overwrite(ring):
+    ring.write(frame(1))
+    cap = SharedCapture(ring, timeout=0.1)
+    ok, data = cap.read()
+    assert ok and np.shares_memory(data, ring.frames)
+    assert cap.confirm()
+    del data
+
+    for value in range(SLOTS):
+        ring.write(frame(value))
+    assert not cap.confirm()
+    assert cap.overwritten == 1
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""utils.Detections 测试"""
+
+import numpy as np
+import pytest
+
+from utils import Detections
+
+
+def packed_data():
+    return np.array([
+        [0, 0, 10, 10, 0.9, 0],
+        [5, 5, 20, 20, 0.4, 2],
+        [1, 2, 3, 4, 0.6, 0],
+        [7, 8, 9, 10, 0.2, 5],
+    ], dtype=np.float32)
+
+
+def test_packed_roundtrip():
+    data = packed_data()
+    dets = Detections.from_packed(data)
+    assert len(dets) == 4
+    assert dets.xyxy.dtype == np.float32 and dets.cls.dtype == np.int32
+    # 坐标和置信度是原数组的视图
+    assert np.shares_memory(dets.xyxy, data) and np.shares_memory(dets.conf, data)
+    np.testing.assert_array_equal(dets.packed(), data)
+    assert dets.packed().dtype == np.float32
+
+
+def test_empty():
+    dets = Detections()
+    assert len(dets) == 0
+    assert dets.packed().shape == (0, 6)
+    assert len(Detections.from_packed(np.zeros((0, 6), dtype=np.float32))) == 0
+    assert len(Detections.from_boxes(None)) == 0
+    assert len(dets.filter_conf(0.5)) == 0
+    assert dets.names().shape == (0,)
+
+
+def test_from_boxes_passthrough_and_data():
+    dets = Detections.from_packed(packed_data())
+    assert Detections.from_boxes(dets) is dets
+
+    class Boxes:
+        data = packed_data().astype(np.float64)
+
+        def __len__(self):
+            return len(self.data)
+
+    converted = Detections.from_boxes(Boxes())
+    np.testing.assert_array_equal(converted.packed(), packed_data())
+
+
+def test_concatenate_ids():
+    a = Detections.from_packed(packed_data()[:2])
+    b = Detections.from_packed(packed_data()[2:])
+    merged = Detections.concatenate([a, b])
+    np.testing.assert_array_equal(merged.packed(), packed_data())
+    assert merged.ids is None
+
+    tracked = Detections.concatenate([a.with_ids(np.array([1, 2])), b.with_ids(np.array([3, 4]))])
+    assert tracked.ids.tolist() == [1, 2, 3, 4]
+
+    # 部分带ID时不保留ids，避免ID与框错位
+    mixed = Detections.concatenate([a.with_ids(np.array([1, 2])), b])
+    assert mixed.ids is None and len(mixed) == 4
+
+    assert len(Detections.concatenate([])) == 0
+    assert Detections.concatenate([a]) is a
+
+
+def test_getitem():
+    dets = Detections.from_packed(packed_data()).with_ids(np.arange(10, 14))
+    first = dets[0]
+    assert isinstance(first, Detections) and len(first) == 1
+    assert first.ids.tolist() == [10]
+    last = dets[-1]
+    assert last.cls.tolist() == [5] and last.ids.tolist() == [13]
+    assert dets[-2].cls.tolist() == [0] and dets[-2].ids.tolist() == [12]
+    assert dets[np.int64(1)].cls.tolist() == [2]
+    with pytest.raises(IndexError):
+        dets[4]
+    with pytest.raises(IndexError):
+        dets[-5]
+
+    sliced = dets[1:3]
+    assert len(sliced) == 2 and np.shares_memory(sliced.xyxy, dets.xyxy)
+    masked = dets[np.array([True, False, True, False])]
+    assert masked.ids.tolist() == [10, 12]
+    fancy = dets[np.array([3, 0])]
+    assert fancy.cls.tolist() == [5, 0]
+
+
+def test_filter_conf_and_classes():
+    dets = Detections.from_packed(packed_data()).with_ids(np.arange(4))
+    kept = dets.filter_conf(0.4)
+    np.testing.assert_allclose(kept.conf, [0.9, 0.4, 0.6])
+    assert kept.ids.tolist() == [0, 1, 2]
+    assert len(dets.filter_conf(0.95)) == 0
+
+    assert dets.filter_classes([0]).ids.tolist() == [0, 2]
+    assert dets.filter_classes({2, 5}).cls.tolist() == [2, 5]
+    assert len(dets.filter_classes([])) == 0
+
+
+def test_names():
+    dets = Detections.from_packed(packed_data())
+    assert dets.names({0: 'a', 2: 'b'}).tolist() == ['a', 'b', 'a', '5']
+    assert dets.names()[0] == 'person'
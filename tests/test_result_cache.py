@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""result_cache.DetectionCache 测试"""
+
+import os
+import threading
+
+import numpy as np
+
+from result_cache import DetectionCache
+from utils import Detections
+
+
+def make_detections(n, seed=0):
+    rng = np.random.default_rng(seed)
+    data = np.zeros((n, 6), dtype=np.float32)
+    data[:, :2] = rng.uniform(0, 100, (n, 2))
+    data[:, 2:4] = data[:, :2] + rng.uniform(1, 50, (n, 2))
+    data[:, 4] = rng.uniform(0.05, 1, n)
+    data[:, 5] = rng.integers(0, 80, n)
+    return Detections.from_packed(data)
+
+
+def test_roundtrip_hit(tmp_path):
+    cache = DetectionCache(str(tmp_path), 'model-a', 320)
+    key = cache.key(b'image')
+    assert cache.get(key) is None
+    dets = make_detections(5)
+    cache.put(key, dets)
+    cached = cache.get(key)
+    np.testing.assert_array_equal(cached.packed(), dets.packed())
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_config_change_misses(tmp_path):
+    base = DetectionCache(str(tmp_path), 'model-a', 320, 'torch')
+    key = base.key(b'image')
+    base.put(key, make_detections(3))
+    for other in (DetectionCache(str(tmp_path), 'model-b', 320, 'torch'),
+                  DetectionCache(str(tmp_path), 'model-a', 640, 'torch'),
+                  DetectionCache(str(tmp_path), 'model-a', 320, 'onnx')):
+        other_key = other.key(b'image')
+        assert other_key != key
+        assert other.get(other_key) is None
+    assert base.get(base.key(b'image')) is not None
+    # 图片内容不同也应不同键
+    assert base.key(b'other image') != key
+
+
+def test_eviction_to_ninety_percent_lru(tmp_path):
+    cache = DetectionCache(str(tmp_path), 'm', 320, max_bytes=10 ** 9)
+    keys = [cache.key(str(i).encode()) for i in range(10)]
+    for i, key in enumerate(keys):
+        cache.put(key, make_detections(20, i))
+        # 修改时间依次递增，keys[0] 最久未使用
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    entry_size = os.path.getsize(cache._path(keys[0]))
+
+    cache.max_bytes = entry_size * 8
+    cache.evict()
+    remaining = [key for key in keys if os.path.exists(cache._path(key))]
+    assert cache.stats()['bytes'] <= cache.max_bytes * 0.9
+    assert sum(os.path.getsize(cache._path(k)) for k in remaining) == cache.stats()['bytes']
+    # 淘汰最旧的条目，保留最近使用的
+    assert remaining == keys[-len(remaining):]
+    assert len(remaining) == 7
+
+
+def test_put_over_capacity_triggers_eviction(tmp_path):
+    cache = DetectionCache(str(tmp_path), 'm', 320, max_bytes=10 ** 9)
+    probe = cache.key(b'probe')
+    cache.put(probe, make_detections(20))
+    entry_size = os.path.getsize(cache._path(probe))
+    cache.max_bytes = entry_size * 4
+    for i in range(10):
+        cache.put(cache.key(str(i).encode()), make_detections(20, i))
+    assert cache.stats()['bytes'] <= cache.max_bytes
+    assert cache.stats()['bytes'] == cache._scan_size()
+
+
+def test_concurrent_access_counts(tmp_path):
+    cache = DetectionCache(str(tmp_path), 'm', 320, max_bytes=10 ** 9)
+    probe = cache.key(b'probe')
+    cache.put(probe, make_detections(20))
+    cache.max_bytes = os.path.getsize(cache._path(probe)) * 6
+
+    def worker(offset):
+        for i in range(50):
+            key = cache.key(f"{offset}-{i % 10}".encode())
+            if cache.get(key) is None:
+                cache.put(key, make_detections(20, i))
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 200
+    # 占用统计与磁盘一致，没有被并发淘汰重复或遗漏计入
+    assert stats['bytes'] == cache._scan_size()
+
+
+def test_overwrite_replaces_size(tmp_path):
+    cache = DetectionCache(str(tmp_path), 'model-a', 320)
+    key = cache.key(b'image')
+    cache.put(key, make_detections(50))
+    cache.put(key, make_detections(2))
+    path = cache._path(key)
+    assert cache.stats()['bytes'] == os.path.getsize(path)
+    for _ in range(5):
+        cache.put(key, make_detections(2))
+    assert cache.stats()['bytes'] == os.path.getsize(path)
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""sharding 测试：工作进程初始化失败时报错而不是挂起，自动调优候选组合"""
+
+import time
+
+import pytest
+
+from sharding import ShardedDetector, tune_candidates
+
+
+def test_worker_init_failure_raises():
+    start = time.monotonic()
+    # 不存在的后端在工作进程加载模型时失败（未安装torch或ultralytics时为导入失败），不会触发下载
+    with pytest.raises(RuntimeError, match="启动失败"):
+        ShardedDetector('missing.pt', backend='bogus', workers=2, startup_timeout=60)
+    assert time.monotonic() - start < 60
+
+
+def test_tune_candidates():
+    assert tune_candidates(8) == [(1, 8), (2, 4), (4, 2), (8, 1)]
+    assert tune_candidates(6) == [(1, 6), (2, 3), (4, 1), (6, 1)]
+    assert tune_candidates(1) == [(1, 1)]
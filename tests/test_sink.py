@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""sink.DetectionSink 测试：按行数/定时写出、文件轮转、JSONL/CSV 列、无检测帧的标记行"""
+
+import csv
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from sink import COLUMNS, EMPTY_CLS, DetectionSink
+from utils import Detections
+
+
+def dets(n, ids=None):
+    xyxy = np.tile(np.array([[1.25, 2.5, 30.75, 40.0]], dtype=np.float32), (n, 1))
+    return Detections(xyxy, np.full(n, 0.875, dtype=np.float32), np.zeros(n, dtype=np.int32),
+                      None if ids is None else np.asarray(ids, dtype=np.int64))
+
+
+def read_jsonl(paths):
+    rows = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            rows.extend(json.loads(line) for line in f)
+    return rows
+
+
+def test_flush_by_row_threshold(tmp_path):
+    sink = DetectionSink(str(tmp_path / 'd'), flush_rows=5, flush_interval=0)
+    sink.write('a', 0, dets(3))
+    assert sink.flushes == 0 and sink.rows_written == 0
+    sink.write('a', 1, dets(2))
+    assert sink.flushes == 1 and sink.rows_written == 5
+    sink.write('a', 2, dets(1))
+    assert sink.rows_written == 5
+    sink.close()
+    assert sink.rows_written == 6
+    assert len(read_jsonl(sink.paths)) == 6
+
+
+def test_flush_by_timer(tmp_path):
+    sink = DetectionSink(str(tmp_path / 'd'), flush_rows=1000, flush_interval=0.1)
+    try:
+        sink.write('a', 0, dets(2))
+        deadline = time.monotonic() + 3
+        while sink.rows_written == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert sink.rows_written == 2
+        # 定时写出后文件内容已可读，不必等到 close()
+        assert len(read_jsonl(sink.paths)) == 2
+    finally:
+        sink.close()
+
+
+def test_rotation(tmp_path):
+    sink = DetectionSink(str(tmp_path / 'd'), flush_rows=1, flush_interval=0, rotate_rows=3)
+    for frame_id in range(4):
+        sink.write('a', frame_id, dets(2))
+    sink.close()
+    assert [os.path.basename(p) for p in sink.paths] == [
+        f'd_{sink.run_id}_0000.jsonl', f'd_{sink.run_id}_0001.jsonl', f'd_{sink.run_id}_0002.jsonl']
+    counts = [len(read_jsonl([p])) for p in sink.paths]
+    assert counts == [3, 3, 2]
+    assert [row['frame_id'] for row in read_jsonl(sink.paths)] == [0, 0, 1, 1, 2, 2, 3, 3]
+
+
+def test_reruns_do_not_overwrite(tmp_path):
+    with DetectionSink(str(tmp_path / 'd'), flush_interval=0) as first:
+        first.write('a', 0, dets(2))
+    with DetectionSink(str(tmp_path / 'd'), flush_interval=0) as second:
+        second.write('a', 0, dets(1))
+    assert first.run_id != second.run_id
+    assert set(first.paths).isdisjoint(second.paths)
+    assert len(read_jsonl(first.paths)) == 2
+    assert len(read_jsonl(second.paths)) == 1
+
+
+def test_concurrent_flushes_keep_frame_order(tmp_path):
+    sink = DetectionSink(str(tmp_path / 'd'), flush_interval=0)
+    entered, release = threading.Event(), threading.Event()
+    to_columns = sink._to_columns
+
+    def slow_to_columns(chunks):
+        # 第一次写出停在拼接阶段，模拟定时线程写出较慢时 write() 又触发了一次写出
+        if not entered.is_set():
+            entered.set()
+            release.wait(2)
+        return to_columns(chunks)
+
+    sink._to_columns = slow_to_columns
+    sink.write('a', 0, dets(1))
+    first = threading.Thread(target=sink.flush)
+    first.start()
+    assert entered.wait(2)
+    sink.write('a', 1, dets(1))
+    second = threading.Thread(target=sink.flush)
+    second.start()
+    second.join(0.1)
+    release.set()
+    first.join()
+    second.join()
+    sink.close()
+    assert [row['frame_id'] for row in read_jsonl(sink.paths)] == [0, 1]
+
+
+def test_jsonl_columns_and_track_ids(tmp_path):
+    with DetectionSink(str(tmp_path / 'd'), category_names={0: 'person'}, flush_interval=0) as sink:
+        sink.write('cam0', 7, dets(1), timestamp=12.3456)
+        sink.write('cam0', 8, dets(2, ids=[4, 5]), timestamp=13.0)
+    rows = read_jsonl(sink.paths)
+    assert list(rows[0]) == list(COLUMNS)
+    assert rows[0] == {'frame_id': 7, 'timestamp': 12.346, 'source': 'cam0', 'cls': 0, 'name': 'person',
+                       'conf': 0.875, 'x1': 1.2, 'y1': 2.5, 'x2': 30.8, 'y2': 40.0, 'track_id': -1}
+    assert [row['track_id'] for row in rows[1:]] == [4, 5]
+
+
+def test_csv_columns(tmp_path):
+    with DetectionSink(str(tmp_path / 'd'), fmt='csv', flush_interval=0) as sink:
+        sink.write('img.jpg', 0, dets(2, ids=[1, 2]))
+        sink.write('img2.jpg', 1, dets(1))
+    with open(sink.paths[0], newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert tuple(rows[0]) == COLUMNS
+    assert len(rows) == 4
+    assert [row[COLUMNS.index('track_id')] for row in rows[1:]] == ['1', '2', '-1']
+    assert rows[3][COLUMNS.index('source')] == 'img2.jpg'
+
+
+def test_empty_frame_marker(tmp_path):
+    with DetectionSink(str(tmp_path / 'd'), flush_interval=0) as sink:
+        sink.write('cam0', 0, Detections())
+        sink.write('cam0', 1, dets(1))
+    rows = read_jsonl(sink.paths)
+    assert len(rows) == 2
+    assert rows[0]['frame_id'] == 0
+    assert rows[0]['cls'] == EMPTY_CLS and rows[0]['name'] == '' and rows[0]['track_id'] == -1
+    assert rows[1]['cls'] == 0
+
+
+def test_empty_frame_marker_disabled(tmp_path):
+    with DetectionSink(str(tmp_path / 'd'), flush_interval=0, mark_empty=False) as sink:
+        sink.write('cam0', 0, Detections())
+    assert sink.rows_written == 0
+    assert sink.paths == []
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""tiling 模块测试：切片覆盖、按类别的 NMS/WBF 合并、切片坐标映射"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from tiling import detect_tiled, make_tiles, merge_detections, tile_origins
+from utils import Detections
+
+
+def dets(boxes, conf, cls):
+    return Detections(np.array(boxes, dtype=np.float32).reshape(-1, 4),
+                      np.array(conf, dtype=np.float32), np.array(cls, dtype=np.int32))
+
+
+@pytest.mark.parametrize('length,tile_size,overlap', [
+    (100, 640, 0.2), (640, 640, 0.2), (641, 640, 0.2), (1920, 640, 0.2),
+    (1000, 300, 0.0), (3840, 640, 0.25), (1001, 100, 0.5),
+])
+def test_tile_origins_cover_edges(length, tile_size, overlap):
+    starts = tile_origins(length, tile_size, overlap)
+    assert starts[0] == 0
+    assert starts == sorted(set(starts))
+    if length <= tile_size:
+        assert starts == [0]
+        return
+    # 最后一片贴齐边缘，且不越界
+    assert starts[-1] == length - tile_size
+    assert all(0 <= s <= length - tile_size for s in starts)
+    # 相邻切片之间没有空隙，且重叠不少于要求的比例
+    for prev, cur in zip(starts, starts[1:]):
+        assert cur - prev <= int(tile_size * (1 - overlap))
+    covered = np.zeros(length, dtype=bool)
+    for s in starts:
+        covered[s:s + tile_size] = True
+    assert covered.all()
+
+
+def test_make_tiles_views_and_origins():
+    image = np.arange(300 * 500 * 3, dtype=np.uint32).reshape(300, 500, 3)
+    tiles, origins = make_tiles(image, tile_size=200, overlap=0.2)
+    assert len(tiles) == len(origins)
+    for tile, (x, y) in zip(tiles, origins.astype(int)):
+        assert tile.shape[:2] == (200, 200)
+        assert np.shares_memory(tile, image)
+        assert tile[0, 0, 0] == image[y, x, 0]
+
+
+def test_nms_suppresses_duplicates_per_class():
+    merged = merge_detections(dets(
+        [[0, 0, 10, 10], [1, 0, 11, 10], [0, 0, 10, 10], [50, 50, 60, 60]],
+        [0.6, 0.9, 0.8, 0.5], [0, 0, 1, 0]), iou_threshold=0.5)
+    # 按置信度降序；同类重叠框只保留最高者，不同类别之间不互相抑制
+    np.testing.assert_allclose(merged.conf, [0.9, 0.8, 0.5])
+    assert merged.cls.tolist() == [0, 1, 0]
+    np.testing.assert_allclose(merged.xyxy[0], [1, 0, 11, 10])
+
+
+def test_nms_keeps_boxes_below_threshold():
+    boxes = [[0, 0, 10, 10], [6, 0, 16, 10]]
+    merged = merge_detections(dets(boxes, [0.9, 0.8], [0, 0]), iou_threshold=0.5)
+    assert len(merged) == 2
+
+
+def test_wbf_fuses_coordinates_by_confidence():
+    merged = merge_detections(dets([[0, 0, 10, 10], [2, 0, 12, 10]], [0.75, 0.25], [3, 3]),
+                              iou_threshold=0.5, method='wbf')
+    assert len(merged) == 1
+    np.testing.assert_allclose(merged.xyxy[0], [0.5, 0, 10.5, 10])
+    np.testing.assert_allclose(merged.conf, [0.75])
+    assert merged.cls.tolist() == [3]
+
+
+def dense_merge(detections, iou_threshold, method):
+    """合并的参考实现：全部框的IoU矩阵，按置信度逐行抑制"""
+    from tracker import iou_matrix
+
+    detections = detections[np.argsort(-detections.conf, kind='stable')]
+    xyxy, conf, cls = detections.xyxy, detections.conf, detections.cls
+    duplicate = (iou_matrix(xyxy, xyxy) >= iou_threshold) & (cls[:, None] == cls[None, :])
+    suppressed = np.zeros(len(conf), dtype=bool)
+    keep, fused = [], xyxy.copy()
+    for i in range(len(conf)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        group = duplicate[i] & ~suppressed
+        group[i] = True
+        if method == 'wbf':
+            fused[i] = (xyxy[group] * conf[group][:, None]).sum(axis=0) / conf[group].sum()
+        suppressed |= group
+    return fused[keep], conf[keep], cls[keep]
+
+
+@pytest.mark.parametrize('method', ['nms', 'wbf'])
+def test_merge_matches_dense_reference(method):
+    rng = np.random.default_rng(3)
+    n = 400
+    xy = rng.uniform(0, 300, (n, 2))
+    boxes = np.hstack([xy, xy + rng.uniform(10, 60, (n, 2))])
+    detections = dets(boxes, rng.uniform(0.1, 1, n), rng.integers(0, 4, n))
+    merged = merge_detections(detections, iou_threshold=0.4, method=method)
+    xyxy, conf, cls = dense_merge(detections, 0.4, method)
+    np.testing.assert_allclose(merged.xyxy, xyxy, rtol=1e-5)
+    np.testing.assert_array_equal(merged.conf, conf)
+    np.testing.assert_array_equal(merged.cls, cls)
+
+
+def test_merge_empty_and_invalid_method():
+    assert len(merge_detections(Detections())) == 0
+    with pytest.raises(ValueError):
+        merge_detections(Detections(), method='mean')
+
+
+class TileModel:
+    """在每个切片的 (10, 10) 处返回一个固定大小的框"""
+
+    def __call__(self, tiles, **kwargs):
+        data = np.array([[10, 10, 30, 30, 0.9, 0]], dtype=np.float32)
+        return [SimpleNamespace(boxes=Detections.from_packed(data.copy())) for _ in tiles]
+
+
+def test_detect_tiled_maps_boxes_to_image_coordinates():
+    image = np.zeros((300, 500, 3), dtype=np.uint8)
+    timings = {}
+    merged = detect_tiled(TileModel(), image, tile_size=200, overlap=0.2, batch_size=4,
+                          full_pass=False, timings=timings)
+    _, origins = make_tiles(image, 200, 0.2)
+    assert timings['tiles'] == len(origins)
+    expected = sorted(map(tuple, origins + 10))
+    assert sorted(map(tuple, merged.xyxy[:, :2])) == expected
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""tracker 模块测试：IoU矩阵、跟踪ID维持与删除、延迟补偿、关键帧调度"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from tracker import IoUTracker, KeyframeScheduler, TrackedDetector, iou_matrix
+from utils import Detections
+
+
+def dets(*boxes, cls=0, conf=0.9):
+    xyxy = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+    return Detections(xyxy, np.full(len(xyxy), conf, dtype=np.float32),
+                      np.full(len(xyxy), cls, dtype=np.int32))
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [100, 100, 110, 110]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], dtype=np.float32)
+    iou = iou_matrix(a, b)
+    assert iou.shape == (2, 2)
+    np.testing.assert_allclose(iou[0], [1.0, 50 / 150], rtol=1e-6)
+    np.testing.assert_allclose(iou[1], [0.0, 0.0])
+    assert iou_matrix(a, np.zeros((0, 4), dtype=np.float32)).shape == (2, 0)
+
+
+def test_ids_persist_across_keyframes():
+    tracker = IoUTracker(min_hits=2)
+    tracker.update(dets([0, 0, 20, 20], [100, 0, 120, 20]))
+    first = tracker.current()
+    assert first.ids.tolist() == [1, 2]
+    for step in range(1, 6):
+        tracker.predict()
+        # 两个目标分别向右、向下缓慢移动，顺序颠倒也应保持ID
+        tracker.update(dets([100, 2 * step, 120, 20 + 2 * step], [2 * step, 0, 20 + 2 * step, 20]))
+        current = tracker.current()
+        order = np.argsort(current.xyxy[:, 0])
+        assert current.ids[order].tolist() == [1, 2]
+    assert tracker.unique_count == 2
+
+
+def test_class_mismatch_starts_new_track():
+    tracker = IoUTracker()
+    tracker.update(dets([0, 0, 20, 20], cls=0))
+    tracker.update(dets([0, 0, 20, 20], cls=1))
+    assert sorted(tracker.ids.tolist()) == [1, 2]
+    assert tracker.current().ids.tolist() == [2]
+
+
+def test_track_dies_after_max_misses():
+    tracker = IoUTracker(max_misses=2)
+    tracker.update(dets([0, 0, 20, 20]))
+    tracker.update(dets())
+    # 未匹配的跟踪不再可见，但在 max_misses 之内仍保留
+    assert len(tracker.current()) == 0
+    assert tracker.ids.tolist() == [1]
+    tracker.update(dets())
+    assert tracker.ids.tolist() == [1]
+    tracker.update(dets())
+    assert len(tracker.ids) == 0
+    # 目标重新出现时分配新ID
+    tracker.update(dets([0, 0, 20, 20]))
+    assert tracker.current().ids.tolist() == [2]
+
+
+def test_reacquired_within_max_misses_keeps_id():
+    tracker = IoUTracker(max_misses=3)
+    tracker.update(dets([0, 0, 20, 20]))
+    tracker.update(dets())
+    tracker.update(dets([1, 0, 21, 20]))
+    assert tracker.current().ids.tolist() == [1]
+
+
+def test_constant_velocity_prediction():
+    tracker = IoUTracker(smoothing=1.0)
+    tracker.update(dets([0, 0, 20, 20]))
+    tracker.predict(2)
+    tracker.update(dets([8, 0, 28, 20]))
+    np.testing.assert_allclose(tracker.velocity[0], [4, 0, 4, 0])
+    tracker.predict()
+    np.testing.assert_allclose(tracker.current().xyxy[0], [12, 0, 32, 20])
+
+
+def test_lag_compensation():
+    tracker = IoUTracker(smoothing=1.0)
+    tracker.update(dets([0, 0, 20, 20]))
+    tracker.predict(2)
+    tracker.update(dets([8, 0, 28, 20]))
+    # 当前为第5帧，异步检测的结果对应第3帧（lag=2），真实位置 x=12
+    tracker.predict(3)
+    tracker.update(dets([12, 0, 32, 20]), lag=2)
+    current = tracker.current()
+    assert current.ids.tolist() == [1]
+    # 补偿到当前帧：12 + 4 * 2
+    np.testing.assert_allclose(current.xyxy[0], [20, 0, 40, 20])
+    np.testing.assert_allclose(tracker.velocity[0], [4, 0, 4, 0])
+    assert tracker.frames_since_update == 2
+
+
+def test_keyframe_scheduler_adapts_interval():
+    scheduler = KeyframeScheduler(min_interval=1, max_interval=4)
+    assert scheduler.step() and scheduler.step()
+    for _ in range(10):
+        scheduler.adapt(motion=0.0)
+    assert scheduler.interval == 4
+    keyframes = [scheduler.step() for _ in range(8)]
+    assert keyframes == [False, False, False, True] * 2
+    scheduler.adapt(motion=0.0, new_tracks=1)
+    assert scheduler.interval == 2
+    scheduler.adapt(motion=1.0)
+    assert scheduler.interval == 1
+    scheduler.adapt(motion=0.01)
+    assert scheduler.interval == 1
+
+
+class SlowModel:
+    """在推理中途读取输入，检查调用方是否在检测期间修改了同一帧"""
+
+    def __init__(self):
+        self.seen = []
+        self.started = threading.Event()
+
+    def __call__(self, frame, **kwargs):
+        self.started.set()
+        time.sleep(0.05)
+        self.seen.append(int(frame.max()))
+        return [SimpleNamespace(boxes=None)]
+
+
+def test_async_detection_uses_private_frame():
+    model = SlowModel()
+    tracked = TrackedDetector(model, asynchronous=True)
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    tracked.process(frame)
+    model.started.wait(1)
+    # 模拟渲染阶段在原帧上绘制
+    frame[:] = 255
+    tracked.close()
+    assert model.seen == [0]
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+切片推理模块
+把高分辨率图像切成相互重叠的切片，按批次送入模型，
+再把检测框映射回原图坐标，用向量化的NMS/WBF合并切片接缝处的重复框
+"""
+
+import time
+
+import numpy as np
+
+from tracker import iou_matrix
+from utils import Detections
+
+# 切片结果的合并方式
+MERGE_METHODS = ('nms', 'wbf')
+
+
+def tile_origins(length, tile_size, overlap):
+    """
+    计算一个维度上切片的起点，保证覆盖整个长度且最后一片贴齐边缘
+
+    Args:
+        length: 图像宽或高
+        tile_size: 切片边长
+        overlap: 相邻切片重叠比例（0~1）
+
+    Returns:
+        起点列表
+    """
+    if length <= tile_size:
+        return [0]
+    step = max(1, int(tile_size * (1 - overlap)))
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def make_tiles(image, tile_size=640, overlap=0.2):
+    """
+    切分图像（切片是原图的视图，不复制像素）
+
+    Args:
+        image: BGR图像
+        tile_size: 切片边长
+        overlap: 相邻切片重叠比例
+
+    Returns:
+        (切片列表, (T, 2) 切片左上角坐标 x, y)
+    """
+    height, width = image.shape[:2]
+    tiles, origins = [], []
+    for y in tile_origins(height, tile_size, overlap):
+        for x in tile_origins(width, tile_size, overlap):
+            tiles.append(image[y:y + tile_size, x:x + tile_size])
+            origins.append((x, y))
+    return tiles, np.array(origins, dtype=np.float32).reshape(-1, 2)
+
+
+def merge_detections(detections, iou_threshold=0.5, method='nms'):
+    """
+    按类别合并重叠检测框
+
+    nms 保留每组中置信度最高的框；wbf 用组内各框按置信度加权平均的坐标替换保留框。
+    先按类别分组，组内按置信度从高到低每次取一个保留框，只与剩余候选向量化计算一行IoU，
+    内存随框数线性增长，不构建全部框的N×N矩阵。
+
+    Args:
+        detections: 待合并的Detections
+        iou_threshold: 视为重复的IoU阈值
+        method: nms 或 wbf
+
+    Returns:
+        合并后的Detections
+    """
+    if method not in MERGE_METHODS:
+        raise ValueError(f"不支持的合并方式: {method}，可选: {', '.join(MERGE_METHODS)}")
+    if len(detections) == 0:
+        return detections
+
+    detections = detections[np.argsort(-detections.conf, kind='stable')]
+    xyxy, conf, cls = detections.xyxy, detections.conf, detections.cls
+
+    keep = []
+    fused = xyxy.copy()
+    # 不同类别之间不互相抑制，逐类处理
+    for label in np.unique(cls):
+        remaining = np.flatnonzero(cls == label)
+        while len(remaining):
+            i = remaining[0]
+            keep.append(i)
+            group = iou_matrix(xyxy[i:i + 1], xyxy[remaining])[0] >= iou_threshold
+            group[0] = True
+            if method == 'wbf':
+                members = remaining[group]
+                weights = conf[members]
+                fused[i] = (xyxy[members] * weights[:, None]).sum(axis=0) / weights.sum()
+            remaining = remaining[~group]
+
+    # 输出仍按置信度从高到低排列
+    keep = np.sort(np.array(keep, dtype=np.int64))
+    return Detections(fused[keep], conf[keep], cls[keep])
+
+
+def detect_tiled(model, image, conf=0.5, imgsz=640, tile_size=640, overlap=0.2,
+                 batch_size=8, merge='nms', iou_threshold=0.5, full_pass=True, timings=None):
+    """
+    切片推理
+
+    Args:
+        model: YOLO模型实例
+        image: BGR图像
+        conf: 置信度阈值
+        imgsz: 每个切片的推理尺寸
+        tile_size: 切片边长（原图像素）
+        overlap: 相邻切片重叠比例
+        batch_size: 每次前向推理的切片数，导出模型为静态batch=1时应设为1
+        merge: 合并方式，nms 或 wbf
+        iou_threshold: 合并时视为重复的IoU阈值
+        full_pass: 是否额外对整图推理一次，找回跨越多个切片的大目标
+        timings: 可选字典，累加各阶段耗时（秒）：tile/forward/merge，以及切片数 tiles
+
+    Returns:
+        原图坐标下的Detections
+    """
+    t0 = time.perf_counter()
+    tiles, origins = make_tiles(image, tile_size, overlap)
+    if full_pass and len(tiles) > 1:
+        tiles.append(image)
+        origins = np.vstack([origins, np.zeros((1, 2), dtype=np.float32)])
+    t1 = time.perf_counter()
+
+    parts = []
+    for start in range(0, len(tiles), batch_size):
+        results = model(tiles[start:start + batch_size], conf=conf, imgsz=imgsz, verbose=False)
+        for offset, result in zip(origins[start:start + batch_size], results):
+            part = Detections.from_boxes(result.boxes)
+            # 切片坐标加上切片左上角偏移，映射回原图
+            parts.append(Detections(part.xyxy + np.tile(offset, 2), part.conf, part.cls))
+    t2 = time.perf_counter()
+
+    merged = merge_detections(Detections.concatenate(parts), iou_threshold, merge)
+    t3 = time.perf_counter()
+
+    if timings is not None:
+        timings['tile'] = timings.get('tile', 0.0) + t1 - t0
+        timings['forward'] = timings.get('forward', 0.0) + t2 - t1
+        timings['merge'] = timings.get('merge', 0.0) + t3 - t2
+        timings['tiles'] = timings.get('tiles', 0) + len(tiles)
+    return merged
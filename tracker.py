@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+轻量目标跟踪模块
+只在关键帧上运行检测，关键帧之间用匀速运动模型外推检测框，
+通过IoU关联维持稳定的跟踪ID，并根据场景运动自适应调整关键帧间隔
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from utils import Detections
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    向量化计算两组框的IoU矩阵
+
+    Args:
+        boxes_a: (N, 4) xyxy
+        boxes_b: (M, 4) xyxy
+
+    Returns:
+        (N, M) IoU矩阵
+    """
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class IoUTracker:
+    """
+    IoU关联 + 匀速运动模型跟踪器
+
+    跟踪状态保存在连续数组中：boxes (T, 4)、velocity (T, 4，每帧位移)、
+    conf、cls、ids、hits、misses。
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=3, min_hits=2, smoothing=0.5):
+        """
+        Args:
+            iou_threshold: 关联所需的最小IoU
+            max_misses: 连续多少个关键帧未匹配后删除跟踪
+            min_hits: 匹配次数达到该值才计入唯一目标数
+            smoothing: 速度指数平滑系数，越大越信任最新观测
+        """
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.smoothing = smoothing
+
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.velocity = np.zeros((0, 4), dtype=np.float32)
+        self.conf = np.zeros(0, dtype=np.float32)
+        self.cls = np.zeros(0, dtype=np.int32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.misses = np.zeros(0, dtype=np.int32)
+        # 距上次关键帧观测的帧数，用于估计速度
+        self.frames_since_update = 0
+
+        self._next_id = 1
+        self.confirmed_ids = set()
+        self.last_new_tracks = 0
+
+    def predict(self, frames=1):
+        """按匀速运动模型外推所有跟踪框"""
+        self.boxes += self.velocity * frames
+        self.frames_since_update += frames
+
+    def update(self, detections, lag=0):
+        """
+        用关键帧检测结果更新跟踪
+
+        Args:
+            detections: 关键帧的Detections
+            lag: 检测结果对应的帧距当前帧的帧数（异步检测时大于0），
+                 匹配后按速度补偿到当前帧
+        """
+        det_boxes = np.asarray(detections.xyxy, dtype=np.float32)
+        det_conf, det_cls = detections.conf, detections.cls
+        elapsed = max(self.frames_since_update, 1)
+
+        # 关联前先把跟踪框回退到检测帧的位置
+        predicted = self.boxes - self.velocity * lag
+        iou = iou_matrix(predicted, det_boxes)
+        if iou.size:
+            iou[self.cls[:, None] != det_cls[None, :]] = 0
+
+        # 贪心匹配：IoU从高到低依次配对
+        matched_tracks, matched_dets = [], []
+        if iou.size:
+            candidates = np.argwhere(iou >= self.iou_threshold)
+            order = np.argsort(-iou[candidates[:, 0], candidates[:, 1]])
+            used_t, used_d = set(), set()
+            for t, d in candidates[order]:
+                if t in used_t or d in used_d:
+                    continue
+                used_t.add(t)
+                used_d.add(d)
+                matched_tracks.append(t)
+                matched_dets.append(d)
+        matched_tracks = np.array(matched_tracks, dtype=np.int64)
+        matched_dets = np.array(matched_dets, dtype=np.int64)
+
+        # 匹配的跟踪：更新速度（平滑）、位置和置信度
+        if len(matched_tracks):
+            observed = (det_boxes[matched_dets] - (predicted[matched_tracks]
+                        - self.velocity[matched_tracks] * (elapsed - lag))) / max(elapsed - lag, 1)
+            self.velocity[matched_tracks] = (self.smoothing * observed
+                                             + (1 - self.smoothing) * self.velocity[matched_tracks])
+            self.boxes[matched_tracks] = det_boxes[matched_dets] + self.velocity[matched_tracks] * lag
+            self.conf[matched_tracks] = det_conf[matched_dets]
+            self.hits[matched_tracks] += 1
+            self.misses[matched_tracks] = 0
+            confirmed = self.ids[matched_tracks][self.hits[matched_tracks] >= self.min_hits]
+            self.confirmed_ids.update(confirmed.tolist())
+
+        # 未匹配的跟踪：累计丢失次数，超限删除
+        unmatched_tracks = np.ones(len(self.ids), dtype=bool)
+        unmatched_tracks[matched_tracks] = False
+        self.misses[unmatched_tracks] += 1
+        keep = self.misses <= self.max_misses
+        self._select(keep)
+
+        # 未匹配的检测：新建跟踪
+        new_dets = np.ones(len(det_cls), dtype=bool)
+        new_dets[matched_dets] = False
+        count = int(new_dets.sum())
+        self.last_new_tracks = count
+        if count:
+            self.boxes = np.concatenate([self.boxes, det_boxes[new_dets]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((count, 4), dtype=np.float32)])
+            self.conf = np.concatenate([self.conf, det_conf[new_dets]])
+            self.cls = np.concatenate([self.cls, det_cls[new_dets].astype(np.int32)])
+            self.ids = np.concatenate([self.ids, np.arange(self._next_id, self._next_id + count)])
+            self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int32)])
+            self.misses = np.concatenate([self.misses, np.zeros(count, dtype=np.int32)])
+            self._next_id += count
+            if self.min_hits <= 1:
+                self.confirmed_ids.update(self.ids[-count:].tolist())
+
+        self.frames_since_update = lag
+
+    def _select(self, keep):
+        self.boxes = self.boxes[keep]
+        self.velocity = self.velocity[keep]
+        self.conf = self.conf[keep]
+        self.cls = self.cls[keep]
+        self.ids = self.ids[keep]
+        self.hits = self.hits[keep]
+        self.misses = self.misses[keep]
+
+    def current(self):
+        """
+        当前可见的跟踪（最近一个关键帧匹配成功的）
+
+        Returns:
+            带跟踪ID的Detections
+        """
+        visible = self.misses == 0
+        return Detections(self.boxes[visible], self.conf[visible], self.cls[visible], self.ids[visible])
+
+    def motion(self):
+        """
+        场景运动量：跟踪框每帧位移相对框尺寸的平均值
+
+        Returns:
+            相对运动量，无跟踪时为0
+        """
+        if len(self.ids) == 0:
+            return 0.0
+        size = np.maximum(np.hypot(self.boxes[:, 2] - self.boxes[:, 0],
+                                   self.boxes[:, 3] - self.boxes[:, 1]), 1.0)
+        speed = np.hypot(self.velocity[:, 0] + self.velocity[:, 2],
+                         self.velocity[:, 1] + self.velocity[:, 3]) / 2
+        return float(np.mean(speed / size))
+
+    @property
+    def unique_count(self):
+        """已确认的唯一目标数"""
+        return len(self.confirmed_ids)
+
+
+class KeyframeScheduler:
+    """
+    自适应关键帧调度
+
+    场景运动大或出现新目标时缩短关键帧间隔，场景平稳时逐步放宽
+    """
+
+    def __init__(self, min_interval=1, max_interval=10, high_motion=0.02, low_motion=0.005):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.high_motion = high_motion
+        self.low_motion = low_motion
+        self.interval = min_interval
+        self._since = max_interval
+
+    def step(self):
+        """推进一帧，返回该帧是否应作为关键帧"""
+        self._since += 1
+        if self._since >= self.interval:
+            self._since = 0
+            return True
+        return False
+
+    def adapt(self, motion, new_tracks=0):
+        """
+        根据最近一次关键帧后的场景状态调整间隔
+
+        Args:
+            motion: 跟踪器的相对运动量
+            new_tracks: 本次关键帧新出现的目标数
+        """
+        if new_tracks or motion > self.high_motion:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif motion < self.low_motion:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+
+class TrackedDetector:
+    """
+    关键帧检测 + 帧间跟踪
+
+    asynchronous=True 时检测在后台线程执行，非关键帧不等待检测结果，
+    适合实时显示；离线处理视频时使用同步模式，结果与帧严格对应。
+    """
+
+    def __init__(self, model, conf=0.5, imgsz=320, max_interval=10, asynchronous=True,
+                 metrics=None):
+        """
+        Args:
+            model: YOLO模型实例
+            conf: 检测置信度阈值
+            imgsz: 推理尺寸
+            max_interval: 关键帧间隔上限（帧）
+            asynchronous: 是否在后台线程执行检测
+            metrics: 可选的 DetectorMetrics，记录检测耗时和跳过检测的帧数
+        """
+        self.model = model
+        self.conf = conf
+        self.imgsz = imgsz
+        self.tracker = IoUTracker()
+        self.scheduler = KeyframeScheduler(max_interval=max_interval)
+        self.asynchronous = asynchronous
+        self._executor = ThreadPoolExecutor(max_workers=1) if asynchronous else None
+        self._future = None
+        self._submitted_frame = 0
+        self.metrics = metrics
+        self.frame_index = 0
+        self.detections_run = 0
+        self.skipped = 0
+
+    def _detect(self, frame):
+        start = time.perf_counter()
+        results = self.model(frame, conf=self.conf, imgsz=self.imgsz, verbose=False)
+        detections = Detections.from_boxes(results[0].boxes)
+        if self.metrics is not None:
+            self.metrics.observe_inference(time.perf_counter() - start, [len(detections)])
+        return detections
+
+    def _apply(self, detections, lag):
+        self.tracker.update(detections, lag)
+        self.scheduler.adapt(self.tracker.motion(), self.tracker.last_new_tracks)
+        self.detections_run += 1
+
+    def process(self, frame):
+        """
+        处理一帧
+
+        Returns:
+            当前帧带跟踪ID的Detections
+        """
+        self.frame_index += 1
+        keyframe = self.scheduler.step()
+        self.tracker.predict()
+
+        if not self.asynchronous:
+            if keyframe:
+                self._apply(self._detect(frame), 0)
+            else:
+                self._skip()
+            return self.tracker.current()
+
+        # 后台检测完成：以检测帧到当前帧的延迟补偿后更新跟踪
+        if self._future is not None and self._future.done():
+            self._apply(self._future.result(), self.frame_index - self._submitted_frame)
+            self._future = None
+        if keyframe and self._future is None:
+            # 后台检测期间调用方会继续在原帧上绘制，必须交给检测线程一份独立的拷贝
+            self._future = self._executor.submit(self._detect, frame.copy())
+            self._submitted_frame = self.frame_index
+        else:
+            self._skip()
+        return self.tracker.current()
+
+    def _skip(self):
+        self.skipped += 1
+        if self.metrics is not None:
+            self.metrics.skipped.inc()
+
+    def close(self):
+        """停止后台检测线程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+def draw_track_ids(image, detections, color=(0, 255, 255)):
+    """
+    在检测框左下角绘制跟踪ID
+
+    Args:
+        image: BGR图像（原地绘制）
+        detections: 带跟踪ID的Detections，没有ID时不绘制
+    """
+    if detections.ids is None:
+        return image
+    for box, track_id in zip(np.rint(detections.xyxy).astype(np.int32), detections.ids):
+        cv2.putText(image, f"#{int(track_id)}", (int(box[0]) + 2, int(box[3]) - 4),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return image
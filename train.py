@@ -1,6 +1,13 @@
 from ultralytics import YOLO
 import argparse
 import os
+from backends import VARIANTS, load_model as load_backend_model, model_hash, supports_variant
+from dataset_cache import CachedDetectionTrainer, prepare_dataset
+from evaluation import (dir_size_mb, measure_latency, measure_throughput, per_class_ap,
+                        val_image_paths, write_val_report)
+from result_cache import RAW_CONF, DetectionCache
+from sink import SINK_FORMATS, DetectionSink
+from utils import Detections, collect_image_paths, draw_detection_result, output_path_mapper
 
 # 解析命令行参数
 parser = argparse.ArgumentParser(description='YOLOv8 Object Detection Training')
@@ -16,8 +23,19 @@ parser.add_argument('--device', type=str, default='0', help='Device to use for t
 parser.add_argument('--workers', type=int, default=8, help='Number of workers')
 parser.add_argument('--project', type=str, default='object_training', help='Project name')
 parser.add_argument('--name', type=str, default='exp1', help='Experiment name')
-parser.add_argument('--mode', type=str, default='train', choices=['train', 'val', 'test'], help='Mode: train, val, or test')
+parser.add_argument('--mode', type=str, default='train', choices=['train', 'val', 'test', 'quantize', 'prepare'], help='Mode: train, val, test, quantize, or prepare (build the dataset cache only)')
 parser.add_argument('--source', type=str, default=None, help='Source for prediction (required for test mode)')
+parser.add_argument('--conf', type=float, default=0.5, help='Confidence threshold (test mode)')
+parser.add_argument('--no-cache', action='store_true', help='Disable the detection result cache (test mode)')
+parser.add_argument('--cache-dir', type=str, default='.cache/detections', help='Detection result cache directory (test mode)')
+parser.add_argument('--sink-format', type=str, default='jsonl', choices=SINK_FORMATS, help='Detection results file format (test mode); parquet requires pyarrow')
+parser.add_argument('--fraction', type=float, default=1.0, help='Fraction of the dataset used for INT8 calibration (quantize mode)')
+parser.add_argument('--latency-images', type=int, default=50, help='Number of val images used to measure latency (quantize mode)')
+parser.add_argument('--val-imgsz', type=str, default=None, help='Comma-separated image sizes to sweep in val mode (default: --imgsz)')
+parser.add_argument('--val-backends', type=str, default='torch', help='Comma-separated backends to sweep in val mode: torch, onnx, openvino')
+parser.add_argument('--val-variants', type=str, default='fp32', help='Comma-separated precision variants to sweep in val mode: fp32, half, int8')
+parser.add_argument('--dataset-cache', type=str, default='.cache/dataset', help='Directory of the preprocessed memory-mapped dataset cache (train/prepare mode)')
+parser.add_argument('--no-dataset-cache', action='store_true', help='Decode images from disk every epoch instead of using the dataset cache (train mode)')
 
 args = parser.parse_args()
 
@@ -45,8 +63,19 @@ if args.mode == 'train':
     print(f"Workers: {args.workers}")
     print(f"Project: {args.project}")
     print(f"Experiment: {args.name}")
+    print(f"Dataset Cache: {'disabled' if args.no_dataset_cache else args.dataset_cache}")
     print("========================================\n")
     
+    # 预先校验数据集并把图片解码、缩放到训练尺寸，训练时从内存映射读取
+    train_kwargs = {}
+    if not args.no_dataset_cache:
+        stores = prepare_dataset(args.data, args.imgsz, args.dataset_cache, args.workers)
+        if stores is None:
+            print("Error: Dataset validation failed, fix the issues above or pass --no-dataset-cache")
+            exit(1)
+        CachedDetectionTrainer.stores = stores
+        train_kwargs['trainer'] = CachedDetectionTrainer
+    
     results = model.train(
         data=args.data,
         epochs=args.epochs,
@@ -58,7 +87,8 @@ if args.mode == 'train':
         device=args.device,
         workers=args.workers,
         project=args.project,
-        name=args.name
+        name=args.name,
+        **train_kwargs
     )
     
     print(f"\n=== Training Completed ===")
@@ -67,27 +97,75 @@ if args.mode == 'train':
     print(f"Last model: {os.path.join(results.save_dir, 'weights', 'last.pt')}")
     
 elif args.mode == 'val':
-    # 验证模型
+    # 验证模型：按 imgsz × 后端 × 精度变体 扫描，记录精度、延迟和吞吐
+    imgsz_list = [int(v) for v in args.val_imgsz.split(',')] if args.val_imgsz else [args.imgsz]
+    backends = [b.strip() for b in args.val_backends.split(',') if b.strip()]
+    variants = [v.strip() for v in args.val_variants.split(',') if v.strip()]
+    
     print(f"\n=== Validating YOLOv8 on Dataset ===")
     print(f"Model: {args.model}")
     print(f"Dataset: {args.data}")
-    print(f"Image Size: {args.imgsz}")
+    print(f"Image Sizes: {imgsz_list}")
+    print(f"Backends: {backends}")
+    print(f"Variants: {variants}")
     print(f"Batch Size: {args.batch}")
     print(f"Device: {args.device}")
     print("========================================\n")
     
-    results = model.val(
-        data=args.data,
-        imgsz=args.imgsz,
-        batch=args.batch,
-        device=args.device
-    )
+    latency_images = val_image_paths(args.data, args.latency_images)
+    records = []
+    for imgsz in imgsz_list:
+        for backend in backends:
+            for variant in variants:
+                config = f"{backend}/{variant}/{imgsz}"
+                if variant not in VARIANTS or not supports_variant(backend, variant, args.device):
+                    print(f"Skipping {config}: not supported on device {args.device}")
+                    continue
+                
+                # torch 半精度在推理时指定；导出后端的精度在导出时确定
+                half = backend == 'torch' and variant == 'half'
+                candidate = model if backend == 'torch' else \
+                    load_backend_model(args.model, backend, imgsz, variant, args.data)
+                # 导出模型为静态batch=1
+                batch = args.batch if backend == 'torch' else 1
+                results = candidate.val(data=args.data, imgsz=imgsz, batch=batch, device=args.device,
+                                        half=half, plots=False)
+                
+                latency = measure_latency(candidate, latency_images, imgsz, device=args.device, half=half)
+                throughput = measure_throughput(candidate, latency_images, imgsz, batch,
+                                                device=args.device, half=half)
+                records.append({
+                    'config': config,
+                    'backend': backend,
+                    'variant': variant,
+                    'imgsz': imgsz,
+                    'map50': round(float(results.box.map50), 4),
+                    'map': round(float(results.box.map), 4),
+                    'precision': round(float(results.box.mp), 4),
+                    'recall': round(float(results.box.mr), 4),
+                    'latency_ms': round(latency, 2),
+                    'throughput_ips': round(throughput, 2),
+                    'per_class': per_class_ap(results),
+                })
+                
+                print(f"\n=== Validation Results ({config}) ===")
+                print(f"mAP@0.5: {results.box.map50:.4f}")
+                print(f"mAP@0.5:0.95: {results.box.map:.4f}")
+                print(f"Precision: {results.box.mp:.4f}")
+                print(f"Recall: {results.box.mr:.4f}")
+                print(f"Latency: {latency:.1f} ms/img, Throughput: {throughput:.1f} img/s")
     
-    print(f"\n=== Validation Results ===")
-    print(f"mAP@0.5: {results.box.map:.4f}")
-    print(f"mAP@0.5:0.95: {results.box.map50_95:.4f}")
-    print(f"Precision: {results.box.mp:.4f}")
-    print(f"Recall: {results.box.mr:.4f}")
+    if not records:
+        print("Error: No supported configuration to validate!")
+        exit(1)
+    
+    front, report_path = write_val_report(records, os.path.join(args.project, f"{args.name}_val"))
+    print(f"\n=== Speed/Accuracy Summary ===")
+    print(f"{'Config':<24}{'mAP50':>8}{'mAP50-95':>10}{'ms/img':>9}{'img/s':>9}  Pareto")
+    for record in records:
+        print(f"{record['config']:<24}{record['map50']:>8.4f}{record['map']:>10.4f}"
+              f"{record['latency_ms']:>9.1f}{record['throughput_ips']:>9.1f}  {'*' if record in front else ''}")
+    print(f"Report saved to: {report_path}")
     
 elif args.mode == 'test':
     # 测试模型
@@ -100,21 +178,136 @@ elif args.mode == 'test':
     print(f"Source: {args.source}")
     print(f"Image Size: {args.imgsz}")
     print(f"Device: {args.device}")
+    print(f"Cache: {'disabled' if args.no_cache else args.cache_dir}")
     print("========================================\n")
     
-    results = model.predict(
-        source=args.source,
+    # 结果缓存只适用于图片文件；视频、摄像头等来源直接走predict
+    image_paths = [] if args.no_cache or args.conf < RAW_CONF else collect_image_paths(args.source)
+    
+    # 检测结果按列缓冲后批量写出
+    save_dir = os.path.join(args.project, f"{args.name}_test")
+    sink = DetectionSink(os.path.join(save_dir, 'detections'), fmt=args.sink_format,
+                         category_names=model.names)
+    
+    if not image_paths:
+        results = model.predict(
+            source=args.source,
+            imgsz=args.imgsz,
+            device=args.device,
+            save=True,
+            show=False,
+            conf=args.conf,
+            stream=True
+        )
+        
+        result_dir = None
+        for frame_id, result in enumerate(results):
+            sink.write(result.path, frame_id, Detections.from_boxes(result.boxes))
+            result_dir = result.save_dir
+        sink.close()
+        
+        print(f"\n=== Testing Completed ===")
+        print(f"Results saved to: {result_dir}")
+        print(f"Detections: {', '.join(sink.paths) or 'none'} ({sink.rows_written} rows)")
+    else:
+        import cv2
+        import numpy as np
+        
+        cache = DetectionCache(args.cache_dir, model_hash(model.ckpt_path or args.model), args.imgsz)
+        # 标注图片保留输入的子目录结构，递归输入中的同名图片不会相互覆盖
+        output_path = output_path_mapper(image_paths, save_dir)
+        
+        for frame_id, path in enumerate(image_paths):
+            with open(path, 'rb') as f:
+                data = f.read()
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                print(f"Warning: cannot read image {path}, skipped")
+                continue
+            
+            # 缓存保存低阈值下的原始检测结果，命中时只按conf重新过滤
+            key = cache.key(data)
+            detections = cache.get(key)
+            if detections is None:
+                result = model.predict(img, imgsz=args.imgsz, device=args.device,
+                                       conf=RAW_CONF, verbose=False)[0]
+                detections = Detections.from_boxes(result.boxes)
+                cache.put(key, detections)
+            
+            detections = detections.filter_conf(args.conf)
+            sink.write(path, frame_id, detections)
+            annotated = draw_detection_result(img, detections, model.names, args.conf, copy=False)
+            out_path = output_path(frame_id, path)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            cv2.imwrite(out_path, annotated)
+        
+        sink.close()
+        
+        stats = cache.stats()
+        print(f"\n=== Testing Completed ===")
+        print(f"Images: {len(image_paths)}, cache hits: {stats['hits']}, misses: {stats['misses']}")
+        print(f"Results saved to: {save_dir}")
+        print(f"Detections: {', '.join(sink.paths) or 'none'} ({sink.rows_written} rows)")
+
+elif args.mode == 'quantize':
+    # 训练后静态INT8量化
+    print(f"\n=== Quantizing YOLOv8 to INT8 ===")
+    print(f"Model: {args.model}")
+    print(f"Dataset: {args.data}")
+    print(f"Image Size: {args.imgsz}")
+    print(f"Calibration Fraction: {args.fraction}")
+    print("========================================\n")
+    
+    latency_images = val_image_paths(args.data, args.latency_images)
+    if not latency_images:
+        print(f"Error: No val images found for dataset {args.data}!")
+        exit(1)
+    
+    # 量化前：原始FP32模型
+    before = model.val(data=args.data, imgsz=args.imgsz, batch=1, device='cpu', plots=False)
+    before_latency = measure_latency(model, latency_images, args.imgsz)
+    
+    # 使用val划分的样本做静态INT8校准，导出为OpenVINO模型
+    quantized_path = model.export(
+        format='openvino',
+        int8=True,
+        data=args.data,
         imgsz=args.imgsz,
-        device=args.device,
-        save=True,
-        show=False,
-        conf=0.5
+        fraction=args.fraction
     )
     
-    print(f"\n=== Testing Completed ===")
-    print(f"Results saved to: {results[0].save_dir}")
+    # 量化后：INT8模型
+    quantized = YOLO(quantized_path, task='detect')
+    after = quantized.val(data=args.data, imgsz=args.imgsz, batch=1, device='cpu', plots=False)
+    after_latency = measure_latency(quantized, latency_images, args.imgsz)
+    
+    print(f"\n=== Quantization Report ===")
+    print(f"{'Metric':<18}{'FP32':>12}{'INT8':>12}")
+    print(f"{'mAP@0.5':<18}{before.box.map50:>12.4f}{after.box.map50:>12.4f}")
+    print(f"{'mAP@0.5:0.95':<18}{before.box.map:>12.4f}{after.box.map:>12.4f}")
+    print(f"{'Latency (ms/img)':<18}{before_latency:>12.1f}{after_latency:>12.1f}")
+    print(f"{'Size (MB)':<18}{dir_size_mb(model.ckpt_path or args.model):>12.1f}{dir_size_mb(quantized_path):>12.1f}")
+    print(f"Speedup: {before_latency / after_latency:.2f}x")
+    print(f"\nQuantized model: {quantized_path}")
+    print(f"Run detector with: python object_detector.py --model {quantized_path} --backend openvino "
+          f"--imgsz {args.imgsz}")
+
+elif args.mode == 'prepare':
+    # 只校验数据集并生成预处理缓存
+    print(f"\n=== Preparing Dataset Cache ===")
+    print(f"Dataset: {args.data}")
+    print(f"Image Size: {args.imgsz}")
+    print(f"Cache Dir: {args.dataset_cache}")
+    print("========================================\n")
+    
+    stores = prepare_dataset(args.data, args.imgsz, args.dataset_cache, args.workers)
+    if stores is None:
+        print("Error: Dataset validation failed!")
+        exit(1)
+    for split, store in stores.items():
+        print(f"{split}: {len(store)} images, {len(store.packed_labels)} boxes")
 
 else:
     print(f"Error: Invalid mode {args.mode}!")
-    print("Please choose from: train, val, test")
+    print("Please choose from: train, val, test, quantize, prepare")
     exit(1)
\ No newline at end of file
@@ -88,8 +88,307 @@ COCO_CATEGORY_NAMES = {
     79: 'toothbrush'  # 牙刷
 }
 
+# 批量检测支持的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
 
-def draw_detection_result(image, boxes, category_names, conf_threshold=0.5):
+
+class Detections:
+    """
+    检测结果容器
+    
+    由几个连续的NumPy数组组成：xyxy (N, 4) float32、conf (N,) float32、cls (N,) int32，
+    以及可选的跟踪ID ids (N,) int64。过滤、查表都是整列的向量化操作；
+    按切片取子集时返回共享内存的视图，不拷贝数据。
+    """
+    
+    __slots__ = ('xyxy', 'conf', 'cls', 'ids')
+    
+    def __init__(self, xyxy=None, conf=None, cls=None, ids=None):
+        import numpy as np
+        
+        self.xyxy = np.zeros((0, 4), dtype=np.float32) if xyxy is None else xyxy
+        self.conf = np.zeros(0, dtype=np.float32) if conf is None else conf
+        self.cls = np.zeros(0, dtype=np.int32) if cls is None else cls
+        self.ids = ids
+    
+    @classmethod
+    def from_boxes(cls, boxes):
+        """
+        一次性把ultralytics的检测框转换为连续数组
+        
+        Args:
+            boxes: ultralytics的Boxes对象；已是Detections时原样返回
+        
+        Returns:
+            Detections实例
+        """
+        import numpy as np
+        
+        if isinstance(boxes, Detections):
+            return boxes
+        if boxes is None or len(boxes) == 0:
+            return cls()
+        
+        # Boxes.data 为 (N, 6)：x1, y1, x2, y2, conf, cls，只做一次设备到主机的拷贝
+        data = boxes.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        return cls.from_packed(np.ascontiguousarray(data, dtype=np.float32))
+    
+    @classmethod
+    def from_packed(cls, data):
+        """
+        从 (N, 6) float32 数组（x1, y1, x2, y2, conf, cls）构建，坐标和置信度为原数组的视图
+        
+        Args:
+            data: (N, 6) 数组
+        
+        Returns:
+            Detections实例
+        """
+        import numpy as np
+        
+        return cls(data[:, :4], data[:, 4], data[:, 5].astype(np.int32))
+    
+    def packed(self):
+        """
+        打包为 (N, 6) float32 数组（x1, y1, x2, y2, conf, cls），用于缓存落盘
+        
+        Returns:
+            (N, 6) 数组
+        """
+        import numpy as np
+        
+        data = np.empty((len(self), 6), dtype=np.float32)
+        data[:, :4] = self.xyxy
+        data[:, 4] = self.conf
+        data[:, 5] = self.cls
+        return data
+    
+    @classmethod
+    def concatenate(cls, parts):
+        """
+        拼接多帧的检测结果，每列只做一次拷贝
+        
+        Args:
+            parts: Detections列表
+        
+        Returns:
+            Detections实例；所有部分都带跟踪ID时保留ids
+        """
+        import numpy as np
+        
+        if not parts:
+            return cls()
+        if len(parts) == 1:
+            return parts[0]
+        ids = None
+        if all(part.ids is not None for part in parts):
+            ids = np.concatenate([part.ids for part in parts])
+        return cls(np.concatenate([part.xyxy for part in parts]),
+                   np.concatenate([part.conf for part in parts]),
+                   np.concatenate([part.cls for part in parts]),
+                   ids)
+    
+    def __len__(self):
+        return len(self.cls)
+    
+    def __getitem__(self, index):
+        """按切片、布尔掩码或索引数组取子集；切片返回视图，整数（含NumPy整数）返回只含一个框的Detections"""
+        import numbers
+        
+        if isinstance(index, numbers.Integral) and not isinstance(index, bool):
+            position = int(index) + len(self) if index < 0 else int(index)
+            if not 0 <= position < len(self):
+                raise IndexError(f"检测框索引越界: {index}（共 {len(self)} 个）")
+            index = slice(position, position + 1)
+        return Detections(self.xyxy[index], self.conf[index], self.cls[index],
+                          None if self.ids is None else self.ids[index])
+    
+    def __repr__(self):
+        tracked = '' if self.ids is None else ', tracked'
+        return f"Detections({len(self)} boxes{tracked})"
+    
+    def with_ids(self, ids):
+        """返回附带跟踪ID的新实例（共享原有数组）"""
+        return Detections(self.xyxy, self.conf, self.cls, ids)
+    
+    def filter_conf(self, conf_threshold):
+        """
+        按置信度阈值过滤
+        
+        Args:
+            conf_threshold: 置信度阈值
+        
+        Returns:
+            过滤后的Detections
+        """
+        return self[self.conf >= conf_threshold]
+    
+    def filter_classes(self, classes):
+        """
+        只保留指定类别
+        
+        Args:
+            classes: 类别ID列表
+        
+        Returns:
+            过滤后的Detections
+        """
+        import numpy as np
+        
+        return self[np.isin(self.cls, np.asarray(list(classes), dtype=np.int32))]
+    
+    def names(self, category_names=None):
+        """
+        查找每个检测框的类别名称（只对出现过的类别查表，再按逆索引展开）
+        
+        Args:
+            category_names: 类别名称映射，默认COCO 80类；可用 load_category_names 加载 object.yaml
+        
+        Returns:
+            (N,) object数组，未知类别返回ID字符串
+        """
+        import numpy as np
+        
+        category_names = COCO_CATEGORY_NAMES if category_names is None else category_names
+        uniq, inverse = np.unique(self.cls, return_inverse=True)
+        table = np.array([category_names.get(int(c), str(int(c))) for c in uniq] or [''], dtype=object)
+        return table[inverse.reshape(-1)]
+
+
+class DetectionRenderer:
+    """
+    向量化检测结果绘制器
+    
+    置信度和类别过滤使用数组掩码完成，边界框一次性批量绘制，
+    标签文字按（类别, 置信度档位）预渲染后缓存，绘制时直接贴图。
+    """
+    
+    def __init__(self, category_names, color=(0, 255, 0), thickness=2, font_scale=0.5):
+        import numpy as np
+        
+        self.category_names = category_names
+        self.color = np.array(color, dtype=np.uint8)
+        self.thickness = thickness
+        self.font_scale = font_scale
+        
+        # 类别ID查找表：cls_id -> 是否需要显示
+        max_id = max(category_names) if category_names else 0
+        self._class_lut = np.zeros(max_id + 1, dtype=bool)
+        self._class_lut[list(category_names)] = True
+        
+        # 标签缓存：(cls_id, 置信度百分位) -> (掩码, 基线以上高度)
+        self._label_cache = {}
+    
+    def _label(self, cls_id, conf_bucket):
+        """获取预渲染的标签掩码"""
+        key = (cls_id, conf_bucket)
+        cached = self._label_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        import cv2
+        import numpy as np
+        
+        label = f"{self.category_names[cls_id]}: {conf_bucket / 100:.2f}"
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        (w, h), baseline = cv2.getTextSize(label, font, self.font_scale, self.thickness)
+        pad = self.thickness
+        patch = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+        cv2.putText(patch, label, (pad, h + pad), font, self.font_scale, 255, self.thickness)
+        cached = (patch > 0, h + pad)
+        self._label_cache[key] = cached
+        return cached
+    
+    def filter(self, boxes, conf_threshold=0.5):
+        """
+        按置信度和类别过滤检测结果
+        
+        Returns:
+            过滤后的Detections
+        """
+        detections = Detections.from_boxes(boxes)
+        cls = detections.cls
+        valid = (cls >= 0) & (cls < len(self._class_lut))
+        keep = detections.conf >= conf_threshold
+        keep[valid] &= self._class_lut[cls[valid]]
+        keep &= valid
+        return detections[keep]
+    
+    def draw(self, image, boxes, conf_threshold=0.5, copy=True):
+        """
+        在图像上绘制检测结果
+        
+        Args:
+            image: 原始图像（BGR）
+            boxes: Detections或Boxes对象
+            conf_threshold: 置信度阈值
+            copy: 为False时直接在原图上绘制，省去整幅图像的拷贝
+        
+        Returns:
+            绘制了检测结果的图像
+        """
+        import cv2
+        import numpy as np
+        
+        annotated_image = image.copy() if copy else image
+        detections = self.filter(boxes, conf_threshold)
+        if len(detections) == 0:
+            return annotated_image
+        cls = detections.cls
+        
+        # 所有边界框一次性绘制
+        corners = np.rint(detections.xyxy).astype(np.int32)
+        x1, y1, x2, y2 = corners.T
+        polygons = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                             np.stack([x2, y2], 1), np.stack([x1, y2], 1)], axis=1)
+        cv2.polylines(annotated_image, list(polygons), True,
+                      tuple(int(c) for c in self.color), self.thickness)
+        
+        # 标签贴图：文字基线位于框上方10像素处
+        img_h, img_w = annotated_image.shape[:2]
+        buckets = np.rint(detections.conf * 100).astype(np.int32)
+        for i in range(len(cls)):
+            mask, ascent = self._label(int(cls[i]), int(buckets[i]))
+            top = int(y1[i]) - 10 - ascent
+            left = int(x1[i]) - self.thickness
+            
+            # 裁剪到图像范围内
+            my0, mx0 = max(0, -top), max(0, -left)
+            my1 = min(mask.shape[0], img_h - top)
+            mx1 = min(mask.shape[1], img_w - left)
+            if my0 >= my1 or mx0 >= mx1:
+                continue
+            roi = annotated_image[top + my0:top + my1, left + mx0:left + mx1]
+            roi[mask[my0:my1, mx0:mx1]] = self.color
+        
+        return annotated_image
+
+
+# 绘制器缓存，避免重复构建查找表和标签缓存
+_renderers = {}
+
+
+def get_renderer(category_names):
+    """
+    获取类别名称映射对应的共享绘制器
+    
+    Args:
+        category_names: 类别名称映射
+    
+    Returns:
+        DetectionRenderer实例
+    """
+    key = id(category_names)
+    entry = _renderers.get(key)
+    if entry is None or entry[0] is not category_names:
+        entry = (category_names, DetectionRenderer(category_names))
+        _renderers[key] = entry
+    return entry[1]
+
+
+def draw_detection_result(image, boxes, category_names, conf_threshold=0.5, copy=True):
     """
     在图像上绘制检测结果
     
@@ -98,41 +397,12 @@ def draw_detection_result(image, boxes, category_names, conf_threshold=0.5):
         boxes: 检测结果的边界框
         category_names: 类别名称映射
         conf_threshold: 置信度阈值
+        copy: 为False时直接在原图上绘制
     
     Returns:
         绘制了检测结果的图像
     """
-    import cv2
-    
-    annotated_image = image.copy()
-    
-    for box in boxes:
-        # 获取边界框坐标
-        x1, y1, x2, y2 = box.xyxy[0].tolist()
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-        
-        # 获取置信度和类别ID
-        conf = box.conf[0].item()
-        cls_id = int(box.cls[0].item())
-        
-        # 只显示指定置信度以上的结果
-        if conf < conf_threshold:
-            continue
-        
-        # 只显示我们定义的类别
-        if cls_id in category_names:
-            # 获取类别名称
-            cls_name = category_names[cls_id]
-            
-            # 绘制边界框
-            cv2.rectangle(annotated_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            # 绘制类别名称和置信度
-            label = f"{cls_name}: {conf:.2f}"
-            cv2.putText(annotated_image, label, (x1, y1 - 10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-    
-    return annotated_image
+    return get_renderer(category_names).draw(image, boxes, conf_threshold, copy)
 
 
 def calculate_fps(start_time):
@@ -153,3 +423,127 @@ def calculate_fps(start_time):
     fps = 1 / inference_time if inference_time > 0 else 0
     
     return fps, inference_time
+
+
+def load_category_names(source=None):
+    """
+    加载类别名称映射
+    
+    Args:
+        source: 数据集配置文件路径（如 object.yaml）；为None或'coco'时使用COCO 80类
+    
+    Returns:
+        类别ID到名称的字典
+    """
+    if not source or source == 'coco':
+        return COCO_CATEGORY_NAMES
+    
+    import yaml
+    
+    with open(source, 'r', encoding='utf-8') as f:
+        names = yaml.safe_load(f)['names']
+    # names 既可以是 {id: name} 字典，也可以是列表
+    if isinstance(names, list):
+        return dict(enumerate(names))
+    return {int(k): v for k, v in names.items()}
+
+
+def collect_image_paths(source):
+    """
+    收集批量检测的图片路径
+    
+    Args:
+        source: 图片目录、glob通配符（如 data/**/*.jpg）或每行一个路径的列表文件（.txt）
+    
+    Returns:
+        排序后的图片路径列表
+    """
+    import glob
+    import os
+    
+    if os.path.isdir(source):
+        # 目录：递归收集所有支持的图片
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+    
+    if os.path.isfile(source) and source.lower().endswith('.txt'):
+        # 列表文件：每行一个路径，忽略空行和#注释
+        with open(source, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f
+                    if line.strip() and not line.strip().startswith('#')]
+    
+    # glob通配符（单个文件路径也会原样匹配）
+    return sorted(p for p in glob.glob(source, recursive=True)
+                  if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def output_path_mapper(paths, output_dir):
+    """
+    生成标注图片输出路径的函数
+    
+    输出保留相对于所有输入公共目录的子目录结构，避免不同目录下的同名图片相互覆盖；
+    输入没有公共目录（Windows 上位于不同盘符）时改为按序号加前缀。
+    
+    Args:
+        paths: 全部输入图片路径
+        output_dir: 输出目录
+    
+    Returns:
+        函数 (序号, 图片路径) -> 输出路径
+    """
+    import os
+    
+    try:
+        input_root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else None
+    except ValueError:
+        input_root = None
+    
+    def output_path(index, path):
+        if input_root is not None:
+            return os.path.join(output_dir, os.path.relpath(os.path.abspath(path), input_root))
+        return os.path.join(output_dir, f"{index:06d}_{os.path.basename(path)}")
+    
+    return output_path
+
+
+class StartupTimer:
+    """
+    启动耗时记录
+    
+    以创建时刻（通常是程序入口模块导入时）为起点，记录首个窗口、模型就绪、首次检测等里程碑
+    """
+    
+    def __init__(self, start=None):
+        import time
+        
+        self.start = start if start is not None else time.perf_counter()
+        self.marks = {}
+    
+    def mark(self, name):
+        """
+        记录里程碑，同名里程碑只记录第一次
+        
+        Args:
+            name: 里程碑名称
+        
+        Returns:
+            距起点的秒数
+        """
+        import time
+        
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.start
+        return self.marks[name]
+    
+    def summary(self):
+        """
+        格式化已记录的里程碑
+        
+        Returns:
+            形如 "首个窗口 0.42s | 模型就绪 2.31s" 的字符串
+        """
+        return " | ".join(f"{name} {seconds:.2f}s" for name, seconds in self.marks.items())